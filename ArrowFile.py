@@ -0,0 +1,80 @@
+import logging
+import pandas as pd
+
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ArrowFile:
+    """
+    Parquet or Arrow IPC (Feather v2) file read with pyarrow, schema is read without reading the data.
+
+    Columns are read memory mapped and converted to pandas dataframe with Arrow-backed datatypes (pd.ArrowDtype),
+    so Arrow buffers are used by pandas without conversion to NumPy. Arrow IPC files are not copied at all,
+    pages of the mapped file are read by the comparison, Parquet pages are decoded once into Arrow buffers.
+
+    Parameters:
+    path: str
+        Path to the file, .parquet and .pq are read as Parquet, other files as Arrow IPC file or stream.
+    memory_map: bool
+        Maps the file into memory instead of reading it into buffers.
+    """
+
+    parquet_extensions = (".parquet", ".pq")
+
+    def __init__(self, path: str, memory_map: bool = True):
+        if not isinstance(path, str):
+            raise TypeError("path must be instance of string")
+        try:
+            import pyarrow
+        except ImportError as e:
+            logger.error(f"pyarrow is required for reading Parquet and Arrow files: {e}")
+            raise
+        self.path = path
+        self.memory_map = memory_map
+        self.parquet = path.endswith(self.parquet_extensions)
+        self.schema = self.read_schema()
+
+    def open(self):
+        """Opens Arrow IPC file (or stream), memory mapped when memory_map is set"""
+        import pyarrow as pa
+
+        source = pa.memory_map(self.path, "r") if self.memory_map else pa.OSFile(self.path, "rb")
+        try:
+            return pa.ipc.open_file(source)
+        except pa.ArrowInvalid:
+            source.seek(0)
+            return pa.ipc.open_stream(source)
+
+    def read_schema(self):
+        """Arrow schema of the file, from Parquet footer or Arrow IPC header"""
+        if self.parquet:
+            import pyarrow.parquet as pq
+
+            return pq.read_schema(self.path, memory_map=self.memory_map)
+        return self.open().schema
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.schema.names)
+
+    def empty(self) -> pd.DataFrame:
+        """Dataframe without rows with all columns of the file and their Arrow-backed datatypes"""
+        return self.schema.empty_table().to_pandas(types_mapper=pd.ArrowDtype, ignore_metadata=True)
+
+    def read(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Reads columns of the file (all by default) as dataframe with Arrow-backed datatypes"""
+        missing = [column for column in columns or [] if column not in self.schema.names]
+        if missing:
+            raise KeyError(f"Columns {missing} not found in {self.path}")
+        if self.parquet:
+            import pyarrow.parquet as pq
+
+            table = pq.read_table(self.path, columns=columns, memory_map=self.memory_map)
+        else:
+            table = self.open().read_all()
+            if columns is not None:
+                table = table.select(columns)
+        logger.info(f"Read {table.num_rows} rows and {table.num_columns} columns ({table.nbytes} bytes) from {self.path}")
+        return table.to_pandas(types_mapper=pd.ArrowDtype, ignore_metadata=True)
@@ -0,0 +1,270 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from typing import Callable, List, Optional
+
+from CompareTwoDatasets import CompareTwoDatasets
+from ComparisonProfiler import ComparisonProfiler
+from IncrementalCompareTwoDatasets import IncrementalCompareTwoDatasets
+from ParallelCompareTwoDatasets import ParallelCompareTwoDatasets
+from SampledCompareTwoDatasets import SampledCompareTwoDatasets
+from SparkEngine import pyspark_error
+from SqlCompareTwoDatasets import SqlCompareTwoDatasets, SqlTable
+from StreamingCompareTwoDatasets import StreamingCompareTwoDatasets
+from SyntheticDatasets import SyntheticDatasets
+
+logger = logging.getLogger(__name__)
+
+
+def reset_peak_rss() -> bool:
+    """Resets peak resident memory of the process (Linux only), returns False when it cannot be reset"""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss() -> float:
+    """Peak resident memory of the process in MB since the last reset_peak_rss"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def children_peak_rss() -> float:
+    """Largest peak resident memory in MB of finished worker processes"""
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+def compare_results(baseline: dict, results: dict, threshold: float = 1.2) -> List[dict]:
+    """Returns phases of results slower than threshold times the same phase of the baseline"""
+    if baseline.get("parameters") != results.get("parameters"):
+        logger.warning("Baseline was run with different parameters, timings are not comparable")
+    previous = {(record["scenario"], record["mode"], record["phase"]): record for record in baseline["results"]}
+    regressions = []
+    for record in results["results"]:
+        old = previous.get((record["scenario"], record["mode"], record["phase"]))
+        if old is None or "error" in old or "error" in record or old["seconds"] <= 0:
+            continue
+        ratio = record["seconds"] / old["seconds"]
+        if ratio > threshold:
+            regressions.append({**record, "baseline_seconds": old["seconds"], "ratio": round(ratio, 3)})
+    return regressions
+
+
+class Benchmark:
+    """
+    Benchmark of comparison modes on synthetic scenarios.
+
+    Every scenario of SyntheticDatasets is compared in every mode and wall time and peak resident memory
+    of every phase (setup, compare, report) are recorded, together with wall time of sub-steps measured by
+    ComparisonProfiler (e.g. compare/value_mismatches/merge). Peak memory is reset before every phase on Linux,
+    elsewhere it is the peak of the whole process. Worker processes of parallel mode are reported separately
+    as children_peak_rss_mb.
+
+    Parameters:
+    datasets: SyntheticDatasets
+        Generator of the scenarios
+    scenarios: list (optional)
+        Names of the scenarios, all scenarios by default.
+    modes: list (optional)
+        Names of the modes, all modes by default (spark mode only when pyspark is installed).
+    workers: int (optional)
+        Number of worker processes of parallel mode, number of CPUs by default.
+    partition_rows: int (optional)
+        Rows per partition of streaming mode, half of the rows of both dataframes by default.
+    blocks: int (optional)
+        Number of blocks of incremental mode, one block per 10000 rows (16 to 1024) by default.
+    """
+
+    modes = ("serial", "fingerprint", "quick_check", "parallel", "streaming", "incremental", "sampled", "sql", "spark")
+
+    def __init__(self, datasets: SyntheticDatasets, scenarios: Optional[List[str]] = None, modes: Optional[List[str]] = None, workers: Optional[int] = None, partition_rows: Optional[int] = None, blocks: Optional[int] = None):
+        for mode in modes or []:
+            if mode not in self.modes:
+                raise ValueError(f"Unknown mode {mode}, use one of {self.modes}")
+        self.datasets = datasets
+        self.scenarios = list(scenarios or datasets.scenarios)
+        self.selected_modes = list(modes or [mode for mode in self.modes if mode != "spark" or pyspark_error is None])
+        self.workers = workers
+        self.partition_rows = partition_rows or max(datasets.rows, 1)
+        self.blocks = blocks or min(1024, max(16, datasets.rows // 10000))
+        self.results = []
+
+    def measure(self, record: dict, phase: str, function: Callable, profiler: Optional[ComparisonProfiler] = None):
+        """Runs function and records its wall time and peak memory, and wall time of sub-steps measured by the profiler"""
+        reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            result = function()
+        except Exception as e:
+            self.results.append({**record, "phase": phase, "seconds": time.perf_counter() - start, "error": f"{type(e).__name__}: {e}"})
+            raise
+        seconds = time.perf_counter() - start
+        self.results.append({**record, "phase": phase, "seconds": seconds, "peak_rss_mb": round(peak_rss(), 1), "children_peak_rss_mb": round(children_peak_rss(), 1)})
+        logger.info(f"{record['scenario']} {record['mode']} {phase}: {seconds:.3f} s")
+        if profiler is not None:
+            steps = {}
+            for event in profiler.metrics["phases"]:
+                if event["depth"] > 0:
+                    step = phase + "/" + event["phase"].split("/", 1)[1]
+                    steps[step] = steps.get(step, 0) + event["seconds"]
+            self.results.extend({**record, "phase": step, "seconds": step_seconds} for step, step_seconds in steps.items())
+            profiler.metrics["phases"] = []
+        return result
+
+    def build(self, mode: str, legacy_df: pd.DataFrame, cloud_df: pd.DataFrame, keys: dict, directory: str, profiler: ComparisonProfiler) -> CompareTwoDatasets:
+        """Creates comparison of the mode, sql mode loads dataframes into SQLite database in the directory, spark mode into local Spark session"""
+        keys = {**keys, "profiler": profiler}
+        if mode == "serial":
+            return CompareTwoDatasets(legacy_df, cloud_df, **keys)
+        if mode == "fingerprint":
+            return CompareTwoDatasets(legacy_df, cloud_df, fingerprint=True, **keys)
+        if mode == "quick_check":
+            return CompareTwoDatasets(legacy_df, cloud_df, quick_check=True, **keys)
+        if mode == "parallel":
+            return ParallelCompareTwoDatasets(legacy_df, cloud_df, workers=self.workers, **keys)
+        if mode == "streaming":
+            chunksize = max(1, self.partition_rows // 4)
+            chunks = lambda dataframe: (dataframe.iloc[start:start + chunksize] for start in range(0, max(len(dataframe), 1), chunksize))
+            return StreamingCompareTwoDatasets(chunks(legacy_df), chunks(cloud_df), chunksize=chunksize, partition_rows=self.partition_rows, spill_dir=directory, **keys)
+        if mode == "incremental":
+            return IncrementalCompareTwoDatasets(legacy_df, cloud_df, store=os.path.join(directory, "digests.sqlite"), blocks=self.blocks, workers=self.workers or 1, **keys)
+        if mode == "sampled":
+            return SampledCompareTwoDatasets(legacy_df, cloud_df, **keys)
+        if mode == "spark":
+            from pyspark.sql import SparkSession
+            spark = SparkSession.builder.master("local[*]").appName("Benchmark").getOrCreate()
+            return CompareTwoDatasets(spark.createDataFrame(legacy_df), spark.createDataFrame(cloud_df), **keys)
+        path = os.path.join(directory, "tables.sqlite")
+        with sqlite3.connect(path) as connection:
+            legacy_df.to_sql("legacy", connection, index=False)
+            cloud_df.to_sql("cloud", connection, index=False)
+        connect = lambda: sqlite3.connect(path, check_same_thread=False)
+        return SqlCompareTwoDatasets(SqlTable(connect, "legacy"), SqlTable(connect, "cloud"), **keys)
+
+    def run_mode(self, scenario: str, mode: str, legacy_df: pd.DataFrame, cloud_df: pd.DataFrame, keys: dict):
+        record = {"scenario": scenario, "mode": mode, "legacy_rows": len(legacy_df), "cloud_rows": len(cloud_df), "columns": legacy_df.shape[1]}
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = ComparisonProfiler()
+            compare = self.measure(record, "setup", lambda: self.build(mode, legacy_df, cloud_df, keys, directory, profiler))
+            try:
+                self.measure(record, "compare", compare.compare, profiler)
+                if mode == "incremental":
+                    self.measure(record, "recompare", compare.compare, profiler)
+                self.measure(record, "report", compare.report, profiler)
+            finally:
+                if mode == "sql":
+                    compare.legacy_table.pool.close()
+                    compare.cloud_table.pool.close()
+
+    def run(self) -> List[dict]:
+        """Runs all scenarios in all modes, errors of single runs are recorded and do not stop the benchmark"""
+        for scenario in self.scenarios:
+            legacy_df, cloud_df, keys = self.measure({"scenario": scenario, "mode": "generate"}, "generate", lambda: self.datasets.scenario(scenario))
+            for mode in self.selected_modes:
+                try:
+                    self.run_mode(scenario, mode, legacy_df, cloud_df, keys)
+                except Exception as e:
+                    logger.error(f"Benchmark of {scenario} in {mode} mode failed: {e}")
+        return self.results
+
+    def environment(self) -> dict:
+        try:
+            commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            "commit": commit,
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "environment": self.environment(),
+            "parameters": {
+                "rows": self.datasets.rows,
+                "columns": self.datasets.columns,
+                "mismatch_rate": self.datasets.mismatch_rate,
+                "duplicate_rate": self.datasets.duplicate_rate,
+                "dtypes": self.datasets.dtypes,
+                "seed": self.datasets.seed,
+                "workers": self.workers,
+                "partition_rows": self.partition_rows,
+                "blocks": self.blocks,
+            },
+            "results": self.results,
+        }
+
+    def save(self, path: str):
+        """Writes environment, parameters and results into JSON file"""
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+def main(arguments: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark of CompareTwoDatasets on synthetic versions of the main.py scenarios")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument("--mismatch-rate", type=float, default=0.01)
+    parser.add_argument("--duplicate-rate", type=float, default=0.001)
+    parser.add_argument("--dtypes", default=",".join(SyntheticDatasets.supported_dtypes), help="comma separated datatypes of the columns")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", help="comma separated scenarios, all by default")
+    parser.add_argument("--modes", help="comma separated modes, all by default")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--partition-rows", type=int)
+    parser.add_argument("--blocks", type=int)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results of a previous run, slower phases are reported")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    parser.add_argument("--verbose", action="store_true")
+    options = parser.parse_args(arguments)
+    logging.basicConfig(level=logging.INFO if options.verbose else logging.WARNING, format='%(asctime)s-%(levelname)s-%(message)s')
+
+    datasets = SyntheticDatasets(options.rows, options.columns, options.mismatch_rate, options.duplicate_rate, options.dtypes.split(","), options.seed)
+    benchmark = Benchmark(
+        datasets,
+        options.scenarios.split(",") if options.scenarios else None,
+        options.modes.split(",") if options.modes else None,
+        options.workers,
+        options.partition_rows,
+        options.blocks
+    )
+    benchmark.run()
+    benchmark.save(options.output)
+    print(f"Results of {len(benchmark.results)} phases written to {options.output}")
+
+    if options.baseline:
+        with open(options.baseline) as file:
+            regressions = compare_results(json.load(file), benchmark.to_dict(), options.threshold)
+        for regression in regressions:
+            print(f"{regression['scenario']} {regression['mode']} {regression['phase']}: {regression['seconds']:.3f} s, baseline {regression['baseline_seconds']:.3f} s ({regression['ratio']}x)")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
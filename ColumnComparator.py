@@ -0,0 +1,289 @@
+import logging
+import numpy as np
+import pandas as pd
+
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ColumnComparator:
+    """
+    Rules of comparing legacy and cloud values of a compared column, applied as one vectorized kernel per column pair.
+
+    Kernel normalizes values of both sides to a common type and compares them as NumPy arrays of native datatypes,
+    it is derived from the datatypes of the pair and the rules once and cached by the comparator for every comparison with the same
+    (legacy datatype, cloud datatype, rules). Merged columns are read without copying the merged dataframe.
+    Datatypes of the pair come from the compared dataframes, so columns upcast by the outer merge
+    (integers and booleans with missing values) are normalized by their original datatype.
+
+    Common types of columns of different datatypes:
+    numbers and booleans are compared as numbers (True is 1), strings are parsed as numbers, booleans
+    (true_values and false_values, trimmed and case insensitive), timestamps (datetime_format, naive timestamps are UTC)
+    or durations to the type of the other side. Values which cannot be parsed never match. Other pairs are compared as Python objects.
+
+    Parameters:
+    null_equal: bool
+        Null values (None, NaN, NaT, pd.NA) match each other, otherwise null values never match.
+    rtol: float
+        Relative tolerance of numbers, values match when |legacy - cloud| <= atol + rtol * |cloud|.
+    atol: float
+        Absolute tolerance of numbers.
+    trim: bool
+        Strips leading and trailing whitespace of strings before comparing.
+    ignore_case: bool
+        Compares strings case insensitive.
+    coerce: bool
+        Converts strings to the datatype of the other side, when False strings never match values of other types.
+    datetime_format: str
+        Format of timestamps parsed from strings, passed to pd.to_datetime.
+    columns: dict (optional)
+        ColumnComparator of specific columns, e.g. {"score": ColumnComparator(atol=0.01)}, other columns use these rules.
+    """
+
+    true_values = ("true", "t", "yes", "y", "1")
+    false_values = ("false", "f", "no", "n", "0")
+
+    def __init__(self, null_equal: bool = True, rtol: float = 0.0, atol: float = 0.0, trim: bool = False, ignore_case: bool = False, coerce: bool = True, datetime_format: str = "ISO8601", columns: Optional[Dict[str, "ColumnComparator"]] = None):
+        if rtol < 0 or atol < 0:
+            raise ValueError("rtol and atol must not be negative")
+        columns = {} if columns is None else dict(columns)
+        for column, comparator in columns.items():
+            if not isinstance(comparator, ColumnComparator):
+                raise TypeError(f"Comparator of column {column} must be instance of ColumnComparator")
+        self.null_equal = null_equal
+        self.rtol = rtol
+        self.atol = atol
+        self.trim = trim
+        self.ignore_case = ignore_case
+        self.coerce = coerce
+        self.datetime_format = datetime_format
+        self.columns = columns
+        self.boolean_values = {
+            **{variant: True for value in self.true_values for variant in (value, value.upper(), value.title())},
+            **{variant: False for value in self.false_values for variant in (value, value.upper(), value.title())},
+            True: True,
+            False: False,
+        }
+        # kernels built by this comparator, kept as long as the comparator
+        self.kernels: Dict[tuple, Callable] = {}
+
+    def __getstate__(self) -> dict:
+        """Kernels are closures, which are not pickled (e.g. to worker processes) and are built again"""
+        return {**self.__dict__, "kernels": {}}
+
+    @property
+    def rules(self) -> tuple:
+        """Rules of the comparator (without rules of specific columns), part of the key of cached kernels"""
+        return (self.null_equal, self.rtol, self.atol, self.trim, self.ignore_case, self.coerce, self.datetime_format)
+
+    def describe(self) -> dict:
+        """Rules of the comparator and of specific columns as JSON serializable dictionary"""
+        return {
+            "rules": list(self.rules),
+            "columns": {column: comparator.describe() for column, comparator in sorted(self.columns.items())},
+        }
+
+    def for_column(self, column: str) -> "ColumnComparator":
+        """Returns comparator of the column"""
+        return self.columns.get(column, self)
+
+    @staticmethod
+    def kind(dtype) -> str:
+        """Kind of values of the datatype: bool, numeric, datetime, timedelta, string (object and string datatypes) or other"""
+        if isinstance(dtype, pd.CategoricalDtype):
+            return ColumnComparator.kind(dtype.categories.dtype)
+        if pd.api.types.is_bool_dtype(dtype):
+            return "bool"
+        if pd.api.types.is_numeric_dtype(dtype):
+            return "numeric"
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            return "datetime"
+        if pd.api.types.is_timedelta64_dtype(dtype) or (isinstance(dtype, pd.ArrowDtype) and dtype.kind == "m"):
+            return "timedelta"
+        if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+            return "string"
+        return "other"
+
+    def common_kind(self, legacy_kind: str, cloud_kind: str) -> str:
+        """Kind both sides are normalized to, other when values of the pair are compared as Python objects"""
+        if legacy_kind == cloud_kind:
+            return legacy_kind
+        kinds = {legacy_kind, cloud_kind}
+        if kinds == {"numeric", "bool"}:
+            return "numeric"
+        if self.coerce and "string" in kinds:
+            kind = (kinds - {"string"}).pop()
+            if kind in ("numeric", "bool", "datetime", "timedelta"):
+                return kind
+        return "other"
+
+    def mismatches(self, column: str, legacy: pd.Series, cloud: pd.Series, legacy_dtype, cloud_dtype) -> np.ndarray:
+        """Returns mismatch flag of every pair of legacy and cloud values of the column"""
+        return self.for_column(column).kernel(legacy_dtype, cloud_dtype)(legacy, cloud)
+
+    def kernel(self, legacy_dtype, cloud_dtype) -> Callable:
+        """Returns cached kernel comparing values of the datatypes under the rules"""
+        key = (legacy_dtype, cloud_dtype, self.rules)
+        kernel = self.kernels.get(key)
+        if kernel is None:
+            kernel = self.kernels[key] = self.build_kernel(legacy_dtype, cloud_dtype)
+        return kernel
+
+    def build_kernel(self, legacy_dtype, cloud_dtype) -> Callable:
+        """Derives kernel normalizing both sides to their common kind and comparing them with null semantics of the rules"""
+        kind = self.common_kind(self.kind(legacy_dtype), self.kind(cloud_dtype))
+        normalize = {
+            "numeric": self.numbers,
+            "bool": self.booleans,
+            "datetime": self.timestamps,
+            "timedelta": self.durations,
+            "string": self.strings,
+        }.get(kind, self.objects)
+        close = kind == "numeric" and (self.rtol > 0 or self.atol > 0)
+        objects = kind in ("string", "other")
+        rtol, atol, null_equal = self.rtol, self.atol, self.null_equal
+        logger.debug(f"Comparing {legacy_dtype} with {cloud_dtype} as {kind}")
+
+        def kernel(legacy: pd.Series, cloud: pd.Series) -> np.ndarray:
+            legacy_values, legacy_nulls, legacy_invalid = normalize(legacy)
+            cloud_values, cloud_nulls, cloud_invalid = normalize(cloud)
+            if close:
+                mismatch = ~np.isclose(legacy_values, cloud_values, rtol=rtol, atol=atol)
+            else:
+                if objects and isinstance(legacy_values, np.ndarray) != isinstance(cloud_values, np.ndarray):
+                    legacy_values, cloud_values = self.object_array(legacy_values), self.object_array(cloud_values)
+                mismatch = self.different(legacy_values, cloud_values)
+            if objects:
+                # None matches None as Python object, other null values are looked for only among mismatched values
+                if null_equal:
+                    rows = np.flatnonzero(mismatch)
+                    mismatch[rows] = ~(pd.isna(legacy_values[rows]) & pd.isna(cloud_values[rows]))
+                else:
+                    mismatch |= pd.isna(legacy_values) | pd.isna(cloud_values)
+            if legacy_nulls is not None or cloud_nulls is not None:
+                legacy_nulls = np.zeros(len(mismatch), dtype=bool) if legacy_nulls is None else legacy_nulls
+                cloud_nulls = np.zeros(len(mismatch), dtype=bool) if cloud_nulls is None else cloud_nulls
+                nulls = legacy_nulls | cloud_nulls
+                if null_equal:
+                    mismatch = np.where(nulls, legacy_nulls != cloud_nulls, mismatch)
+                else:
+                    mismatch |= nulls
+            for invalid in (legacy_invalid, cloud_invalid):
+                if invalid is not None:
+                    mismatch |= invalid
+            return mismatch
+
+        return kernel
+
+    @staticmethod
+    def decategorize(values: pd.Series) -> pd.Series:
+        """Replaces codes of categorical values by the categories"""
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return pd.Series(values.to_numpy(), index=values.index)
+        return values
+
+    def numbers(self, values: pd.Series):
+        """Numbers of the values with null and invalid flags, booleans are 0 and 1 and strings are parsed"""
+        values = self.decategorize(values)
+        dtype = values.dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in "iub":
+            return values.to_numpy(), None, None
+        if isinstance(dtype, np.dtype) and dtype.kind == "f":
+            array = values.to_numpy()
+            return array, np.isnan(array), None
+        nulls = values.isna().to_numpy()
+        if pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+            return values.to_numpy(dtype=dtype.numpy_dtype, na_value=0), nulls, None
+        array = values.to_numpy(dtype=object)
+        if nulls.any():
+            array = array.copy()
+            array[nulls] = np.nan
+        try:
+            parsed = array.astype(np.float64)
+        except (TypeError, ValueError):
+            parsed = None
+        # integers above 2 ** 53 are not exact as floats, they are parsed by pandas
+        if parsed is None or (np.abs(parsed) >= 2 ** 53).any():
+            parsed = pd.to_numeric(values, errors="coerce")
+            if isinstance(parsed.dtype, np.dtype) and parsed.dtype.kind in "iu":
+                return parsed.to_numpy(), nulls, None
+            parsed = parsed.to_numpy(dtype=np.float64, na_value=np.nan)
+        return parsed, nulls, np.isnan(parsed) & ~nulls
+
+    def booleans(self, values: pd.Series):
+        """Booleans of the values with null and invalid flags, strings are parsed from true_values and false_values"""
+        values = self.decategorize(values)
+        dtype = values.dtype
+        if isinstance(dtype, np.dtype) and dtype.kind == "b":
+            return values.to_numpy(), None, None
+        if pd.api.types.is_bool_dtype(dtype):
+            return values.to_numpy(dtype=bool, na_value=False), values.isna().to_numpy(), None
+        # distinct values are parsed once, null values get code -1
+        codes, uniques = pd.factorize(values)
+        parsed = pd.Series(uniques, dtype=object).map(self.boolean_values)
+        unknown = parsed.isna().to_numpy()
+        if unknown.any():
+            parsed[unknown] = pd.Series(uniques[unknown], dtype=object).astype(str).str.strip().str.lower().map(self.boolean_values).to_numpy()
+        known = parsed.notna().to_numpy()
+        nulls = codes < 0
+        return parsed.to_numpy(dtype=bool, na_value=False)[codes], nulls, ~known[codes] & ~nulls
+
+    def timestamps(self, values: pd.Series):
+        """Nanoseconds since epoch in UTC with null and invalid flags, strings are parsed with datetime_format"""
+        values = self.decategorize(values)
+        invalid = None
+        if not pd.api.types.is_datetime64_any_dtype(values.dtype):
+            nulls = values.isna().to_numpy()
+            values = pd.to_datetime(values, errors="coerce", format=self.datetime_format, utc=True)
+            invalid = values.isna().to_numpy() & ~nulls
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+        array = values.to_numpy(dtype="datetime64[ns]")
+        return array.view(np.int64), np.isnat(array), invalid
+
+    def durations(self, values: pd.Series):
+        """Nanoseconds of the durations with null and invalid flags, strings are parsed"""
+        values = self.decategorize(values)
+        invalid = None
+        if self.kind(values.dtype) != "timedelta":
+            nulls = values.isna().to_numpy()
+            values = pd.to_timedelta(values, errors="coerce")
+            invalid = values.isna().to_numpy() & ~nulls
+        array = values.to_numpy(dtype="timedelta64[ns]")
+        return array.view(np.int64), np.isnat(array), invalid
+
+    def strings(self, values: pd.Series):
+        """
+        Strings trimmed and case folded by the rules, other objects in the column are kept.
+
+        Strings of string datatypes (Arrow or pandas) stay in their array and are compared natively.
+        """
+        values = self.decategorize(values)
+        if self.trim or self.ignore_case:
+            text = values.str.strip() if self.trim else values
+            text = text.str.casefold() if self.ignore_case else text
+            values = text.where(text.notna(), values)
+        if pd.api.types.is_string_dtype(values.dtype) and not pd.api.types.is_object_dtype(values.dtype):
+            return values.array, None, None
+        return self.objects(values)
+
+    @staticmethod
+    def object_array(values) -> np.ndarray:
+        """NumPy array of Python objects of NumPy or extension array, null values of extension arrays are None"""
+        if isinstance(values, np.ndarray):
+            return values.astype(object, copy=False)
+        return values.to_numpy(dtype=object, na_value=None)
+
+    @staticmethod
+    def different(legacy_values, cloud_values) -> np.ndarray:
+        """Elementwise !=, comparisons of extension arrays with missing result are mismatches"""
+        mismatch = legacy_values != cloud_values
+        if isinstance(mismatch, pd.api.extensions.ExtensionArray):
+            return mismatch.to_numpy(dtype=bool, na_value=True)
+        return np.asarray(mismatch, dtype=bool)
+
+    def objects(self, values: pd.Series):
+        """Values as NumPy array of Python objects, null values of extension datatypes are None, nulls are flagged by the kernel"""
+        values = self.decategorize(values)
+        return self.object_array(values.to_numpy() if isinstance(values.dtype, np.dtype) else values.array), None, None
@@ -1,49 +1,224 @@
 import logging
+import os
+import numpy as np
 import pandas as pd
 
-from typing import List, Union, Optional
+from contextlib import nullcontext
+from typing import Dict, List, Union, Optional
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s-%(levelname)s-%(message)s')
+from ArrowFile import ArrowFile
+from ColumnComparator import ColumnComparator
+from ComparisonEngine import ComparisonEngine
+from ComparisonProfiler import ComparisonProfiler
+from MismatchMatrix import MismatchMatrix
+from PandasEngine import PandasEngine
+from SparkEngine import SparkEngine
+
+logger = logging.getLogger(__name__)
 
 class CompareTwoDatasets:
     """
     Tool that compare two datasets, created for migration purposes from legacy systems to cloud environments.
 
     Parameters:
-    legacy_df: pd.DataFrame
+    legacy_df: pd.DataFrame or pyspark.sql.DataFrame
         Dataframe from legacy system
-    cloud_df: pd.DataFrame
+    cloud_df: pd.DataFrame or pyspark.sql.DataFrame
         Dataframe from cloud system
-    legacy_key: str (optional)
-        Column or list of columns for joining dataframes on.
-    cloud_key: str (optional)
-        Column or list of columns for joining dataframes on.
+    legacy_key: str or list (optional)
+        Column or list of columns of composite key for joining dataframes on.
+    cloud_key: str or list (optional)
+        Column or list of columns of composite key for joining dataframes on, in the same order as legacy_key.
     join_columns: list or str (optional)
-        Column or list of columns for joining dataframes on.
+        Column for joining dataframes on, or list of legacy key and cloud key (each a column or list of columns).
+    fingerprint: bool (optional)
+        Compares 64-bit hashes of rows first and runs full column comparison only for rows with different hashes.
+    duplicate_keys: str (optional)
+        Handling of keys repeated within a dataframe, checked before merging:
+        "keep" joins every pair of rows with the same key, "deduplicate" keeps first row of every key,
+        "occurrence" joins n-th row of the key in legacy with n-th row of the key in cloud, "fail" raises ValueError.
+    max_merged_rows: int (optional)
+        Raises ValueError before merging when the merged dataframe would have more rows.
+    quick_check: bool (optional)
+        Profiles compared columns of both dataframes before merging (nulls, min, max, sum, mean, distinct values
+        and checksum of key and value pairs) and compares values only of columns which profiles do not prove equal.
+        When all columns are equal nothing is merged. Partitioned comparison modes do not run the quick check.
+    profiler: ComparisonProfiler (optional)
+        Records time, memory and row counts of every phase of compare() and report(), see metrics.
+    engine: str or ComparisonEngine (optional)
+        "pandas", "spark" or engine instance executing the comparison, chosen by type of legacy_df by default.
+        Spark engine keeps data distributed, only counts and report samples are collected to the driver.
+    comparator: ColumnComparator (optional)
+        Rules of comparing values (null values, tolerance of numbers, trimming and case of strings, conversion
+        of columns of different datatypes), null values match and other values are compared exactly by default.
 
     Either (legacy_key, cloud_key) or join_columns parameters required.
+    Composite keys are jointly encoded into one integer code in _key column added to legacy_df and cloud_df,
+    key columns are compared by datatype pair by pair and merged data holds the key columns instead of the code.
+    Report shows random samples of up to sample_size rows, all differences can be written with write_differences.
 
     TODO:
     -add parameters for names for legacy and cloud datasets for better end user readability
     """
 
-    def __init__(self, legacy_df: pd.DataFrame, cloud_df: pd.DataFrame, legacy_key: Optional[str] = None, cloud_key: Optional[str] = None, join_columns: Optional[Union[list, str]] = None):
+    sample_size = 20
+    sample_seed = 0
+    duplicate_key_strategies = ("keep", "deduplicate", "occurrence", "fail")
+    profile_statistics = ("dtype", "nulls", "min", "max", "sum", "mean", "distinct", "checksum")
+    engines = {"pandas": PandasEngine, "spark": SparkEngine}
+
+    def __init__(self, legacy_df: pd.DataFrame, cloud_df: pd.DataFrame, legacy_key: Optional[Union[str, list]] = None, cloud_key: Optional[Union[str, list]] = None, join_columns: Optional[Union[list, str]] = None, fingerprint: bool = False, duplicate_keys: str = "keep", max_merged_rows: Optional[int] = None, quick_check: bool = False, profiler: Optional[ComparisonProfiler] = None, engine: Optional[Union[str, ComparisonEngine]] = None, comparator: Optional[ColumnComparator] = None):
+        self.set_join_columns(legacy_key, cloud_key, join_columns)
+        if duplicate_keys not in self.duplicate_key_strategies:
+            raise ValueError(f"duplicate_keys must be one of {self.duplicate_key_strategies}")
+        if comparator is not None and not isinstance(comparator, ColumnComparator):
+            raise TypeError("comparator must be instance of ColumnComparator")
+        self.legacy_df = legacy_df
+        self.cloud_df = cloud_df
+        self.fingerprint = fingerprint
+        self.duplicate_keys = duplicate_keys
+        self.max_merged_rows = max_merged_rows
+        self.quick_check = quick_check
+        self.skipped_columns = set()
+        self.equal_columns, self.suspicious_columns = [], {}
+        self.mismatched_key_types = {}
+        self.comparator = ColumnComparator() if comparator is None else comparator
+        self.legacy_schema, self.cloud_schema = None, None
+        self.profiler = profiler
+        self.engine = self.select_engine(engine, legacy_df)
+
+    @classmethod
+    def from_files(cls, legacy_path: str, cloud_path: str, legacy_key: Optional[Union[str, list]] = None, cloud_key: Optional[Union[str, list]] = None, join_columns: Optional[Union[list, str]] = None, columns: Optional[List[str]] = None, memory_map: bool = True, **options):
+        """
+        Creates comparison of two Parquet or Arrow IPC files, reading only the keys and columns present in both files.
+
+        Schemas of both files are read first, then the key columns and the common columns (only those in columns, when given)
+        are read memory mapped into dataframes with Arrow-backed datatypes, without conversion to NumPy.
+        Schema differences are reported from whole schemas of the files. Requires pyarrow.
+
+        Parameters:
+        legacy_path, cloud_path: str
+            Paths to the files, .parquet and .pq files are read as Parquet, other files as Arrow IPC.
+        columns: list (optional)
+            Compared columns, all common columns by default.
+        memory_map: bool
+            Maps the files into memory instead of reading them into buffers.
+        options:
+            Other parameters of the comparison, e.g. comparator or profiler.
+        """
+        legacy_file, cloud_file = ArrowFile(legacy_path, memory_map), ArrowFile(cloud_path, memory_map)
+        compare = cls(legacy_file.empty(), cloud_file.empty(), legacy_key, cloud_key, join_columns, **options)
+        compare.legacy_schema, compare.cloud_schema = compare.legacy_df, compare.cloud_df
+        cloud_columns = set(cloud_file.columns)
+        common = [column for column in legacy_file.columns if column in cloud_columns and (columns is None or column in columns)]
+        with compare.phase("read_files"):
+            compare.legacy_df = legacy_file.read(list(dict.fromkeys(compare.legacy_keys + common)))
+            compare.cloud_df = cloud_file.read(list(dict.fromkeys(compare.cloud_keys + common)))
+            compare.record_counts(legacy_rows=len(compare.legacy_df), cloud_rows=len(compare.cloud_df), columns=len(common))
+        return compare
+
+    def select_engine(self, engine: Optional[Union[str, ComparisonEngine]], legacy_df) -> ComparisonEngine:
+        """Returns engine instance, Spark engine for Spark dataframes and pandas engine otherwise by default"""
+        if engine is None:
+            engine = "spark" if SparkEngine.is_spark_dataframe(legacy_df) else "pandas"
+        if isinstance(engine, ComparisonEngine):
+            return engine
+        if engine not in self.engines:
+            raise ValueError(f"engine must be one of {tuple(self.engines)} or ComparisonEngine instance")
+        return self.engines[engine]()
+
+    def partition_options(self) -> dict:
+        """Returns parameters for comparing partitions of the datasets with CompareTwoDatasets"""
+        return {
+            "join_columns": self.join_columns,
+            "fingerprint": self.fingerprint,
+            "duplicate_keys": self.duplicate_keys,
+            "max_merged_rows": self.max_merged_rows,
+            "comparator": self.comparator,
+        }
+
+    def schema_frames(self):
+        """Returns dataframes with all columns of the datasets, schemas of the files when only some columns were read"""
+        return (
+            self.legacy_df if self.legacy_schema is None else self.legacy_schema,
+            self.cloud_df if self.cloud_schema is None else self.cloud_schema
+        )
+
+    def phase(self, name: str):
+        """Context manager measuring a phase with the attached profiler, does nothing without profiler"""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.phase(name)
+
+    def record_counts(self, **counts):
+        """
+        Adds row or column counts to the current phase of the attached profiler.
+
+        Counts of Spark dataframes run jobs, callers compute them only when profiler is attached.
+        """
+        if self.profiler is not None:
+            self.profiler.record(**counts)
+
+    @property
+    def metrics(self) -> dict:
+        """Metrics of measured phases, empty without attached profiler"""
+        return {} if self.profiler is None else self.profiler.metrics
+
+    def set_join_columns(self, legacy_key: Optional[Union[str, list]] = None, cloud_key: Optional[Union[str, list]] = None, join_columns: Optional[Union[list, str]] = None):
+        """Validating and setting columns for joining dataframes on, lists of columns give composite keys"""
         if legacy_key is not None and cloud_key is not None:
-            if not isinstance(legacy_key, str) or not isinstance(cloud_key, str):
-                raise TypeError("Legacy_key and cloud_key must be instance of string")
             self.legacy_key = legacy_key
             self.cloud_key = cloud_key
             self.join_columns = [legacy_key, cloud_key]
         elif join_columns is not None:
-            logging.info(isinstance(join_columns, list))
+            logger.info(isinstance(join_columns, list))
             if isinstance(join_columns, str) or isinstance(join_columns, list):
                 self.join_columns = join_columns
             else:
                 raise TypeError("join_columns must be instance of string or list")
         else:
             raise TypeError("Must provide either (Legacy_key: str, cloud_key: str) or join_columns: list or str")
-        self.legacy_df = legacy_df
-        self.cloud_df = cloud_df
+
+        if isinstance(self.join_columns, list) and len(self.join_columns) != 2:
+            raise ValueError("join_columns list must hold the legacy key and the cloud key")
+        keys = [self.join_columns, self.join_columns] if isinstance(self.join_columns, str) else self.join_columns
+        self.legacy_keys, self.cloud_keys = [[key] if isinstance(key, str) else key for key in keys]
+        for key in (self.legacy_keys, self.cloud_keys):
+            if not isinstance(key, list) or not key or not all(isinstance(column, str) for column in key):
+                raise TypeError("Legacy_key and cloud_key must be instance of string or non-empty list of strings")
+        if len(self.legacy_keys) != len(self.cloud_keys):
+            raise ValueError("Legacy_key and cloud_key must have the same number of columns")
+
+    @property
+    def composite_key(self) -> bool:
+        """Dataframes are joined on more than one column"""
+        return len(self.legacy_keys) > 1
+
+    def key_columns(self):
+        """Returns names of the key columns in legacy and cloud dataframes, _key column with the code of composite keys"""
+        if self.composite_key:
+            return "_key", "_key"
+        return self.legacy_keys[0], self.cloud_keys[0]
+
+    def encode_keys(self):
+        """
+        Adds _key column with joint integer code of composite key to both dataframes, so keys are profiled,
+        deduplicated and merged on one integer column. Dataframes which already have the code (partitions
+        of encoded dataframes) are kept, so codes stay the same across partitions.
+        """
+        if not self.composite_key or ("_key" in self.legacy_df.columns and "_key" in self.cloud_df.columns):
+            return
+        with self.phase("encode_keys"):
+            self.legacy_df, self.cloud_df = self.engine.encode_keys(self.legacy_df, self.cloud_df, self.legacy_keys, self.cloud_keys)
+            if self.profiler is not None:
+                self.record_counts(legacy_rows=self.engine.count(self.legacy_df), cloud_rows=self.engine.count(self.cloud_df))
+
+    def decode_keys(self, merged_dataframe):
+        """Replaces _key column of the merged dataframe with the key columns, codes are kept in merged_key_codes"""
+        if self.engine.local:
+            self.merged_key_codes = merged_dataframe["_key"]
+        shared = [legacy_key for legacy_key, cloud_key in zip(self.legacy_keys, self.cloud_keys) if legacy_key == cloud_key]
+        return self.engine.decode_keys(merged_dataframe, shared, self.engine.dtypes(self.legacy_df))
 
     def compare(self):
         """
@@ -56,16 +231,24 @@ class CompareTwoDatasets:
         
         between two dataframes.
         """
-        logging.info("Validating dataframes...")
-        self.check_dataframe(self.legacy_df)
-        self.check_dataframe(self.cloud_df)
-
-        logging.info("Checking schemas...")
-        self.schema_difference()
-        logging.info("Checking row counts...")
-        self.row_count_difference()
-        logging.info("Checking value mismatches...")
-        self.value_mismatches()
+        with self.phase("compare"):
+            logger.info("Validating dataframes...")
+            with self.phase("validate"):
+                self.check_dataframe(self.legacy_df)
+                self.check_dataframe(self.cloud_df)
+
+            logger.info("Checking schemas...")
+            with self.phase("schema_difference"):
+                self.schema_difference()
+                legacy_schema, cloud_schema = self.schema_frames()
+                self.record_counts(legacy_columns=len(legacy_schema.columns), cloud_columns=len(cloud_schema.columns))
+            logger.info("Checking row counts...")
+            with self.phase("row_count_difference"):
+                self.row_count_difference()
+                self.record_counts(legacy_rows=self.row_count_legacy, cloud_rows=self.row_count_cloud)
+            logger.info("Checking value mismatches...")
+            with self.phase("value_mismatches"):
+                self.value_mismatches()
 
     def schema_difference(self):
         """
@@ -76,12 +259,16 @@ class CompareTwoDatasets:
         TODO:
         -check for None and NaN values
         """
-        self.common_columns = set(self.legacy_df.columns) & set(self.cloud_df.columns)
-        self.missing_from_legacy = set(self.cloud_df.columns) - set(self.legacy_df.columns)
-        self.missing_from_cloud = set(self.legacy_df.columns) - set(self.cloud_df.columns)
+        encoded = {"_key"} if self.composite_key else set()
+        legacy_schema, cloud_schema = self.schema_frames()
+        legacy_columns = set(legacy_schema.columns) - encoded
+        cloud_columns = set(cloud_schema.columns) - encoded
+        self.common_columns = legacy_columns & cloud_columns
+        self.missing_from_legacy = cloud_columns - legacy_columns
+        self.missing_from_cloud = legacy_columns - cloud_columns
 
-        legacy_datatypes = self.legacy_df.dtypes
-        cloud_datatypes = self.cloud_df.dtypes
+        legacy_datatypes = self.engine.dtypes(legacy_schema)
+        cloud_datatypes = self.engine.dtypes(cloud_schema)
 
         self.mismatched_types = {}
         self.mismatched_counter = 0
@@ -94,8 +281,8 @@ class CompareTwoDatasets:
 
     def row_count_difference(self):
         """Checking row counts and row counts difference between two datasets"""
-        self.row_count_legacy = len(self.legacy_df.index)
-        self.row_count_cloud = len(self.cloud_df.index)
+        self.row_count_legacy = self.engine.count(self.legacy_df)
+        self.row_count_cloud = self.engine.count(self.cloud_df)
 
         self.row_count_difference_legacy = self.row_count_legacy - self.row_count_cloud
         self.row_count_difference_cloud = self.row_count_cloud - self.row_count_legacy
@@ -104,97 +291,362 @@ class CompareTwoDatasets:
         """
         Checking mismatches and differences between in the values in dataframes.
 
-        TODO:
-        -checking date formats
+        Values are compared by kernels of the comparator, chosen by datatypes of the compared dataframes.
         """
-        if isinstance(self.join_columns, str):
-            self.matched_id_datatypes = self.legacy_df[self.join_columns].dtype == self.cloud_df[self.join_columns].dtype
-        elif isinstance(self.join_columns, list):
-            self.matched_id_datatypes = self.legacy_df[self.join_columns[0]].dtype == self.cloud_df[self.join_columns[1]].dtype
+        self.duplicated_dataframe = None
+        self.duplicates_detected_in = None
+        self.matched_id_datatypes = self.matched_key_datatypes()
+        self.skipped_columns = set()
         if self.matched_id_datatypes:
-            if isinstance(self.join_columns, str):
-                try:
-                    self.merged_dataframe = self.legacy_df.merge(
-                        self.cloud_df,
-                        how="outer",
-                        on=self.join_columns,
-                        suffixes=("_legacy", "_cloud"),
-                        indicator=True
-                    )
-                except KeyError as e:
-                    logging.error(f"Column {self.join_columns} not found in one or both dataframes: {e}")
-                    raise
-                except ValueError as e:
-                    logging.error(f"Invalid values during merge {e}")
-                    raise
-            elif isinstance(self.join_columns, list):
+            self.encode_keys()
+            legacy_key, cloud_key = self.key_columns()
+            legacy_df, cloud_df = self.legacy_df, self.cloud_df
+            if self.quick_check:
+                with self.phase("quick_check"):
+                    legacy_df, cloud_df = self.quick_check_columns(legacy_key, cloud_key)
+                    self.record_counts(columns=len(self.equal_columns) + len(self.suspicious_columns), equal_columns=len(self.equal_columns))
+            with self.phase("profile_keys"):
+                self.profile_keys(self.engine.key_counts(legacy_df, legacy_key), self.engine.key_counts(cloud_df, cloud_key))
+                legacy_df, cloud_df = self.handle_duplicate_keys(legacy_df, legacy_key), self.handle_duplicate_keys(cloud_df, cloud_key)
+                self.record_counts(rows=self.estimated_merged_rows)
+            left_on, right_on = self.merge_columns()
+            positions = None
+            if self.fingerprint and self.engine.local:
+                with self.phase("fingerprint"):
+                    candidates = self.fingerprint_candidates(legacy_df, cloud_df)
+                    if candidates is not None:
+                        legacy_df, cloud_df, positions = candidates
+                    self.record_counts(legacy_rows=len(legacy_df), cloud_rows=len(cloud_df))
+            with self.phase("merge"):
+                self.merged_dataframe = self.engine.outer_join(legacy_df, cloud_df, self.join_columns, left_on, right_on)
+                if self.duplicate_keys == "occurrence":
+                    self.merged_dataframe = self.engine.drop_columns(self.merged_dataframe, ["_occurrence"])
+                if positions is None:
+                    self.merged_rows = self.engine.count(self.merged_dataframe)
+                else:
+                    self.merged_rows, self.merged_dataframe.index = positions
+                if self.composite_key:
+                    self.merged_dataframe = self.decode_keys(self.merged_dataframe)
+                if self.profiler is not None:
+                    self.record_counts(rows=self.engine.count(self.merged_dataframe))
+
+            with self.phase("split"):
                 try:
-                    self.merged_dataframe = self.legacy_df.copy().merge(
-                        self.cloud_df.copy(),
-                        how="outer",
-                        left_on=self.join_columns[0],
-                        right_on=self.join_columns[1],
-                        suffixes=("_legacy", "_cloud"),
-                        indicator=True
-                    )
-                except KeyError as e:
-                    logging.error(f"Either column {self.join_columns[0]} or {self.join_columns[1]} not found: {e}")
-                    raise
-                except ValueError as e:
-                    logging.error(f"Invalid values during merge {e}")
+                    self.legacy_unique, self.cloud_unique, self.merged_dataframe_common = self.engine.split(self.merged_dataframe)
+                    self.duplicates = self.engine.duplicated(self.merged_dataframe_common)
+                    self.duplicated_count = self.engine.duplicated_count(self.duplicates)
+                except AttributeError as e:
+                    logger.error(f"An exception occur during processing merged dataframe: \n{e}")
                     raise
+                if self.profiler is not None:
+                    self.record_counts(rows=self.engine.count(self.merged_dataframe_common), legacy_unique=self.engine.count(self.legacy_unique), cloud_unique=self.engine.count(self.cloud_unique))
+
+            compared_columns = self.compared_columns()
+            with self.phase("compare_columns"):
+                self.mismatch_matrix = self.engine.column_mismatches(
+                    self.merged_dataframe_common, compared_columns, self.comparator, self.engine.dtypes(self.legacy_df), self.engine.dtypes(self.cloud_df)
+                )
+                if self.profiler is not None:
+                    self.record_counts(rows=self.engine.count(self.merged_dataframe_common), columns=len(compared_columns))
+            self.mismatches_exists = bool(compared_columns)
+            if self.mismatches_exists:
+                with self.phase("materialize"):
+                    self.mismatch_counts = self.engine.mismatch_counts(self.mismatch_matrix)
+                    self.mismatched_values = self.mismatch_counts.sum()
+                    self.mismatched_dataframe = self.engine.mismatched_rows(self.merged_dataframe_common, self.mismatch_matrix)
+                    if self.profiler is not None:
+                        self.record_counts(rows=self.engine.count(self.mismatched_dataframe))
+        else:
+            logger.warning("Id columns are not the same datatypes!")
 
+    def profile_keys(self, legacy_counts: pd.Series, cloud_counts: pd.Series) -> pd.Series:
+        """
+        Profiling keys before merging, from row counts of every key in both dataframes.
+
+        Finds duplicated keys and computes size of the merged dataframe under the duplicate_keys strategy,
+        so that merge explosion on repeated keys is detected before merging.
+        Returns position of the first merged row of every key.
+        """
+        self.legacy_duplicate_keys = self.engine.duplicate_keys(legacy_counts)
+        self.cloud_duplicate_keys = self.engine.duplicate_keys(cloud_counts)
+        rows = self.engine.merged_key_rows(legacy_counts, cloud_counts, self.duplicate_keys)
+        self.estimated_merged_rows = self.engine.total_rows(rows)
+        logger.info(f"Duplicated keys: {len(self.legacy_duplicate_keys)} in legacy, {len(self.cloud_duplicate_keys)} in cloud, merged rows: {self.estimated_merged_rows}")
+        if self.duplicate_keys == "fail" and not (self.legacy_duplicate_keys.empty and self.cloud_duplicate_keys.empty):
+            logger.error(f"Duplicated keys found: {len(self.legacy_duplicate_keys)} in legacy, {len(self.cloud_duplicate_keys)} in cloud")
+            raise ValueError("Duplicated keys found, merge not performed")
+        if self.max_merged_rows is not None and self.estimated_merged_rows > self.max_merged_rows:
+            logger.error(f"Merged dataframe would have {self.estimated_merged_rows} rows, limit is {self.max_merged_rows}")
+            raise ValueError("Merged dataframe exceeds max_merged_rows, merge not performed")
+        return self.engine.first_positions(rows)
+
+    def quick_check_columns(self, legacy_key: str, cloud_key: str):
+        """
+        Profiles compared columns of both dataframes and selects columns which need value comparison.
+
+        Column is equal when keys are unique and the same in both dataframes (same number of rows and distinct keys,
+        same key checksum) and the column has the same datatype, no null values and the same checksum of (key, value)
+        pairs, up to collisions of 64-bit hashes. Other columns are suspicious, with names of differing statistics.
+        Keys are profiled first and columns are profiled only when keys are equal, as otherwise no column can be proven equal.
+        Returns dataframes to merge: without rows when all columns are equal, keys and suspicious columns
+        when some columns are equal, whole dataframes otherwise.
+        """
+        columns = self.compared_columns()
+        legacy = self.engine.column_profiles(self.legacy_df, legacy_key, [])
+        cloud = self.engine.column_profiles(self.cloud_df, cloud_key, [])
+        self.quick_check_keys_equal = bool(
+            legacy.at[legacy_key, "rows"] == legacy.at[legacy_key, "distinct"] == cloud.at[cloud_key, "rows"] == cloud.at[cloud_key, "distinct"]
+            and legacy.at[legacy_key, "checksum"] == cloud.at[cloud_key, "checksum"]
+        )
+        self.equal_columns, self.suspicious_columns = [], {}
+        if not self.quick_check_keys_equal:
+            self.column_profiles = {"legacy": legacy, "cloud": cloud}
+            self.suspicious_columns = {column: [] for column in columns}
+            logger.info("Quick check: keys differ or repeat, comparing all columns")
+            return self.legacy_df, self.cloud_df
+
+        legacy = self.engine.column_profiles(self.legacy_df, legacy_key, columns)
+        cloud = self.engine.column_profiles(self.cloud_df, cloud_key, columns)
+        self.column_profiles = {"legacy": legacy, "cloud": cloud}
+        for column in columns:
+            differences = [
+                statistic for statistic in self.profile_statistics
+                if not self.same_statistic(legacy.at[column, statistic], cloud.at[column, statistic])
+            ]
+            if pd.isna(legacy.at[column, "checksum"]) or pd.isna(cloud.at[column, "checksum"]):
+                differences.append("unhashable")
+            elif "nulls" not in differences and legacy.at[column, "nulls"] > 0:
+                differences.append("nulls")
+            if differences:
+                self.suspicious_columns[column] = differences
+            else:
+                self.equal_columns.append(column)
+        logger.info(f"Quick check: {len(self.equal_columns)} of {len(columns)} columns equal, suspicious columns: {list(self.suspicious_columns)}")
+
+        if not self.equal_columns:
+            return self.legacy_df, self.cloud_df
+        self.skipped_columns = set(self.equal_columns)
+        if not self.suspicious_columns:
+            return self.engine.empty(self.legacy_df), self.engine.empty(self.cloud_df)
+        suspicious = list(self.suspicious_columns)
+        legacy_columns = list(dict.fromkeys(self.legacy_keys + [legacy_key])) + suspicious
+        cloud_columns = list(dict.fromkeys(self.cloud_keys + [cloud_key])) + suspicious
+        return self.engine.select_columns(self.legacy_df, legacy_columns), self.engine.select_columns(self.cloud_df, cloud_columns)
+
+    @staticmethod
+    def same_statistic(legacy_value, cloud_value) -> bool:
+        """Compares statistics of two profiles, missing values are equal and sums of floats may differ by rounding"""
+        legacy_missing = pd.api.types.is_scalar(legacy_value) and pd.isna(legacy_value)
+        cloud_missing = pd.api.types.is_scalar(cloud_value) and pd.isna(cloud_value)
+        if legacy_missing or cloud_missing:
+            return legacy_missing and cloud_missing
+        if isinstance(legacy_value, float) or isinstance(cloud_value, float):
             try:
-                self.legacy_unique = self.merged_dataframe[self.merged_dataframe["_merge"] == "left_only"].copy()
-                self.cloud_unique = self.merged_dataframe[self.merged_dataframe["_merge"] == "right_only"].copy()
-
-                self.merged_dataframe_common = self.merged_dataframe[self.merged_dataframe["_merge"] == "both"].copy()
-
-                self.duplicates = self.merged_dataframe_common.duplicated()
-            except AttributeError as e:
-                logging.error(f"An exception occur during processing merged dataframe: \n{e}")
-                raise
-
-            for column in self.common_columns:
-                if isinstance(self.join_columns, list):
-                    if column != self.join_columns[0] and column != self.join_columns[1]:
-                        legacy_values = self.merged_dataframe_common[column + "_legacy"]
-                        cloud_values = self.merged_dataframe_common[column + "_cloud"]
-                        mismatch = column + "_mismatch"
-                        self.merged_dataframe_common[mismatch] = (legacy_values != cloud_values).astype(int)
-                elif isinstance(self.join_columns, str):
-                    if column != self.join_columns:
-                        legacy_values = self.merged_dataframe_common[column + "_legacy"]
-                        cloud_values = self.merged_dataframe_common[column + "_cloud"]
-                        mismatch = column + "_mismatch"
-                        self.merged_dataframe_common[mismatch] = (legacy_values != cloud_values).astype(int)
-            self.mismatches_exists = any('_mismatch' in col for col in self.merged_dataframe_common.columns)
-            if self.mismatches_exists:
-                try:
-                    mismatch_columns = [col for col in self.merged_dataframe_common.columns if '_mismatch' in col]
-                    mismatch_sum = self.merged_dataframe_common[mismatch_columns].sum(axis=1)
-                    self.merged_dataframe_common["mismatch_sum"] = mismatch_sum
-                    self.mismatched_values = self.merged_dataframe_common["mismatch_sum"].sum()
-                    self.mismatched_dataframe = self.merged_dataframe_common[self.merged_dataframe_common["mismatch_sum"] > 0]
-                except ValueError as e:
-                    logging.error(f"An exception occur during processing mismatched values in dataframe: \n{e}")
-                    self.mismatched_values = 0
-                    self.mismatched_dataframe = pd.DataFrame()
+                return bool(np.isclose(legacy_value, cloud_value, rtol=1e-9, atol=0))
+            except TypeError:
+                return False
+        try:
+            return bool(legacy_value == cloud_value)
+        except TypeError:
+            return False
+
+    def handle_duplicate_keys(self, dataframe: pd.DataFrame, key: str) -> pd.DataFrame:
+        """Applies duplicate_keys strategy to the dataframe before merging"""
+        if self.duplicate_keys in ("deduplicate", "occurrence"):
+            return self.engine.handle_duplicate_keys(dataframe, key, self.duplicate_keys)
+        return dataframe
+
+    def merge_columns(self):
+        """Returns columns for merging legacy and cloud dataframes, including occurrence of the key for occurrence strategy"""
+        legacy_key, cloud_key = self.key_columns()
+        if self.duplicate_keys == "occurrence":
+            return [legacy_key, "_occurrence"], [cloud_key, "_occurrence"]
+        return legacy_key, cloud_key
+
+    def matched_key_datatypes(self):
+        """Checking if every pair of key columns has the same datatype in both dataframes, differing pairs are kept in mismatched_key_types"""
+        legacy_datatypes = self.engine.dtypes(self.legacy_df)
+        cloud_datatypes = self.engine.dtypes(self.cloud_df)
+        self.mismatched_key_types = {}
+        for legacy_key, cloud_key in zip(self.legacy_keys, self.cloud_keys):
+            if legacy_datatypes[legacy_key] != cloud_datatypes[cloud_key]:
+                name = legacy_key if legacy_key == cloud_key else f"{legacy_key}/{cloud_key}"
+                self.mismatched_key_types[name] = (str(legacy_datatypes[legacy_key]), str(cloud_datatypes[cloud_key]))
+        return not self.mismatched_key_types
+
+    def compared_columns(self):
+        """Returns common columns other than the keys and columns proven equal by the quick check, in order of the legacy dataframe"""
+        keys = {*self.legacy_keys, *self.cloud_keys, *self.key_columns()}
+        return [column for column in self.legacy_df.columns if column in self.common_columns and column not in keys and column not in self.skipped_columns]
+
+    def merged_keys(self, merged_dataframe: Optional[pd.DataFrame] = None):
+        """Returns value of the join key for every row of the merged dataframe, code of the key for composite keys"""
+        if merged_dataframe is None:
+            if self.composite_key:
+                return self.merged_key_codes
+            merged_dataframe = self.merged_dataframe
+        legacy_key, cloud_key = self.key_columns()
+        return merged_dataframe[legacy_key].fillna(merged_dataframe[cloud_key])
+
+    def merged_key_values(self, merged_dataframe: pd.DataFrame) -> pd.MultiIndex:
+        """Returns values of composite key columns for every row of the merged dataframe (without _key column)"""
+        return pd.MultiIndex.from_arrays([
+            merged_dataframe[legacy_key] if legacy_key == cloud_key else merged_dataframe[legacy_key].fillna(merged_dataframe[cloud_key])
+            for legacy_key, cloud_key in zip(self.legacy_keys, self.cloud_keys)
+        ])
+
+    def fingerprint_candidates(self, legacy_df: pd.DataFrame, cloud_df: pd.DataFrame):
+        """
+        Selecting rows which need full column comparison using fingerprints of rows.
+
+        Merges only keys and 64-bit hashes of compared columns, so rows with equal hashes are skipped.
+        Rows with null values, unique keys and duplicated keys are kept, as well as all other rows with the same key,
+        so merging selected rows gives the same rows as merging whole dataframes.
+        Hashes are trusted only for columns with the same datatype on both sides (and strings for object columns),
+        otherwise None is returned and whole dataframes are compared.
+
+        Returns selected legacy rows, selected cloud rows and (number of rows of the whole merge, positions of selected rows in it).
+        """
+        compared_columns = self.compared_columns()
+        if not compared_columns:
+            return None
+        for column in compared_columns:
+            legacy_values, cloud_values = legacy_df[column], cloud_df[column]
+            if legacy_values.dtype != cloud_values.dtype or (
+                legacy_values.dtype == object
+                and not {pd.api.types.infer_dtype(legacy_values), pd.api.types.infer_dtype(cloud_values)} <= {"string", "empty"}
+            ):
+                logger.info(f"Column {column} cannot be fingerprinted, comparing all rows")
+                return None
+
+        legacy_key, cloud_key = self.key_columns()
+        left_on, right_on = self.merge_columns()
+        merged = self.row_fingerprints(legacy_df, left_on, compared_columns).merge(
+            self.row_fingerprints(cloud_df, right_on, compared_columns),
+            how="outer",
+            left_on=left_on,
+            right_on=right_on,
+            suffixes=("_legacy", "_cloud"),
+            indicator=True
+        )
+        keys = self.merged_keys(merged)
+        candidates = (
+            (merged["_merge"] != "both")
+            | (merged["_fingerprint_legacy"] != merged["_fingerprint_cloud"])
+            | merged["_null_legacy"]
+            | merged["_null_cloud"]
+        ).fillna(True).astype(bool)
+        candidates = candidates | keys.isin(self.legacy_duplicate_keys.index) | keys.isin(self.cloud_duplicate_keys.index)
+        candidate_keys = keys[candidates].unique()
+        selected = keys.isin(candidate_keys).to_numpy()
+        logger.info(f"Fingerprints differ for {int(selected.sum())} of {len(merged)} merged rows")
+        return (
+            legacy_df[legacy_df[legacy_key].isin(candidate_keys)],
+            cloud_df[cloud_df[cloud_key].isin(candidate_keys)],
+            (len(merged), np.flatnonzero(selected))
+        )
+
+    @staticmethod
+    def row_fingerprints(dataframe: pd.DataFrame, keys: Union[list, str], columns: List[str]) -> pd.DataFrame:
+        """
+        Returns key columns, hash of compared columns and null flag for every row.
+
+        Nullable datatypes keep hashes exact when the outer merge introduces missing values.
+        """
+        fingerprints = dataframe[keys if isinstance(keys, list) else [keys]].reset_index(drop=True)
+        fingerprints["_fingerprint"] = pd.array(pd.util.hash_pandas_object(dataframe[columns], index=False), dtype="UInt64")
+        fingerprints["_null"] = pd.array(dataframe[columns].isna().any(axis=1), dtype="boolean")
+        return fingerprints
+
+    def _partial_results(self, offset: Union[int, pd.Series]):
+        """
+        Collects results of value_mismatches needed to rebuild the report, when the compared dataframes are a partition of bigger datasets.
+
+        Rows are relabeled from positions in the merged partition to positions in the merged datasets.
+        offset: int or pd.Series
+            Number of merged rows in the partitions preceding this one (partitions split by ranges of the key)
+            or position of the first merged row of every key in the partition (partitions split by hash of the key),
+            indexed by the key, code of composite key or values of composite key columns (MultiIndex).
+        """
+        if isinstance(offset, pd.Series):
+            keys = self.merged_keys()
+            rank = keys.groupby(keys, sort=False, dropna=False).cumcount().to_numpy()
+            if isinstance(offset.index, pd.MultiIndex):
+                keys = self.merged_key_values(self.merged_dataframe)
+            positions = pd.Series(offset.reindex(keys).to_numpy().astype(np.int64) + rank, index=self.merged_dataframe.index)
         else:
-            logging.warning("Id columns are not the same datatypes!")
+            positions = pd.Series(self.merged_dataframe.index + offset, index=self.merged_dataframe.index)
+
+        def relabel(dataframe):
+            return dataframe.set_axis(positions[dataframe.index].to_numpy())
+
+        has_duplicates = self.duplicated_count > 0
+        return {
+            "merged_rows": self.merged_rows,
+            "probe": self.merged_dataframe.head(1),
+            "legacy_unique": relabel(self.legacy_unique),
+            "cloud_unique": relabel(self.cloud_unique),
+            "mismatches_exists": self.mismatches_exists,
+            "mismatched_values": self.mismatched_values if self.mismatches_exists else 0,
+            "mismatched_dataframe": relabel(self.mismatched_dataframe) if self.mismatches_exists else None,
+            "duplicates": relabel(self.duplicates[self.duplicates]),
+            "duplicated_dataframe": relabel(self._duplicated_rows()) if has_duplicates else None,
+            "legacy_duplicate_keys": self.legacy_duplicate_keys,
+            "cloud_duplicate_keys": self.cloud_duplicate_keys,
+            "legacy_duplicates": bool(self.legacy_df.duplicated().any()),
+            "cloud_duplicates": bool(self.cloud_df.duplicated().any()),
+        }
+
+    def _combine_partial_results(self, partials: List[dict]):
+        """
+        Sets results of value_mismatches from results of partitions collected with _partial_results.
+
+        Datatypes are cast to the ones of the merged datasets, e.g. integer columns of partitions without unique rows
+        become float when other partition introduced NaN values.
+        Mismatch matrix holds only mismatched rows, as the common rows of partitions are not kept.
+        """
+        probes = [partial["probe"] for partial in partials if not partial["probe"].empty]
+        datatypes = pd.concat(probes).dtypes if probes else pd.Series(dtype=object)
+
+        def combine(name):
+            frames = [partial[name] for partial in partials if partial[name] is not None]
+            non_empty = [frame for frame in frames if not frame.empty]
+            combined = pd.concat(non_empty).sort_index() if non_empty else frames[0]
+            return combined.astype({column: datatypes[column] for column in combined.columns if column in datatypes.index})
+
+        self.matched_id_datatypes = True
+        self.legacy_duplicate_keys = pd.concat([partial["legacy_duplicate_keys"] for partial in partials]).sort_index()
+        self.cloud_duplicate_keys = pd.concat([partial["cloud_duplicate_keys"] for partial in partials]).sort_index()
+        self.estimated_merged_rows = sum(partial["merged_rows"] for partial in partials)
+        self.legacy_unique = combine("legacy_unique")
+        self.cloud_unique = combine("cloud_unique")
+        self.mismatches_exists = any(partial["mismatches_exists"] for partial in partials)
+        if self.mismatches_exists:
+            self.mismatched_values = sum(partial["mismatched_values"] for partial in partials)
+            self.mismatched_dataframe = combine("mismatched_dataframe")
+            self.mismatch_matrix = MismatchMatrix.from_frame(self.mismatched_dataframe, self.compared_columns())
+            self.mismatch_counts = self.mismatch_matrix.column_counts()
+        self.duplicates = pd.concat([partial["duplicates"] for partial in partials]).sort_index()
+        self.duplicated_count = int(self.duplicates.sum())
+        self.duplicated_dataframe = combine("duplicated_dataframe") if self.duplicated_count > 0 else None
+        self.duplicates_detected_in = self.describe_duplicates(
+            any(partial["legacy_duplicates"] for partial in partials),
+            any(partial["cloud_duplicates"] for partial in partials)
+        )
 
     def check_dataframe(self, dataframe: pd.DataFrame):
         """Checking datatype of a dataframe"""
-        if not isinstance(dataframe, pd.DataFrame):
-            raise TypeError(f"{dataframe} is not a valid pandas DataFrame.")
+        if not self.engine.is_dataframe(dataframe):
+            raise TypeError(f"{dataframe} is not a valid {self.engine.name} DataFrame.")
         
     def report(self):
         try:
-            schema = self.get_schema_summary()
-            row_count = self.get_row_count_summary()
-            value_mismatches = self.get_value_mismatches_summary()
+            with self.phase("report"):
+                schema = self.get_schema_summary()
+                row_count = self.get_row_count_summary()
+                value_mismatches = self.get_value_mismatches_summary()
         except AttributeError as e:
-            logging.error(f"An exception occur during gathering report data: \n{e}")
+            logger.error(f"An exception occur during gathering report data: \n{e}")
             raise RuntimeError("Call compare method before generating report")
         return f"""Report
 --------------------------------------------------------
@@ -217,7 +669,51 @@ Row count differences:
 
 Value mismatches:
 -----------------
-{value_mismatches}"""        
+{value_mismatches}"""
+
+    def summary(self) -> dict:
+        """
+        Returns results behind the schema, row count and value mismatches sections of the report as JSON serializable dictionary.
+
+        Only counts are kept, without samples of rows.
+        """
+        try:
+            summary = {
+                "schema": {
+                    "missing_from_legacy": sorted(self.missing_from_legacy),
+                    "missing_from_cloud": sorted(self.missing_from_cloud),
+                    "common_columns": sorted(self.common_columns),
+                    "join_columns": self.join_columns,
+                    "mismatched_types": self.mismatched_types,
+                },
+                "row_count": {
+                    "legacy": int(self.row_count_legacy),
+                    "cloud": int(self.row_count_cloud),
+                    "difference": int(self.row_count_legacy - self.row_count_cloud),
+                },
+                "value_mismatches": {
+                    "matched_key_datatypes": bool(self.matched_id_datatypes),
+                    "mismatched_key_types": {name: list(datatypes) for name, datatypes in self.mismatched_key_types.items()},
+                },
+            }
+            if self.matched_id_datatypes:
+                mismatch_counts = self.mismatch_counts[self.mismatch_counts > 0] if self.mismatches_exists else pd.Series(dtype=np.int64)
+                summary["value_mismatches"].update(
+                    legacy_duplicate_keys=len(self.legacy_duplicate_keys),
+                    cloud_duplicate_keys=len(self.cloud_duplicate_keys),
+                    duplicate_keys_strategy=self.duplicate_keys,
+                    legacy_unique=int(self.engine.count(self.legacy_unique)),
+                    cloud_unique=int(self.engine.count(self.cloud_unique)),
+                    mismatched_values=int(self.mismatched_values) if self.mismatches_exists else 0,
+                    mismatch_counts={str(column): int(count) for column, count in mismatch_counts.items()},
+                    duplicated_rows=int(self.duplicated_count),
+                )
+                if self.quick_check:
+                    summary["value_mismatches"].update(equal_columns=list(self.equal_columns), suspicious_columns=self.suspicious_columns)
+        except AttributeError as e:
+            logger.error(f"An exception occur during gathering summary data: \n{e}")
+            raise RuntimeError("Call compare method before generating summary")
+        return summary
 
     def get_schema_summary(self):
         base = f"""Missing columns for Legacy: {self.missing_from_legacy if bool(self.missing_from_legacy) else "No missing columns"}
@@ -240,39 +736,155 @@ Row count difference for cloud: {self.row_count_cloud - self.row_count_legacy}""
     def get_value_mismatches_summary(self):
         if self.matched_id_datatypes:
             nl = '\n'
-            base = ""
-            if not self.legacy_unique.empty:
-                base = base + f"{len(self.legacy_unique)} unique for Legacy: " + nl + str(self.legacy_unique.drop("_merge", axis=1)) + "\n"
-            if not self.cloud_unique.empty:
-                base = base + f"{len(self.cloud_unique)} unique for Cloud: " + nl + str(self.cloud_unique.drop("_merge", axis=1)) + "\n"
+            base = self.get_quick_check_summary() if self.quick_check else ""
+            for name, duplicate_keys in (("Legacy", self.legacy_duplicate_keys), ("Cloud", self.cloud_duplicate_keys)):
+                if not duplicate_keys.empty:
+                    base = base + f"{len(duplicate_keys)} duplicated keys in {name} ({duplicate_keys.sum()} rows), handled with {self.duplicate_keys} strategy" + nl
+            for name, unique in (("Legacy", self.legacy_unique), ("Cloud", self.cloud_unique)):
+                unique_rows = self.engine.count(unique)
+                if unique_rows > 0:
+                    base = base + f"{unique_rows} unique for {name}{self.sample_note(unique)}: " + nl + str(self.sample_rows(unique).drop("_merge", axis=1)) + "\n"
             if self.mismatches_exists:
                 base = base + f"There are {self.mismatched_values} mismatched values\n"
-                if not self.mismatched_dataframe.empty:
-                    base = base + str(self.mismatched_dataframe)
-
-            if not self.duplicates[self.duplicates == True].empty:
-                self.merged_dataframe_common["duplicate"] = self.merged_dataframe_common.duplicated()
-                legacy_df_duplicates = self.legacy_df.duplicated()
-                cloud_df_duplicates = self.cloud_df.duplicated()
-                detected_in = ""
-                if legacy_df_duplicates.any() and cloud_df_duplicates.any():
-                    detected_in = "both dataframes"
-                elif legacy_df_duplicates.any():
-                    detected_in = "legacy dataframe"
-                elif cloud_df_duplicates.any():
-                    detected_in = "cloud dataframe"
-                else:
-                    detected_in = "merged data"
-                base = base + "Duplicates detected in " + detected_in +": " + str(self.duplicates.sum()) + "\n" + str(self.merged_dataframe_common[self.merged_dataframe_common["duplicate"] == True])
+                if self.mismatched_values > 0:
+                    counts = self.mismatch_counts
+                    base = base + "Mismatched values per column: " + ", ".join(f"{column}: {count}" for column, count in counts[counts > 0].items()) + "\n"
+                    samples = self.sample_mismatches()
+                    sample = pd.concat(samples.values())
+                    sample = sample[~sample.index.duplicated()].sort_index()
+                    if len(sample) < self.engine.count(self.mismatched_dataframe):
+                        base = base + f"Showing random sample of up to {self.sample_size} mismatched rows per column\n"
+                    base = base + str(sample) + "\n"
+
+            if self.duplicated_count > 0:
+                detected_in = self._duplicates_detected_in()
+                duplicated_rows = self._duplicated_rows()
+                base = base + "Duplicates detected in " + detected_in + ": " + str(self.duplicated_count) + self.sample_note(duplicated_rows) + "\n" + str(self.sample_rows(duplicated_rows))
         else:
-            base = "Unmatched datatypes of the keys. Value matching cannot be performed!"
+            differences = ", ".join(f"{name}: {legacy} and {cloud}" for name, (legacy, cloud) in self.mismatched_key_types.items())
+            base = f"Unmatched datatypes of the keys ({differences}). Value matching cannot be performed!"
 
         if base == "":
             base = "No columns has been checked for mismatching values!"
         return base
-    
-    def sample_mismatches(self):
+
+    def get_quick_check_summary(self):
+        columns = len(self.equal_columns) + len(self.suspicious_columns)
+        if columns == 0:
+            return ""
+        if not self.quick_check_keys_equal:
+            base = f"Quick check: keys differ or repeat, values of all {columns} columns compared"
+        elif not self.suspicious_columns:
+            base = f"Quick check: all {columns} columns equal by profile, values not compared"
+        else:
+            base = f"Quick check: {len(self.equal_columns)} of {columns} columns equal by profile, values compared for {len(self.suspicious_columns)} columns"
+        differences = [f"{column} ({', '.join(statistics)})" for column, statistics in self.suspicious_columns.items() if statistics]
+        if differences:
+            base = base + "\nProfiles differ on: " + ", ".join(differences)
+        return base + "\n"
+
+    def sample_note(self, dataframe: pd.DataFrame) -> str:
+        return f" (showing random sample of {self.sample_size})" if self.engine.count(dataframe) > self.sample_size else ""
+
+    def sample_rows(self, dataframe: pd.DataFrame, size: Optional[int] = None, seed: Optional[int] = None) -> pd.DataFrame:
         """
-        TODO:
+        Returns uniform random sample of rows in their original order.
+
+        Rows with the smallest random keys are kept (bottom-k reservoir), so the same seed gives the same sample.
+        """
+        return self.engine.sample(dataframe, self.sample_size if size is None else size, self.sample_seed if seed is None else seed)
+
+    def _duplicated_rows(self):
+        """Returns duplicated rows of the merged dataframe, computed once per comparison"""
+        if self.duplicated_dataframe is None:
+            self.duplicated_dataframe = self.engine.duplicated_rows(self.merged_dataframe_common, self.mismatch_matrix, self.duplicates)
+        return self.duplicated_dataframe
+
+    def _duplicates_detected_in(self):
+        """Returns name of the dataframe containing duplicates, computed once per comparison"""
+        if self.duplicates_detected_in is None:
+            self.duplicates_detected_in = self.describe_duplicates(self.engine.has_duplicated_rows(self.legacy_df), self.engine.has_duplicated_rows(self.cloud_df))
+        return self.duplicates_detected_in
+
+    @staticmethod
+    def describe_duplicates(legacy_duplicates: bool, cloud_duplicates: bool):
+        """Describes in which dataframe duplicates were detected"""
+        if legacy_duplicates and cloud_duplicates:
+            return "both dataframes"
+        elif legacy_duplicates:
+            return "legacy dataframe"
+        elif cloud_duplicates:
+            return "cloud dataframe"
+        return "merged data"
+
+    def sample_mismatches(self, size: Optional[int] = None, seed: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+        """
+        Samples mismatched rows, stratified per mismatching column.
+
+        Returns up to size mismatched rows for every column with mismatches. Random keys are drawn once per row,
+        so samples of different columns share rows where possible.
+        """
+        return self.engine.sample_mismatches(
+            self.mismatched_dataframe,
+            list(self.mismatch_counts.index),
+            self.sample_size if size is None else size,
+            self.sample_seed if seed is None else seed
+        )
+
+    def write_differences(self, directory: str, file_format: str = "csv", batch_rows: int = 100000):
         """
-        pass
\ No newline at end of file
+        Writes all unique, mismatched and duplicated rows into files in the directory, batch by batch.
+
+        Files legacy_unique, cloud_unique, mismatched and duplicated are written as csv, jsonl or parquet (requires pyarrow).
+        """
+        if file_format not in ("csv", "jsonl", "parquet"):
+            raise ValueError(f"Unsupported file format {file_format}, use csv, jsonl or parquet")
+        try:
+            differences = {"legacy_unique": self.legacy_unique, "cloud_unique": self.cloud_unique}
+        except AttributeError as e:
+            logger.error(f"An exception occur during gathering differences: \n{e}")
+            raise RuntimeError("Call compare method before writing differences")
+        if self.mismatches_exists:
+            differences["mismatched"] = self.mismatched_dataframe
+        if self.duplicated_count > 0:
+            differences["duplicated"] = self._duplicated_rows()
+
+        os.makedirs(directory, exist_ok=True)
+        for name, dataframe in differences.items():
+            path = os.path.join(directory, f"{name}.{file_format}")
+            logger.info(f"Writing {self.engine.count(dataframe)} rows to {path}...")
+            if file_format == "parquet":
+                self._write_parquet(path, dataframe, batch_rows)
+                continue
+            for number, batch in enumerate(self.engine.batches(dataframe, batch_rows)):
+                batch = batch.drop(columns="_merge", errors="ignore")
+                if file_format == "csv":
+                    batch.to_csv(path, mode="w" if number == 0 else "a", header=number == 0)
+                else:
+                    batch.to_json(path, orient="records", lines=True, mode="w" if number == 0 else "a", date_format="iso")
+
+    def _write_parquet(self, path: str, dataframe, batch_rows: int):
+        """
+        Writes rows of the dataframe into Parquet file batch by batch.
+
+        Schema is taken from the whole dataframe, so batches with only null values in a column are written with the type of the column.
+        Dataframes of other engines are read twice, first to unify schemas of all batches.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            logger.error(f"pyarrow is required for writing Parquet files: {e}")
+            raise
+        if isinstance(dataframe, pd.DataFrame):
+            schema = pa.Schema.from_pandas(dataframe.drop(columns="_merge", errors="ignore"))
+        else:
+            schema = pa.unify_schemas([
+                pa.Schema.from_pandas(batch.drop(columns="_merge", errors="ignore")) for batch in self.engine.batches(dataframe, batch_rows)
+            ], promote_options="permissive")
+        writer = pq.ParquetWriter(path, schema)
+        try:
+            for batch in self.engine.batches(dataframe, batch_rows):
+                writer.write_table(pa.Table.from_pandas(batch.drop(columns="_merge", errors="ignore"), schema=schema))
+        finally:
+            writer.close()
\ No newline at end of file
@@ -0,0 +1,148 @@
+import pandas as pd
+
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, Union
+
+from ColumnComparator import ColumnComparator
+
+
+class ComparisonEngine(ABC):
+    """
+    Interface of the dataframe library executing a comparison, CompareTwoDatasets calls only these methods on the data.
+    Engines implement all abstract methods, first_positions is optional.
+
+    Engine gets dataframes of its library (frames) and returns frames of its library, only counts, datatypes
+    and samples are returned as pandas objects, so engines of distributed libraries never collect whole data.
+    Merged frame follows pandas outer merge: overlapping columns get _legacy and _cloud suffixes,
+    _merge column tells left_only, right_only or both, and rows are ordered by the key.
+
+    local: bool
+        Frames are pandas dataframes in memory, which enables fingerprinting and partitioned comparisons.
+    """
+
+    name = None
+    local = False
+
+    @abstractmethod
+    def is_dataframe(self, dataframe) -> bool:
+        """Checks if dataframe is a frame of the engine"""
+
+    @abstractmethod
+    def dtypes(self, dataframe) -> pd.Series:
+        """Returns pandas datatype of every column"""
+
+    @abstractmethod
+    def count(self, dataframe) -> int:
+        """Returns number of rows"""
+
+    @abstractmethod
+    def key_counts(self, dataframe, key: str):
+        """Returns number of rows of every value of the key, null values included"""
+
+    @abstractmethod
+    def duplicate_keys(self, counts) -> pd.Series:
+        """Returns number of rows of keys repeated within a dataframe, from key_counts"""
+
+    @abstractmethod
+    def merged_key_rows(self, legacy_counts, cloud_counts, duplicate_keys: str = "keep"):
+        """Returns number of rows of every key in the outer merge under duplicate_keys strategy, from key_counts"""
+
+    @abstractmethod
+    def total_rows(self, rows) -> int:
+        """Sums numbers of rows returned by merged_key_rows"""
+
+    def first_positions(self, rows) -> Optional[pd.Series]:
+        """Returns position of the first merged row of every key, None when the engine does not keep positions"""
+        return None
+
+    @abstractmethod
+    def select_columns(self, dataframe, columns: List[str]):
+        """Returns dataframe with only the columns"""
+
+    @abstractmethod
+    def empty(self, dataframe):
+        """Returns dataframe without rows"""
+
+    @abstractmethod
+    def encode_keys(self, legacy_df, cloud_df, legacy_keys: List[str], cloud_keys: List[str]):
+        """
+        Returns both dataframes with _key column encoding composite key, equal keys get equal codes in both dataframes
+        and codes are ordered as the keys (column by column, nulls last).
+        """
+
+    @abstractmethod
+    def decode_keys(self, merged, keys: List[str], dtypes: pd.Series):
+        """
+        Drops _key column from merged frame and replaces <key>_legacy and <key>_cloud columns of keys named
+        the same in both dataframes with one <key> column of datatype from dtypes, as merge on the key columns gives.
+        """
+
+    @abstractmethod
+    def column_profiles(self, dataframe, key: str, columns: List[str]) -> pd.DataFrame:
+        """
+        Profiles the key and the columns in one pass, indexed by the key and the columns.
+
+        Statistics are dtype, rows, nulls, min, max, sum, mean (numeric columns), distinct (approximate, exact for the key)
+        and checksum, sum of hashes of (key, value) pairs (of the key for the key) modulo 2 ** 64, which does not depend
+        on order of rows. Checksum is None for columns which cannot be hashed.
+        """
+
+    @abstractmethod
+    def handle_duplicate_keys(self, dataframe, key: str, duplicate_keys: str):
+        """Applies duplicate_keys strategy ("deduplicate" or "occurrence") before merging"""
+
+    @abstractmethod
+    def outer_join(self, legacy_df, cloud_df, join_columns: Union[list, str], left_on: Union[list, str], right_on: Union[list, str]):
+        """Returns outer merge of the dataframes with _legacy and _cloud suffixes and _merge column"""
+
+    @abstractmethod
+    def drop_columns(self, dataframe, columns: List[str]):
+        """Returns dataframe without the columns"""
+
+    @abstractmethod
+    def split(self, merged):
+        """Splits merged frame into rows unique for legacy, rows unique for cloud and common rows"""
+
+    @abstractmethod
+    def column_mismatches(self, common, columns: List[str], comparator: ColumnComparator, legacy_dtypes: pd.Series, cloud_dtypes: pd.Series):
+        """
+        Compares <column>_legacy with <column>_cloud for every column under rules of the comparator, returns mismatch state of common rows.
+
+        legacy_dtypes and cloud_dtypes are datatypes of the compared dataframes, from dtypes.
+        """
+
+    @abstractmethod
+    def mismatch_counts(self, state) -> pd.Series:
+        """Number of mismatched values per compared column"""
+
+    @abstractmethod
+    def mismatched_rows(self, common, state):
+        """Returns common rows with at least one mismatch, with <column>_mismatch and mismatch_sum columns"""
+
+    @abstractmethod
+    def duplicated(self, common):
+        """Returns marker of common rows repeating an earlier common row"""
+
+    @abstractmethod
+    def duplicated_count(self, duplicated) -> int:
+        """Returns number of duplicated rows found by duplicated"""
+
+    @abstractmethod
+    def duplicated_rows(self, common, state, duplicated):
+        """Returns duplicated common rows with <column>_mismatch, mismatch_sum and duplicate columns"""
+
+    @abstractmethod
+    def has_duplicated_rows(self, dataframe) -> bool:
+        """Checks if any row of the dataframe repeats another row"""
+
+    @abstractmethod
+    def sample(self, dataframe, size: int, seed: int) -> pd.DataFrame:
+        """Returns uniform random sample of up to size rows in their merged order, as pandas dataframe"""
+
+    @abstractmethod
+    def sample_mismatches(self, mismatched, columns: List[str], size: int, seed: int) -> Dict[str, pd.DataFrame]:
+        """Returns up to size mismatched rows for every column with mismatches, as pandas dataframes"""
+
+    @abstractmethod
+    def batches(self, dataframe, batch_rows: int) -> Iterator[pd.DataFrame]:
+        """Yields rows in their merged order as pandas dataframes of up to batch_rows rows, at least one (maybe empty) batch"""
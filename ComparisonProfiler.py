@@ -0,0 +1,126 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
+import resource
+import time
+import tracemalloc
+
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss() -> Optional[float]:
+    """Resident memory of the process in MB, None when it is not available"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 1024 / 1024
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class ComparisonProfiler:
+    """
+    Collects timings of phases of a comparison, attached to CompareTwoDatasets with profiler parameter.
+
+    Every phase (e.g. compare/value_mismatches/merge) gets wall time, change of resident memory and row and column
+    counts recorded by the comparison. Finished phases are appended to metrics and passed to every callback.
+    Without attached profiler comparisons skip all measurements.
+
+    Parameters:
+    callbacks: list (optional)
+        Functions called with metrics of every finished phase (dict).
+    memory: bool
+        Traces Python allocations with tracemalloc and adds peak traced memory of every phase, slows the comparison down.
+    profile: bool
+        Runs cProfile during outermost phases, statistics are available with profile_stats.
+    """
+
+    def __init__(self, callbacks: Optional[List[Callable[[dict], None]]] = None, memory: bool = False, profile: bool = False):
+        self.callbacks = list(callbacks or [])
+        self.memory = memory
+        self.profile = profile
+        self.metrics = {"phases": []}
+        self.stack = []
+        self.profiler = cProfile.Profile() if profile else None
+
+    def add_callback(self, callback: Callable[[dict], None]):
+        self.callbacks.append(callback)
+
+    @contextmanager
+    def phase(self, name: str):
+        """Measures the phase, phases started inside are recorded as its sub-steps"""
+        frame = {"phase": "/".join([parent["name"] for parent in self.stack] + [name]), "name": name, "depth": len(self.stack), "counts": {}, "traced_peak": 0}
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                frame["started_tracing"] = True
+            if self.stack:
+                self.stack[-1]["traced_peak"] = max(self.stack[-1]["traced_peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            frame["traced_start"] = tracemalloc.get_traced_memory()[0]
+        if self.profiler is not None and not self.stack:
+            self.profiler.enable()
+        self.stack.append(frame)
+        rss_start = current_rss()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            rss_end = current_rss()
+            self.stack.pop()
+            if self.profiler is not None and not self.stack:
+                self.profiler.disable()
+            event = {"phase": frame["phase"], "name": name, "depth": frame["depth"], "seconds": seconds}
+            if rss_start is not None and rss_end is not None:
+                event["rss_mb"] = round(rss_end, 1)
+                event["rss_delta_mb"] = round(rss_end - rss_start, 1)
+            if self.memory:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(frame["traced_peak"], peak)
+                if self.stack:
+                    self.stack[-1]["traced_peak"] = max(self.stack[-1]["traced_peak"], peak)
+                event["traced_delta_mb"] = round((current - frame["traced_start"]) / 1024 / 1024, 3)
+                event["traced_peak_mb"] = round((peak - frame["traced_start"]) / 1024 / 1024, 3)
+                if frame.get("started_tracing"):
+                    tracemalloc.stop()
+            event.update(frame["counts"])
+            if error is not None:
+                event["error"] = error
+            self.metrics["phases"].append(event)
+            for callback in self.callbacks:
+                try:
+                    callback(event)
+                except Exception as e:
+                    logger.error(f"Profiler callback {callback} failed: {e}")
+
+    def record(self, **counts):
+        """Adds counts (e.g. rows, columns) to the currently running phase"""
+        if self.stack:
+            self.stack[-1]["counts"].update(counts)
+
+    def total_seconds(self) -> dict:
+        """Wall time of every phase summed over all its runs"""
+        totals = {}
+        for event in self.metrics["phases"]:
+            totals[event["phase"]] = totals.get(event["phase"], 0) + event["seconds"]
+        return totals
+
+    def to_json(self) -> str:
+        return json.dumps(self.metrics, default=str)
+
+    def profile_stats(self, sort: str = "cumulative", limit: int = 30) -> str:
+        """Returns cProfile statistics of profiled phases as text"""
+        if self.profiler is None:
+            raise RuntimeError("Create ComparisonProfiler with profile=True to collect cProfile statistics")
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats(sort).print_stats(limit)
+        return output.getvalue()
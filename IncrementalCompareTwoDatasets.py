@@ -0,0 +1,373 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from typing import Dict, Iterable, List, Optional, Union
+
+from ParallelCompareTwoDatasets import ParallelCompareTwoDatasets, hash_partitions
+
+logger = logging.getLogger(__name__)
+
+
+def block_digests(dataframe: pd.DataFrame, key: Union[str, List[str]], blocks: int, columns: Optional[List[str]] = None):
+    """
+    Splits rows into blocks by hash of the key (column or list of columns) and computes digest of every block.
+
+    Digest covers hashes of the columns (all by default) of the rows in their original order. Returns digests and positions of rows of every block.
+    """
+    numbers = hash_partitions(dataframe[key], blocks)
+    row_hashes = pd.util.hash_pandas_object(dataframe if columns is None else dataframe[columns], index=False).to_numpy()
+    positions = pd.Series(np.arange(len(dataframe))).groupby(numbers).indices
+    empty = np.array([], dtype=np.int64)
+    digests = [
+        hashlib.blake2b(row_hashes[positions.get(block, empty)].tobytes(), digest_size=16).digest()
+        for block in range(blocks)
+    ]
+    return digests, positions
+
+
+def digest_tree(leaves: List[bytes], fanout: int) -> List[List[bytes]]:
+    """Builds tree of digests, level 0 holds digests of blocks and the last level holds the root"""
+    tree = [leaves]
+    while len(tree[-1]) > 1:
+        level = tree[-1]
+        tree.append([hashlib.blake2b(b"".join(level[node:node + fanout]), digest_size=16).digest() for node in range(0, len(level), fanout)])
+    return tree
+
+
+def changed_blocks(old: List[List[bytes]], new: List[List[bytes]], fanout: int) -> set:
+    """Descends from the root only into nodes whose digest changed and returns changed blocks"""
+    if len(old) != len(new) or any(len(old_level) != len(new_level) for old_level, new_level in zip(old, new)):
+        return set(range(len(new[0])))
+    nodes = [0]
+    for level in range(len(new) - 1, -1, -1):
+        changed = [node for node in nodes if old[level][node] != new[level][node]]
+        if level == 0:
+            return set(changed)
+        nodes = [child for node in changed for child in range(node * fanout, min((node + 1) * fanout, len(new[level - 1])))]
+
+
+# missing values of object columns which Arrow stores as null, restored by their codes
+missing_values = {1: np.nan, 2: pd.NaT, 3: pd.NA}
+
+
+def missing_code(value) -> int:
+    if value is pd.NaT:
+        return 2
+    if value is pd.NA:
+        return 3
+    return 1 if isinstance(value, float) and value != value else 0
+
+
+def frame_to_bytes(dataframe: pd.DataFrame) -> bytes:
+    """
+    Serializes dataframe with its index and datatypes into Arrow IPC stream, which holds only data.
+
+    Arrow gives object columns types of their values (e.g. bool) and stores their NaN, NaT and NA values as nulls (None),
+    positions of object columns and codes of these values are kept, so they are restored when reading.
+    """
+    import pyarrow as pa
+
+    objects, codes = [], {}
+    for number, (name, values) in enumerate(dataframe.items()):
+        if values.dtype == object:
+            objects.append(number)
+            column_codes = np.fromiter((missing_code(value) for value in values), dtype=np.int8, count=len(values))
+            if column_codes.any():
+                codes[number] = column_codes
+    if codes:
+        dataframe = dataframe.assign(**{f"_missing_{number}": column_codes for number, column_codes in codes.items()})
+    # columns of Arrow-backed datatypes (e.g. read by from_files) hold chunked arrays, which are combined into one batch,
+    # a batch is written even without rows, so categories of empty categorical columns are kept
+    table = pa.Table.from_pandas(dataframe, preserve_index=True)
+    batch = pa.RecordBatch.from_arrays([values.combine_chunks() for values in table.columns], schema=table.schema)
+    batch = batch.replace_schema_metadata({
+        **batch.schema.metadata,
+        b"object_columns": json.dumps(objects).encode(),
+        b"missing_codes": json.dumps([f"_missing_{number}" for number in codes]).encode(),
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def frame_from_bytes(data: bytes) -> pd.DataFrame:
+    import pyarrow as pa
+
+    table = pa.ipc.open_stream(data).read_all()
+    dataframe = table.to_pandas()
+    for number in json.loads(table.schema.metadata[b"object_columns"]):
+        if dataframe.iloc[:, number].dtype != object:
+            dataframe.isetitem(number, dataframe.iloc[:, number].astype(object))
+    for name in json.loads(table.schema.metadata[b"missing_codes"]):
+        column_codes, number = dataframe.pop(name).to_numpy(), int(name.rsplit("_", 1)[1])
+        for code, value in missing_values.items():
+            rows = np.flatnonzero(column_codes == code)
+            if len(rows):
+                dataframe.iloc[rows, number] = value
+    return dataframe
+
+
+class DigestStore:
+    """
+    Local SQLite store with digest trees and results of blocks from previous comparisons.
+
+    Results are stored as data only, dataframes and series as Arrow IPC streams and other values as JSON,
+    so reading a store never runs code from it. Requires pyarrow.
+
+    Parameters:
+    path: str
+        Path to SQLite database file, created when it does not exist.
+    """
+
+    # version of the layout of stored results, part of the signature of comparisons
+    format = 2
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow
+        except ImportError as e:
+            logger.error(f"pyarrow is required for storing results of blocks: {e}")
+            raise
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS digests (side TEXT, level INTEGER, node INTEGER, digest BLOB, PRIMARY KEY (side, level, node))")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS block_results (block INTEGER PRIMARY KEY, scalars TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS block_frames (block INTEGER, name TEXT, kind TEXT, data BLOB, PRIMARY KEY (block, name))")
+
+    def signature(self) -> Optional[str]:
+        row = self.connection.execute("SELECT value FROM meta WHERE name = 'signature'").fetchone()
+        return row[0] if row else None
+
+    def reset(self, signature: str):
+        """Removes all cached digests and results, e.g. after schema change, results of older stores are dropped unread"""
+        self.connection.execute("DROP TABLE IF EXISTS results")
+        self.connection.execute("DELETE FROM digests")
+        self.connection.execute("DELETE FROM block_results")
+        self.connection.execute("DELETE FROM block_frames")
+        self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (signature,))
+
+    def load_tree(self, side: str) -> List[List[bytes]]:
+        tree = []
+        for level, node, digest in self.connection.execute("SELECT level, node, digest FROM digests WHERE side = ? ORDER BY level, node", (side,)):
+            if level == len(tree):
+                tree.append([])
+            tree[level].append(digest)
+        return tree
+
+    def save_tree(self, side: str, tree: List[List[bytes]]):
+        self.connection.execute("DELETE FROM digests WHERE side = ?", (side,))
+        self.connection.executemany(
+            "INSERT INTO digests VALUES (?, ?, ?, ?)",
+            ((side, level, node, digest) for level, digests in enumerate(tree) for node, digest in enumerate(digests))
+        )
+
+    def load_results(self) -> Dict[int, dict]:
+        """Reads results of all blocks, equal frames (e.g. empty frames of most blocks) are decoded once and copied"""
+        results = {block: json.loads(scalars) for block, scalars in self.connection.execute("SELECT block, scalars FROM block_results")}
+        decoded = {}
+        for block, name, kind, data in self.connection.execute("SELECT block, name, kind, data FROM block_frames"):
+            if data not in decoded:
+                decoded[data] = frame_from_bytes(data)
+            frame = decoded[data].copy()
+            results[block][name] = frame if kind == "frame" else frame["value"].rename(None)
+        return results
+
+    def save_results(self, removed: Iterable[int], results: Dict[int, dict]) -> set:
+        """
+        Replaces results of removed blocks with new results, returns blocks whose results cannot be stored
+        (e.g. object columns mixing types, which Arrow cannot hold).
+        """
+        self.connection.executemany("DELETE FROM block_results WHERE block = ?", ((int(block),) for block in removed))
+        self.connection.executemany("DELETE FROM block_frames WHERE block = ?", ((int(block),) for block in removed))
+        unstored = set()
+        for block, partial in results.items():
+            scalars, frames = {}, []
+            try:
+                for name, value in partial.items():
+                    if isinstance(value, pd.DataFrame):
+                        frames.append((int(block), name, "frame", frame_to_bytes(value)))
+                    elif isinstance(value, pd.Series):
+                        frames.append((int(block), name, "series", frame_to_bytes(value.to_frame("value"))))
+                    else:
+                        scalars[name] = value.item() if isinstance(value, np.generic) else value
+            except (TypeError, ValueError, NotImplementedError) as e:
+                logger.warning(f"Results of block {block} cannot be stored, the block will be compared again next time: {e}")
+                unstored.add(block)
+                continue
+            self.connection.execute("INSERT INTO block_results VALUES (?, ?)", (int(block), json.dumps(scalars)))
+            self.connection.executemany("INSERT INTO block_frames VALUES (?, ?, ?, ?)", frames)
+        return unstored
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class IncrementalCompareTwoDatasets(ParallelCompareTwoDatasets):
+    """
+    Version of CompareTwoDatasets that re-validates only parts of datasets changed since the previous comparison.
+
+    Rows of both dataframes are split into blocks by hash of the join key. Digests of blocks and a tree of digests
+    over them are kept in a local SQLite store together with value mismatch results of every block. Next comparison
+    recomputes digests, descends the tree only into changed nodes and compares just the rows of changed blocks,
+    results of other blocks are reused. Hashing rows is still linear in the size of the tables, but merging
+    and comparing values depends only on the size of the change. Schemas and row counts are recomputed on every run,
+    when the schema or keys change the store is reset.
+
+    Parameters:
+    legacy_df: pd.DataFrame
+        Dataframe from legacy system
+    cloud_df: pd.DataFrame
+        Dataframe from cloud system
+    legacy_key: str or list (optional)
+        Column or list of columns of composite key for joining dataframes on.
+    cloud_key: str or list (optional)
+        Column or list of columns of composite key for joining dataframes on, in the same order as legacy_key.
+    join_columns: list or str (optional)
+        Column for joining dataframes on, or list of legacy key and cloud key (each a column or list of columns).
+    store: str
+        Path to SQLite file with digests and results of the previous comparison, results are stored with pyarrow.
+    blocks: int
+        Number of blocks, more blocks give smaller re-comparisons but bigger store.
+    fanout: int
+        Number of children of every node in the tree of digests.
+    workers: int
+        Number of worker processes comparing changed blocks.
+    options:
+        Other parameters of CompareTwoDatasets, e.g. fingerprint or duplicate_keys.
+
+    Either (legacy_key, cloud_key) or join_columns parameters required.
+    Attribute changed_blocks holds blocks compared in the last run.
+    """
+
+    def __init__(self, legacy_df: pd.DataFrame, cloud_df: pd.DataFrame, legacy_key: Optional[Union[str, list]] = None, cloud_key: Optional[Union[str, list]] = None, join_columns: Optional[Union[list, str]] = None, store: str = "comparison_digests.sqlite", blocks: int = 1024, fanout: int = 16, workers: int = 1, **options):
+        super().__init__(legacy_df, cloud_df, legacy_key, cloud_key, join_columns, workers, blocks, **options)
+        self.store = store
+        self.blocks = blocks
+        self.fanout = fanout
+
+    def signature(self) -> str:
+        """Describes keys, schemas, comparison rules and blocks, cached results are valid only for the same signature"""
+        return json.dumps({
+            "join_columns": self.join_columns,
+            "duplicate_keys": self.duplicate_keys,
+            "comparator": self.comparator.describe(),
+            "legacy": [[column, str(dtype)] for column, dtype in self.legacy_df.dtypes.items()],
+            "cloud": [[column, str(dtype)] for column, dtype in self.cloud_df.dtypes.items()],
+            "blocks": self.blocks,
+            "fanout": self.fanout,
+            "format": DigestStore.format,
+            "pandas": pd.__version__,
+        })
+
+    def value_mismatches(self):
+        """Checking mismatches in values of blocks changed since the previous comparison"""
+        self.matched_id_datatypes = self.matched_key_datatypes()
+        if not self.matched_id_datatypes:
+            logger.warning("Id columns are not the same datatypes!")
+            return
+
+        self.encode_keys()
+        legacy_key, cloud_key = self.key_columns()
+        with self.phase("profile_keys"):
+            offsets = self.profile_keys(self.legacy_df[legacy_key].value_counts(dropna=False), self.cloud_df[cloud_key].value_counts(dropna=False))
+            self.record_counts(rows=self.estimated_merged_rows)
+        store = DigestStore(self.store)
+        try:
+            signature = self.signature()
+            if store.signature() != signature:
+                logger.info("Digest store is empty or outdated, comparing all blocks...")
+                store.reset(signature)
+
+            with self.phase("digests"):
+                # composite keys are split into blocks by their columns and _key is left out of digests,
+                # as codes of unchanged keys change whenever other keys are added or removed
+                legacy_blocks, cloud_blocks = self.block_keys(self.legacy_keys), self.block_keys(self.cloud_keys)
+                legacy_digests, legacy_positions = block_digests(self.legacy_df, legacy_blocks, self.blocks, self.digest_columns(self.legacy_df))
+                cloud_digests, cloud_positions = block_digests(self.cloud_df, cloud_blocks, self.blocks, self.digest_columns(self.cloud_df))
+                legacy_tree = digest_tree(legacy_digests, self.fanout)
+                cloud_tree = digest_tree(cloud_digests, self.fanout)
+                self.changed_blocks = sorted(
+                    changed_blocks(store.load_tree("legacy"), legacy_tree, self.fanout)
+                    | changed_blocks(store.load_tree("cloud"), cloud_tree, self.fanout)
+                )
+                self.record_counts(blocks=self.blocks, changed_blocks=len(self.changed_blocks))
+            logger.info(f"Re-comparing {len(self.changed_blocks)} of {self.blocks} blocks...")
+
+            empty = np.array([], dtype=np.int64)
+            tasks = []
+            task_blocks = []
+            for block in self.changed_blocks:
+                legacy_block = self.legacy_df.iloc[legacy_positions.get(block, empty)]
+                cloud_block = self.cloud_df.iloc[cloud_positions.get(block, empty)]
+                if legacy_block.empty and cloud_block.empty:
+                    continue
+                keys = pd.concat([legacy_block[legacy_key], cloud_block[cloud_key]]).unique()
+                tasks.append((legacy_block, cloud_block, self.partition_options(), pd.Series(0, index=keys)))
+                task_blocks.append(block)
+            with self.phase("compare_partitions"):
+                results = dict(zip(task_blocks, self.run_partitions(tasks)))
+                self.record_counts(partitions=len(tasks))
+
+            unstored = store.save_results(self.changed_blocks, results)
+            if unstored:
+                # blank leaves of blocks without stored results, so they differ from digests of the next comparison
+                legacy_tree = digest_tree([b"" if block in unstored else digest for block, digest in enumerate(legacy_digests)], self.fanout)
+                cloud_tree = digest_tree([b"" if block in unstored else digest for block, digest in enumerate(cloud_digests)], self.fanout)
+            store.save_tree("legacy", legacy_tree)
+            store.save_tree("cloud", cloud_tree)
+            store.commit()
+            cached = store.load_results()
+            partials = [results[block] if block in results else cached[block] for block in sorted(set(cached) | set(results))]
+        finally:
+            store.close()
+
+        if not partials:
+            partials = self.run_partitions([(self.legacy_df, self.cloud_df, self.partition_options(), pd.Series(0, index=self.legacy_df[legacy_key].iloc[:0]))])
+        if self.composite_key:
+            offsets = offsets.set_axis(self.key_values(offsets.index))
+        with self.phase("combine"):
+            self._combine_partial_results([self.relabel_partial(partial, offsets) for partial in partials])
+
+    def block_keys(self, keys: List[str]) -> Union[str, List[str]]:
+        return keys if self.composite_key else keys[0]
+
+    def digest_columns(self, dataframe: pd.DataFrame) -> Optional[List[str]]:
+        return [column for column in dataframe.columns if column != "_key"] if self.composite_key else None
+
+    def key_values(self, codes: pd.Index) -> pd.MultiIndex:
+        """Returns values of composite key columns (named as in the legacy dataframe) for the codes of the keys"""
+        names = self.legacy_keys + ["_key"]
+        keys = pd.concat([
+            self.legacy_df[names],
+            self.cloud_df[self.cloud_keys + ["_key"]].set_axis(names, axis=1)
+        ]).drop_duplicates("_key").set_index("_key")
+        return pd.MultiIndex.from_frame(keys.reindex(codes))
+
+    def relabel_partial(self, partial: dict, offsets: pd.Series) -> dict:
+        """
+        Relabels rows of cached block results from ranks within the key to positions in the merged datasets.
+
+        Offsets of composite keys are indexed by values of the key columns, as codes differ between comparisons.
+        """
+        def relabel(dataframe):
+            if dataframe is None:
+                return None
+            keys = self.merged_key_values(dataframe) if self.composite_key else self.merged_keys(dataframe)
+            return dataframe.set_axis(offsets.reindex(keys).to_numpy().astype(np.int64) + dataframe.index.to_numpy())
+
+        relabeled = dict(partial)
+        for name in ("legacy_unique", "cloud_unique", "mismatched_dataframe", "duplicated_dataframe"):
+            relabeled[name] = relabel(partial[name])
+        if relabeled["duplicated_dataframe"] is None:
+            relabeled["duplicates"] = partial["duplicates"].iloc[:0]
+        else:
+            relabeled["duplicates"] = pd.Series(True, index=relabeled["duplicated_dataframe"].index)
+        return relabeled
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from typing import List, Optional
+
+
+class MismatchMatrix:
+    """
+    Mismatch state of compared columns for common rows of the merged dataframe, kept as packed NumPy bool matrix.
+
+    One byte per cell instead of one int64 column per compared field on the merged dataframe.
+    Matrix is stored column by column (Fortran order), so setting and counting a column reads contiguous memory.
+
+    Parameters:
+    index: pd.Index
+        Labels of the rows in the merged dataframe
+    columns: list
+        Compared columns
+    """
+
+    def __init__(self, index: pd.Index, columns: List[str]):
+        self.index = index
+        self.columns = list(columns)
+        self.positions = {column: position for position, column in enumerate(self.columns)}
+        self.values = np.zeros((len(index), len(self.columns)), dtype=bool, order="F")
+
+    @classmethod
+    def from_frame(cls, dataframe: pd.DataFrame, columns: List[str]):
+        """Builds matrix from dataframe with <column>_mismatch columns"""
+        matrix = cls(dataframe.index, columns)
+        for column in columns:
+            matrix.set_column(column, dataframe[column + "_mismatch"].to_numpy() > 0)
+        return matrix
+
+    def set_column(self, column: str, mismatch: np.ndarray):
+        """Sets mismatch flags of one compared column"""
+        self.values[:, self.positions[column]] = mismatch
+
+    def column_counts(self) -> pd.Series:
+        """Number of mismatched values per compared column"""
+        return pd.Series(self.values.sum(axis=0), index=self.columns, dtype=np.int64)
+
+    def row_sums(self) -> np.ndarray:
+        """Number of mismatched values per row"""
+        return self.values.sum(axis=1)
+
+    def total(self):
+        """Number of all mismatched values"""
+        return np.int64(self.values.sum())
+
+    def mismatched_rows(self) -> np.ndarray:
+        """Positions of rows with at least one mismatched value"""
+        return np.flatnonzero(self.values.any(axis=1))
+
+    def to_frame(self, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """Materializes <column>_mismatch columns and mismatch_sum for selected row positions (all rows by default)"""
+        values = self.values if rows is None else self.values[rows]
+        index = self.index if rows is None else self.index[rows]
+        if not self.columns:
+            return pd.DataFrame(index=index)
+        frame = pd.DataFrame(values.astype(np.int64), index=index, columns=[column + "_mismatch" for column in self.columns])
+        frame["mismatch_sum"] = values.sum(axis=1).astype(np.int64)
+        return frame
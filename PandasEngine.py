@@ -0,0 +1,257 @@
+import logging
+import numpy as np
+import pandas as pd
+
+from typing import Dict, Iterator, List, Optional, Union
+
+from ColumnComparator import ColumnComparator
+from ComparisonEngine import ComparisonEngine
+from HyperLogLog import HyperLogLog
+from MismatchMatrix import MismatchMatrix
+
+logger = logging.getLogger(__name__)
+
+
+class PandasEngine(ComparisonEngine):
+    """
+    Comparison engine running on pandas dataframes in memory.
+
+    Mismatch state of common rows is kept in MismatchMatrix, mismatched rows are materialized only once.
+    """
+
+    name = "pandas"
+    local = True
+
+    def is_dataframe(self, dataframe) -> bool:
+        return isinstance(dataframe, pd.DataFrame)
+
+    def dtypes(self, dataframe: pd.DataFrame) -> pd.Series:
+        return dataframe.dtypes
+
+    def count(self, dataframe: pd.DataFrame) -> int:
+        return len(dataframe.index)
+
+    def key_counts(self, dataframe: pd.DataFrame, key: str) -> pd.Series:
+        return dataframe[key].value_counts(dropna=False)
+
+    def duplicate_keys(self, counts: pd.Series) -> pd.Series:
+        return counts[counts > 1]
+
+    @staticmethod
+    def merged_key_rows(legacy_counts: pd.Series, cloud_counts: pd.Series, duplicate_keys: str = "keep") -> pd.Series:
+        """
+        Returns number of rows of every key in the outer merge of two dataframes, without merging them, sorted by the key as the merge.
+
+        With "keep" strategy every key gives product of its row counts from both sides.
+        """
+        counts = pd.concat([legacy_counts, cloud_counts], axis=1).fillna(0)
+        legacy_rows, cloud_rows = counts.iloc[:, 0], counts.iloc[:, 1]
+        if duplicate_keys == "deduplicate":
+            rows = pd.Series(1, index=counts.index)
+        elif duplicate_keys == "occurrence":
+            rows = np.maximum(legacy_rows, cloud_rows)
+        else:
+            rows = legacy_rows.clip(lower=1) * cloud_rows.clip(lower=1)
+        return rows.astype(np.int64).sort_index()
+
+    def total_rows(self, rows: pd.Series) -> int:
+        return int(rows.sum())
+
+    def first_positions(self, rows: pd.Series) -> pd.Series:
+        return rows.cumsum() - rows
+
+    def select_columns(self, dataframe: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+        return dataframe[columns]
+
+    def empty(self, dataframe: pd.DataFrame) -> pd.DataFrame:
+        return dataframe.iloc[:0]
+
+    @staticmethod
+    def sorted_codes(values: pd.Series):
+        """
+        Returns codes of values in their sorted order with nulls last (in order of appearance when values cannot be sorted)
+        and number of codes, one more than distinct values for the nulls.
+        """
+        codes, uniques = pd.factorize(values)
+        ranks = np.arange(len(uniques) + 1, dtype=np.int64)
+        try:
+            ranks[uniques.argsort(kind="stable")] = np.arange(len(uniques))
+        except TypeError:
+            pass
+        # null values get code -1 from factorize, which takes the last rank
+        return ranks[codes], len(ranks)
+
+    def encode_keys(self, legacy_df: pd.DataFrame, cloud_df: pd.DataFrame, legacy_keys: List[str], cloud_keys: List[str]):
+        """
+        Key columns are factorized column by column over both dataframes and combined into one int64 code,
+        compressed whenever the combined range would overflow. Dataframes are shallow copies, data is not copied.
+        """
+        codes, size = np.zeros(len(legacy_df) + len(cloud_df), dtype=np.int64), 1
+        for legacy_key, cloud_key in zip(legacy_keys, cloud_keys):
+            column_codes, count = self.sorted_codes(pd.concat([legacy_df[legacy_key], cloud_df[cloud_key]], ignore_index=True))
+            if size * count >= 1 << 63:
+                codes, uniques = pd.factorize(codes, sort=True)
+                size = len(uniques)
+            codes = codes * count + column_codes
+            size = size * max(count, 1)
+        legacy_df, cloud_df = legacy_df.copy(deep=False), cloud_df.copy(deep=False)
+        legacy_df["_key"] = codes[:len(legacy_df)]
+        cloud_df["_key"] = codes[len(legacy_df):]
+        return legacy_df, cloud_df
+
+    def decode_keys(self, merged: pd.DataFrame, keys: List[str], dtypes: pd.Series) -> pd.DataFrame:
+        """Columns are replaced in place, integer keys get back their datatype after missing values of the merge are filled"""
+        for key in keys:
+            position = merged.columns.get_loc(key + "_legacy")
+            values = merged.pop(key + "_legacy").where(merged["_merge"] != "right_only", merged.pop(key + "_cloud"))
+            if values.dtype != dtypes[key]:
+                try:
+                    values = values.astype(dtypes[key])
+                except (TypeError, ValueError):
+                    pass
+            merged.insert(position, key, values)
+        del merged["_key"]
+        return merged
+
+    @staticmethod
+    def mix_hashes(hashes: np.ndarray) -> np.ndarray:
+        """Scrambles 64-bit hashes (splitmix64 finalizer), so sums of mixed pair hashes keep keys bound to values"""
+        hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return hashes ^ (hashes >> np.uint64(31))
+
+    @staticmethod
+    def column_statistics(values: pd.Series, nulls: np.ndarray) -> dict:
+        """Statistics of the column, min and max are skipped for object columns as comparing Python objects is slow"""
+        statistics = {"dtype": str(values.dtype), "rows": len(values), "nulls": int(nulls.sum()), "min": None, "max": None, "sum": None, "mean": None}
+        if values.dtype != object:
+            statistics["min"], statistics["max"] = values.min(), values.max()
+        if pd.api.types.is_numeric_dtype(values):
+            statistics["sum"], statistics["mean"] = values.sum(), values.mean()
+        return statistics
+
+    def column_profiles(self, dataframe: pd.DataFrame, key: str, columns: List[str]) -> pd.DataFrame:
+        """Every column is hashed once, the hashes give both the checksum and the HyperLogLog distinct count"""
+        keys = dataframe[key]
+        key_hashes = pd.util.hash_pandas_object(keys, index=False, categorize=False).to_numpy()
+        profiles = {key: {**self.column_statistics(keys, keys.isna().to_numpy()), "distinct": keys.nunique(dropna=False), "checksum": int(key_hashes.sum())}}
+        mixed_keys = self.mix_hashes(key_hashes)
+        for column in columns:
+            values = dataframe[column]
+            nulls = values.isna().to_numpy()
+            statistics = self.column_statistics(values, nulls)
+            try:
+                hashes = pd.util.hash_pandas_object(values, index=False, categorize=False).to_numpy()
+            except TypeError:
+                statistics.update(distinct=None, checksum=None)
+            else:
+                statistics["distinct"] = HyperLogLog().add(hashes[~nulls]).count()
+                statistics["checksum"] = int(self.mix_hashes(mixed_keys ^ hashes).sum())
+            profiles[column] = statistics
+        return pd.DataFrame.from_dict(profiles, orient="index", dtype=object)
+
+    def handle_duplicate_keys(self, dataframe: pd.DataFrame, key: str, duplicate_keys: str) -> pd.DataFrame:
+        if duplicate_keys == "deduplicate":
+            return dataframe.drop_duplicates(subset=key)
+        if duplicate_keys == "occurrence":
+            occurrence = dataframe.groupby(key, sort=False, dropna=False).cumcount().to_numpy()
+            dataframe = dataframe.copy(deep=False)
+            dataframe["_occurrence"] = occurrence
+            return dataframe
+        return dataframe
+
+    def outer_join(self, legacy_df: pd.DataFrame, cloud_df: pd.DataFrame, join_columns: Union[list, str], left_on: Union[list, str], right_on: Union[list, str]) -> pd.DataFrame:
+        if isinstance(join_columns, str):
+            try:
+                return legacy_df.merge(
+                    cloud_df,
+                    how="outer",
+                    on=left_on,
+                    suffixes=("_legacy", "_cloud"),
+                    indicator=True
+                )
+            except KeyError as e:
+                logger.error(f"Column {join_columns} not found in one or both dataframes: {e}")
+                raise
+            except ValueError as e:
+                logger.error(f"Invalid values during merge {e}")
+                raise
+        try:
+            return legacy_df.merge(
+                cloud_df,
+                how="outer",
+                left_on=left_on,
+                right_on=right_on,
+                suffixes=("_legacy", "_cloud"),
+                indicator=True
+            )
+        except KeyError as e:
+            logger.error(f"Either column {join_columns[0]} or {join_columns[1]} not found: {e}")
+            raise
+        except ValueError as e:
+            logger.error(f"Invalid values during merge {e}")
+            raise
+
+    def drop_columns(self, dataframe: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+        return dataframe.drop(columns=columns)
+
+    def split(self, merged: pd.DataFrame):
+        """Rows are taken once by codes of _merge, taken rows are new dataframes and need no further copy"""
+        codes, categories = merged["_merge"].cat.codes.to_numpy(), merged["_merge"].cat.categories
+        return tuple(merged.take(np.flatnonzero(codes == categories.get_loc(side))) for side in ("left_only", "right_only", "both"))
+
+    def column_mismatches(self, common: pd.DataFrame, columns: List[str], comparator: ColumnComparator, legacy_dtypes: pd.Series, cloud_dtypes: pd.Series) -> MismatchMatrix:
+        """Mismatch flags from kernels of the comparator are set column by column into the matrix, merged columns are not copied"""
+        matrix = MismatchMatrix(common.index, columns)
+        for column in columns:
+            matrix.set_column(column, comparator.mismatches(column, common[column + "_legacy"], common[column + "_cloud"], legacy_dtypes[column], cloud_dtypes[column]))
+        return matrix
+
+    def mismatch_counts(self, state: MismatchMatrix) -> pd.Series:
+        return state.column_counts()
+
+    @staticmethod
+    def materialize_mismatches(common: pd.DataFrame, state: MismatchMatrix, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """Returns common rows at given positions (all by default) with <column>_mismatch and mismatch_sum columns"""
+        selected = common if rows is None else common.iloc[rows]
+        return pd.concat([selected, state.to_frame(rows)], axis=1)
+
+    def mismatched_rows(self, common: pd.DataFrame, state: MismatchMatrix) -> pd.DataFrame:
+        return self.materialize_mismatches(common, state, state.mismatched_rows())
+
+    def duplicated(self, common: pd.DataFrame) -> pd.Series:
+        return common.duplicated()
+
+    def duplicated_count(self, duplicated: pd.Series) -> int:
+        return int(duplicated.sum())
+
+    def duplicated_rows(self, common: pd.DataFrame, state: MismatchMatrix, duplicated: pd.Series) -> pd.DataFrame:
+        rows = self.materialize_mismatches(common, state, np.flatnonzero(duplicated.to_numpy()))
+        rows["duplicate"] = True
+        return rows
+
+    def has_duplicated_rows(self, dataframe: pd.DataFrame) -> bool:
+        return bool(dataframe.duplicated().any())
+
+    def sample(self, dataframe: pd.DataFrame, size: int, seed: int) -> pd.DataFrame:
+        """Rows with the smallest random keys are kept (bottom-k reservoir), so the same seed gives the same sample"""
+        if len(dataframe) <= size:
+            return dataframe
+        keys = np.random.default_rng(seed).random(len(dataframe))
+        return dataframe.iloc[np.sort(np.argpartition(keys, size)[:size])]
+
+    def sample_mismatches(self, mismatched: pd.DataFrame, columns: List[str], size: int, seed: int) -> Dict[str, pd.DataFrame]:
+        """Random keys are drawn once per row, so samples of different columns share rows where possible"""
+        keys = np.random.default_rng(seed).random(len(mismatched))
+        samples = {}
+        for column in columns:
+            positions = np.flatnonzero(mismatched[column + "_mismatch"].to_numpy() > 0)
+            if len(positions) > size:
+                positions = np.sort(positions[np.argpartition(keys[positions], size)[:size]])
+            if len(positions) > 0:
+                samples[column] = mismatched.iloc[positions]
+        return samples
+
+    def batches(self, dataframe: pd.DataFrame, batch_rows: int) -> Iterator[pd.DataFrame]:
+        for start in range(0, max(len(dataframe), 1), batch_rows):
+            yield dataframe.iloc[start:start + batch_rows]
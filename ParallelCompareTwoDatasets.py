@@ -0,0 +1,106 @@
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Union
+
+from CompareTwoDatasets import CompareTwoDatasets
+
+logger = logging.getLogger(__name__)
+
+
+def hash_partitions(keys: Union[pd.Series, pd.DataFrame], partitions: int) -> np.ndarray:
+    """Returns number of the partition for every key (row of key columns), the same key gives the same partition in both dataframes"""
+    if isinstance(keys, pd.DataFrame):
+        hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    else:
+        hashes = pd.util.hash_array(keys.to_numpy())
+    return (hashes % np.uint64(partitions)).astype(np.int64)
+
+
+def split_by_hash(dataframe: pd.DataFrame, key: str, partitions: int) -> List[pd.DataFrame]:
+    """Splits dataframe into hash partitions of the key, keeping the original order of rows within partition"""
+    numbers = hash_partitions(dataframe[key], partitions)
+    return [dataframe[numbers == number] for number in range(partitions)]
+
+
+def compare_partition(legacy_df: pd.DataFrame, cloud_df: pd.DataFrame, options: dict, offsets: pd.Series) -> dict:
+    """Compares one pair of partitions with options from partition_options, runs in the worker process"""
+    compare = CompareTwoDatasets(legacy_df, cloud_df, **options)
+    compare.schema_difference()
+    compare.value_mismatches()
+    return compare._partial_results(offsets)
+
+
+class ParallelCompareTwoDatasets(CompareTwoDatasets):
+    """
+    Version of CompareTwoDatasets that looks for value mismatches on multiple cores.
+
+    Both dataframes are hash-partitioned on the join key, so rows with the same key always land in the same partition,
+    and every pair of partitions is compared in a separate worker process. Results of partitions are combined
+    into the attributes of CompareTwoDatasets and give the same report() as the serial comparison.
+
+    Parameters:
+    legacy_df: pd.DataFrame
+        Dataframe from legacy system
+    cloud_df: pd.DataFrame
+        Dataframe from cloud system
+    legacy_key: str or list (optional)
+        Column or list of columns of composite key for joining dataframes on.
+    cloud_key: str or list (optional)
+        Column or list of columns of composite key for joining dataframes on, in the same order as legacy_key.
+    join_columns: list or str (optional)
+        Column for joining dataframes on, or list of legacy key and cloud key (each a column or list of columns).
+    workers: int (optional)
+        Number of worker processes, number of CPUs by default. With 1 worker partitions are compared in the current process.
+    partitions: int (optional)
+        Number of hash partitions, equal to number of workers by default.
+    options:
+        Other parameters of CompareTwoDatasets, e.g. fingerprint or duplicate_keys.
+
+    Either (legacy_key, cloud_key) or join_columns parameters required.
+    Attribute duplicates holds only duplicated rows and merged dataframes are not kept.
+    """
+
+    def __init__(self, legacy_df: pd.DataFrame, cloud_df: pd.DataFrame, legacy_key: Optional[Union[str, list]] = None, cloud_key: Optional[Union[str, list]] = None, join_columns: Optional[Union[list, str]] = None, workers: Optional[int] = None, partitions: Optional[int] = None, **options):
+        super().__init__(legacy_df, cloud_df, legacy_key, cloud_key, join_columns, **options)
+        self.workers = workers or os.cpu_count() or 1
+        self.partitions = partitions or self.workers
+
+    def value_mismatches(self):
+        """Checking mismatches in values of hash partitions in a pool of worker processes"""
+        self.matched_id_datatypes = self.matched_key_datatypes()
+        if not self.matched_id_datatypes:
+            logger.warning("Id columns are not the same datatypes!")
+            return
+
+        self.encode_keys()
+        legacy_key, cloud_key = self.key_columns()
+        with self.phase("profile_keys"):
+            offsets = self.profile_keys(self.legacy_df[legacy_key].value_counts(dropna=False), self.cloud_df[cloud_key].value_counts(dropna=False))
+            self.record_counts(rows=self.estimated_merged_rows)
+        with self.phase("partition"):
+            legacy_partitions = split_by_hash(self.legacy_df, legacy_key, self.partitions)
+            cloud_partitions = split_by_hash(self.cloud_df, cloud_key, self.partitions)
+            offset_numbers = hash_partitions(offsets.index.to_series(), self.partitions)
+            tasks = [
+                (legacy_partitions[number], cloud_partitions[number], self.partition_options(), offsets[offset_numbers == number])
+                for number in range(self.partitions)
+                if not (legacy_partitions[number].empty and cloud_partitions[number].empty)
+            ] or [(self.legacy_df, self.cloud_df, self.partition_options(), offsets)]
+            self.record_counts(partitions=len(tasks))
+
+        with self.phase("compare_partitions"):
+            partials = self.run_partitions(tasks)
+        with self.phase("combine"):
+            self._combine_partial_results(partials)
+
+    def run_partitions(self, tasks: List[tuple]) -> List[dict]:
+        """Runs compare_partition for every task, in the pool of worker processes when there is more than one task"""
+        logger.info(f"Comparing {len(tasks)} partitions on {self.workers} workers...")
+        if self.workers == 1 or len(tasks) <= 1:
+            return [compare_partition(*task) for task in tasks]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(compare_partition, *zip(*tasks)))
@@ -0,0 +1,428 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+import traceback
+import pandas as pd
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import List, Optional, Union
+
+from ArrowFile import ArrowFile
+from ColumnComparator import ColumnComparator
+from CompareTwoDatasets import CompareTwoDatasets
+from IncrementalCompareTwoDatasets import IncrementalCompareTwoDatasets
+from ParallelCompareTwoDatasets import ParallelCompareTwoDatasets
+from SampledCompareTwoDatasets import SampledCompareTwoDatasets
+from SqlCompareTwoDatasets import SqlCompareTwoDatasets, SqlTable
+from StreamingCompareTwoDatasets import StreamingCompareTwoDatasets
+
+logger = logging.getLogger(__name__)
+
+modes = {
+    "serial": CompareTwoDatasets,
+    "parallel": ParallelCompareTwoDatasets,
+    "sampled": SampledCompareTwoDatasets,
+    "incremental": IncrementalCompareTwoDatasets,
+    "streaming": StreamingCompareTwoDatasets,
+    "sql": SqlCompareTwoDatasets,
+}
+
+pair_fields = {"name", "legacy", "cloud", "legacy_key", "cloud_key", "join_columns", "columns", "mode", "options", "comparator", "memory_mb"}
+file_extensions = (".csv", ".parquet", ".pq", ".arrow", ".feather", ".ipc")
+arrow_extensions = (".parquet", ".pq", ".arrow", ".feather", ".ipc")
+
+
+def build_comparator(rules: dict) -> ColumnComparator:
+    """Creates ColumnComparator from rules of the manifest, rules of single columns are given in columns"""
+    rules = dict(rules)
+    columns = {column: ColumnComparator(**column_rules) for column, column_rules in rules.pop("columns", {}).items()}
+    return ColumnComparator(**rules, columns=columns or None)
+
+
+def read_source(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Reads CSV, Parquet or Arrow IPC file into dataframe, only its columns listed in columns when given"""
+    if path.endswith(".csv"):
+        return pd.read_csv(path, usecols=None if columns is None else lambda column: column in columns)
+    if columns is not None:
+        columns = [column for column in ArrowFile(path).columns if column in columns]
+    if path.endswith((".parquet", ".pq")):
+        return pd.read_parquet(path, columns=columns)
+    return ArrowFile(path).read(columns)
+
+
+def key_columns(pair: dict) -> List[List[str]]:
+    """Returns lists of legacy and cloud key columns of the pair, legacy_key and cloud_key take precedence over join_columns"""
+    if pair.get("legacy_key") is not None and pair.get("cloud_key") is not None:
+        keys = [pair["legacy_key"], pair["cloud_key"]]
+    else:
+        join_columns = pair.get("join_columns")
+        keys = [join_columns, join_columns] if isinstance(join_columns, str) else join_columns or [[], []]
+    return [[key] if isinstance(key, str) else list(key) for key in keys]
+
+
+def build_comparison(pair: dict) -> CompareTwoDatasets:
+    """
+    Creates comparison of the pair in its mode.
+
+    Tables of SQLite databases are compared with SqlCompareTwoDatasets, streaming mode reads the files chunk by chunk,
+    pairs of Parquet or Arrow files are read with from_files and other files are read into dataframes,
+    only the key columns and columns of the pair when it lists them.
+    """
+    options = {**pair["options"], **{name: pair[name] for name in ("legacy_key", "cloud_key", "join_columns") if name in pair}}
+    if "comparator" in pair:
+        options["comparator"] = build_comparator(pair["comparator"])
+    legacy, cloud, mode = pair["legacy"], pair["cloud"], pair["mode"]
+    if mode == "sql":
+        def table(source):
+            database = source["database"]
+            return SqlTable(lambda: sqlite3.connect(database, check_same_thread=False), source["table"])
+        return SqlCompareTwoDatasets(table(legacy), table(cloud), **options)
+    if mode == "streaming":
+        return StreamingCompareTwoDatasets(legacy, cloud, **options)
+    if legacy.endswith(arrow_extensions) and cloud.endswith(arrow_extensions):
+        return modes[mode].from_files(legacy, cloud, columns=pair.get("columns"), **options)
+    columns = pair.get("columns")
+    if columns is None:
+        return modes[mode](read_source(legacy), read_source(cloud), **options)
+    legacy_keys, cloud_keys = key_columns(pair)
+    return modes[mode](read_source(legacy, legacy_keys + columns), read_source(cloud, cloud_keys + columns), **options)
+
+
+def run_pair(pair: dict) -> dict:
+    """Compares one pair of the manifest, runs in the worker, returns summary and report of the comparison"""
+    start = time.perf_counter()
+    compare = build_comparison(pair)
+    try:
+        compare.compare()
+        return {"summary": compare.summary(), "report": compare.report(), "seconds": time.perf_counter() - start}
+    finally:
+        if isinstance(compare, SqlCompareTwoDatasets):
+            compare.legacy_table.pool.close()
+            compare.cloud_table.pool.close()
+
+
+class ResultStore:
+    """
+    Local SQLite store with status, summary and report of every compared pair.
+
+    A pair is "running" from its admission until its comparison ends as "done" or "failed",
+    pairs left "running" by a crashed run are compared again by the next run.
+
+    Parameters:
+    path: str
+        Path to SQLite database file, created when it does not exist.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pairs (name TEXT PRIMARY KEY, signature TEXT, status TEXT, memory_mb REAL, "
+            "started TEXT, finished TEXT, seconds REAL, summary TEXT, report TEXT, error TEXT)"
+        )
+
+    def status(self, name: str) -> Optional[tuple]:
+        """Status and signature of the pair from the last run, None when the pair was never compared"""
+        return self.connection.execute("SELECT status, signature FROM pairs WHERE name = ?", (name,)).fetchone()
+
+    def start(self, name: str, signature: str, memory_mb: float):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO pairs (name, signature, status, memory_mb, started) VALUES (?, ?, 'running', ?, ?)",
+            (name, signature, memory_mb, datetime.now().isoformat(timespec="seconds"))
+        )
+        self.connection.commit()
+
+    def finish(self, name: str, result: dict):
+        self.connection.execute(
+            "UPDATE pairs SET status = 'done', finished = ?, seconds = ?, summary = ?, report = ?, error = NULL WHERE name = ?",
+            (datetime.now().isoformat(timespec="seconds"), result["seconds"], json.dumps(result["summary"]), result["report"], name)
+        )
+        self.connection.commit()
+
+    def fail(self, name: str, error: str, seconds: float):
+        self.connection.execute(
+            "UPDATE pairs SET status = 'failed', finished = ?, seconds = ?, error = ? WHERE name = ?",
+            (datetime.now().isoformat(timespec="seconds"), seconds, error, name)
+        )
+        self.connection.commit()
+
+    def summary(self, name: str) -> Optional[dict]:
+        row = self.connection.execute("SELECT summary FROM pairs WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def report(self, name: str) -> Optional[str]:
+        row = self.connection.execute("SELECT report FROM pairs WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def results(self, names: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Status of every pair (of the given pairs only, when names are given) with main counts of their summaries,
+        error is the last line of the traceback of failed pairs.
+        """
+        records = []
+        for name, status, memory_mb, started, finished, seconds, summary, error in self.connection.execute(
+            "SELECT name, status, memory_mb, started, finished, seconds, summary, error FROM pairs ORDER BY name"
+        ):
+            if names is not None and name not in names:
+                continue
+            record = {"name": name, "status": status, "memory_mb": memory_mb, "started": started, "finished": finished, "seconds": seconds}
+            if summary:
+                summary = json.loads(summary)
+                values = summary["value_mismatches"]
+                record.update(
+                    schema_differences=len(summary["schema"]["missing_from_legacy"]) + len(summary["schema"]["missing_from_cloud"]) + len(summary["schema"]["mismatched_types"]),
+                    legacy_rows=summary["row_count"]["legacy"],
+                    cloud_rows=summary["row_count"]["cloud"],
+                    legacy_unique=values.get("legacy_unique"),
+                    cloud_unique=values.get("cloud_unique"),
+                    mismatched_values=values.get("mismatched_values"),
+                    duplicated_rows=values.get("duplicated_rows"),
+                )
+            record["error"] = error.strip().splitlines()[-1] if error else None
+            records.append(record)
+        results = pd.DataFrame.from_records(records)
+        counts = ["schema_differences", "legacy_rows", "cloud_rows", "legacy_unique", "cloud_unique", "mismatched_values", "duplicated_rows"]
+        return results.astype({column: "Int64" for column in counts if column in results.columns})
+
+    def close(self):
+        self.connection.close()
+
+
+class ReconciliationRunner:
+    """
+    Runs comparisons of many pairs of legacy and cloud datasets listed in a manifest, results are kept in a local SQLite store.
+
+    Manifest is a JSON file (or its content as dictionary) with "pairs", a list of pairs, and optional "defaults" applied to every pair.
+    Pair has a unique name, legacy and cloud sources, keys (legacy_key and cloud_key or join_columns) and optionally
+    mode (one of modes, "serial" by default), options of the comparison mode, comparator rules (parameters of ColumnComparator,
+    rules of single columns under "columns"), list of compared columns (other columns of the files are not read,
+    not supported in streaming and sql modes) and memory_mb estimate.
+    Source is a path to CSV, Parquet or Arrow IPC file (relative to the manifest) or {"database": path, "table": name}
+    of SQLite table, compared in "sql" mode.
+    ```
+    {"defaults": {"options": {"duplicate_keys": "occurrence"}},
+     "pairs": [{"name": "accounts", "legacy": "legacy/accounts.parquet", "cloud": "cloud/accounts.parquet",
+                "legacy_key": "account_id", "cloud_key": "account_num", "comparator": {"columns": {"balance": {"atol": 0.01}}}}]}
+    ```
+
+    Pairs are compared largest first in a pool of workers. Pair is admitted only while memory estimates of running pairs
+    and its own fit into memory_limit_mb, otherwise smaller pairs that fit are admitted first, a pair bigger than the limit
+    runs alone. Memory of a pair is estimated from sizes of its files, multiplied by memory_factors of their formats
+    (compressed Parquet expands more than CSV), or given by memory_mb.
+    Status of every pair is committed to the store when it is admitted and when it ends, with summary() and report()
+    of done pairs and traceback of failed ones. Next run skips pairs done with the same signature (pair of the manifest,
+    sizes and modification times of its files), so a run resumes after crash and a failed wave reruns only failed and changed pairs.
+
+    Parameters:
+    manifest: str or dict
+        Path to JSON manifest or its content.
+    store: str
+        Path to SQLite file with results.
+    workers: int (optional)
+        Number of pairs compared at the same time, number of CPUs by default.
+    executor: str
+        "process" compares pairs in worker processes, "thread" in threads of this process.
+    memory_limit_mb: float (optional)
+        Sum of memory estimates of running pairs, 80% of physical memory by default.
+    """
+
+    memory_factors = {".csv": 2.0, ".parquet": 6.0, ".pq": 6.0}
+    default_memory_factor = 3.0
+
+    def __init__(self, manifest: Union[str, dict], store: str = "reconciliation_results.sqlite", workers: Optional[int] = None, executor: str = "process", memory_limit_mb: Optional[float] = None):
+        if executor not in ("process", "thread"):
+            raise ValueError("executor must be 'process' or 'thread'")
+        if workers is not None and workers < 1:
+            raise ValueError("workers must be positive")
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+        self.memory_limit_mb = self.physical_memory_mb() * 0.8 if memory_limit_mb is None else memory_limit_mb
+        self.pairs = self.load_manifest(manifest)
+
+    @staticmethod
+    def physical_memory_mb() -> float:
+        try:
+            return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2 ** 20
+        except (AttributeError, ValueError, OSError):
+            return float("inf")
+
+    def load_manifest(self, manifest: Union[str, dict]) -> List[dict]:
+        """Reads the manifest, applies defaults to the pairs, resolves paths relative to the manifest and validates the pairs"""
+        directory = ""
+        if isinstance(manifest, str):
+            directory = os.path.dirname(os.path.abspath(manifest))
+            with open(manifest) as file:
+                manifest = json.load(file)
+        if not isinstance(manifest, dict) or not isinstance(manifest.get("pairs"), list):
+            raise TypeError("manifest must be a dictionary with list of pairs")
+        defaults = manifest.get("defaults", {})
+        pairs, names = [], set()
+        for entry in manifest["pairs"]:
+            pair = {**defaults, **entry, "options": {**defaults.get("options", {}), **entry.get("options", {})}}
+            unknown = set(pair) - pair_fields
+            if unknown:
+                raise ValueError(f"Unknown fields {sorted(unknown)} of pair {pair.get('name')}")
+            if not isinstance(pair.get("name"), str):
+                raise ValueError(f"Pair {entry} has no name")
+            if pair["name"] in names:
+                raise ValueError(f"Pair {pair['name']} is listed more than once")
+            names.add(pair["name"])
+            if "legacy" not in pair or "cloud" not in pair:
+                raise ValueError(f"Pair {pair['name']} needs legacy and cloud sources")
+            for side in ("legacy", "cloud"):
+                pair[side] = self.resolve_source(pair[side], directory)
+            tables = isinstance(pair["legacy"], dict) + isinstance(pair["cloud"], dict)
+            pair.setdefault("mode", "sql" if tables == 2 else "serial")
+            if pair["mode"] not in modes:
+                raise ValueError(f"Unknown mode {pair['mode']} of pair {pair['name']}, use one of {list(modes)}")
+            if (pair["mode"] == "sql") != (tables == 2) or tables == 1:
+                raise ValueError(f"Pair {pair['name']}: SQLite tables are compared in sql mode, files in other modes")
+            if "columns" in pair:
+                if not isinstance(pair["columns"], list):
+                    raise TypeError(f"columns of pair {pair['name']} must be a list")
+                if pair["mode"] in ("streaming", "sql"):
+                    raise ValueError(f"Pair {pair['name']}: columns are selected only in modes reading whole files, not in {pair['mode']} mode")
+            if pair["mode"] == "incremental" and "store" not in pair["options"]:
+                pair["options"]["store"] = f"{os.path.splitext(self.store)[0]}_{pair['name']}_digests.sqlite"
+            pairs.append(pair)
+        return pairs
+
+    @staticmethod
+    def resolve_source(source: Union[str, dict], directory: str) -> Union[str, dict]:
+        if isinstance(source, dict):
+            if set(source) != {"database", "table"}:
+                raise ValueError(f"Table source needs database and table, got {source}")
+            return {**source, "database": os.path.join(directory, source["database"])}
+        if not isinstance(source, str):
+            raise TypeError("source must be instance of string or dictionary")
+        if not source.endswith(file_extensions):
+            raise ValueError(f"Unsupported file {source}, use one of {file_extensions}")
+        return os.path.join(directory, source)
+
+    @staticmethod
+    def source_paths(pair: dict) -> List[str]:
+        return [source["database"] if isinstance(source, dict) else source for source in (pair["legacy"], pair["cloud"])]
+
+    def estimate_memory(self, pair: dict) -> float:
+        """Memory estimate of the pair in MB, tables are compared by the databases and need no memory of their own"""
+        if "memory_mb" in pair:
+            return float(pair["memory_mb"])
+        if pair["mode"] == "sql":
+            return 0.0
+        total = 0.0
+        for path in self.source_paths(pair):
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            total += size * self.memory_factors.get(os.path.splitext(path)[1], self.default_memory_factor)
+        return total / 2 ** 20
+
+    def signature(self, pair: dict) -> str:
+        """Hash of the pair and sizes and modification times of its files, changes when the pair has to be compared again"""
+        files = []
+        for path in self.source_paths(pair):
+            try:
+                stat = os.stat(path)
+                files.append((stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                files.append(None)
+        return hashlib.sha256(json.dumps([pair, files], sort_keys=True, default=str).encode()).hexdigest()
+
+    def pending_pairs(self, store: ResultStore, names: Optional[List[str]] = None, rerun: bool = False) -> List[dict]:
+        """Pairs to compare, largest first, pairs done with the same signature are skipped unless rerun is set"""
+        pending = []
+        for pair in self.pairs:
+            if names is not None and pair["name"] not in names:
+                continue
+            pair = {**pair, "signature": self.signature(pair), "memory_mb": self.estimate_memory(pair)}
+            if not rerun and store.status(pair["name"]) == ("done", pair["signature"]):
+                logger.info(f"Skipping {pair['name']}, already compared")
+                continue
+            pending.append(pair)
+        return sorted(pending, key=lambda pair: pair["memory_mb"], reverse=True)
+
+    def admit(self, pending: List[dict], running: dict) -> Optional[dict]:
+        """Takes the largest pending pair fitting into memory left by the running pairs, any pair when nothing runs"""
+        reserved = sum(pair["memory_mb"] for pair in running.values())
+        for pair in pending:
+            if not running or reserved + pair["memory_mb"] <= self.memory_limit_mb:
+                pending.remove(pair)
+                return pair
+        return None
+
+    def run(self, names: Optional[List[str]] = None, rerun: bool = False) -> pd.DataFrame:
+        """
+        Compares pending pairs and returns their results from the store.
+
+        Parameters:
+        names: list (optional)
+            Names of pairs to compare, all pairs of the manifest by default.
+        rerun: bool
+            Compares again pairs already done.
+        """
+        store = ResultStore(self.store)
+        try:
+            pending = self.pending_pairs(store, names, rerun)
+            logger.info(f"Comparing {len(pending)} of {len(self.pairs)} pairs on {self.workers} {self.executor} workers, memory limit {self.memory_limit_mb:.0f} MB")
+            executor_class = ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+            with executor_class(max_workers=self.workers) as executor:
+                running, started = {}, {}
+                while pending or running:
+                    while len(running) < self.workers:
+                        pair = self.admit(pending, running)
+                        if pair is None:
+                            break
+                        logger.info(f"Comparing {pair['name']} ({pair['mode']} mode, estimated {pair['memory_mb']:.0f} MB)")
+                        store.start(pair["name"], pair["signature"], pair["memory_mb"])
+                        task = {name: value for name, value in pair.items() if name not in ("signature", "memory_mb")}
+                        future = executor.submit(run_pair, task)
+                        running[future], started[future] = pair, time.perf_counter()
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pair, seconds = running.pop(future), time.perf_counter() - started.pop(future)
+                        try:
+                            store.finish(pair["name"], future.result())
+                            logger.info(f"Compared {pair['name']} in {seconds:.1f} s")
+                        except Exception as e:
+                            logger.error(f"Comparison of {pair['name']} failed: {e}")
+                            store.fail(pair["name"], "".join(traceback.format_exception(type(e), e, e.__traceback__)), seconds)
+            return store.results([pair["name"] for pair in self.pairs if names is None or pair["name"] in names])
+        finally:
+            store.close()
+
+
+def main(arguments: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Compares pairs of legacy and cloud datasets listed in a manifest")
+    parser.add_argument("manifest", help="JSON manifest with pairs")
+    parser.add_argument("--store", default="reconciliation_results.sqlite")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--executor", choices=("process", "thread"), default="process")
+    parser.add_argument("--memory-limit-mb", type=float)
+    parser.add_argument("--pairs", help="comma separated names of pairs, all by default")
+    parser.add_argument("--rerun", action="store_true", help="compares again pairs already done")
+    parser.add_argument("--report", help="prints report of the pair from the store without comparing")
+    parser.add_argument("--verbose", action="store_true")
+    options = parser.parse_args(arguments)
+    logging.basicConfig(level=logging.INFO if options.verbose else logging.WARNING, format='%(asctime)s-%(levelname)s-%(message)s')
+
+    if options.report:
+        store = ResultStore(options.store)
+        print(store.report(options.report))
+        store.close()
+        return
+    runner = ReconciliationRunner(options.manifest, options.store, options.workers, options.executor, options.memory_limit_mb)
+    results = runner.run(options.pairs.split(",") if options.pairs else None, options.rerun)
+    print(results.to_string(index=False))
+    if not results.empty and (results["status"] != "done").any():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
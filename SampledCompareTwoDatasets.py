@@ -0,0 +1,204 @@
+import logging
+import numpy as np
+import pandas as pd
+
+from statistics import NormalDist
+from typing import List, Optional, Union
+
+from CompareTwoDatasets import CompareTwoDatasets
+from PandasEngine import PandasEngine
+
+logger = logging.getLogger(__name__)
+
+
+class SampledCompareTwoDatasets(CompareTwoDatasets):
+    """
+    Version of CompareTwoDatasets that estimates mismatch rates from a sample of keys instead of comparing all rows.
+
+    Keys (values of all columns of composite keys) are hashed with the seed and split into batches by the hash, so the same key is sampled in both dataframes
+    and all its rows are compared together. Batches of about batch_rows rows are compared one after another and after
+    every batch mismatch rate of every column (and of rows with any mismatch) is estimated with Wilson confidence
+    interval, corrected for the sampled fraction. Sampling stops when all intervals are narrower than margin,
+    when the threshold is clearly exceeded or clearly not reached, or after max_sample_rows rows.
+    Schema and row count differences are exact, report() shows the estimates and differences found in the sample.
+
+    Parameters:
+    legacy_df: pd.DataFrame
+        Dataframe from legacy system
+    cloud_df: pd.DataFrame
+        Dataframe from cloud system
+    legacy_key: str or list (optional)
+        Column or list of columns of composite key for joining dataframes on.
+    cloud_key: str or list (optional)
+        Column or list of columns of composite key for joining dataframes on, in the same order as legacy_key.
+    join_columns: list or str (optional)
+        Column for joining dataframes on, or list of legacy key and cloud key (each a column or list of columns).
+    max_sample_rows: int
+        Largest number of sampled rows (of the bigger dataframe).
+    batch_rows: int
+        Rows sampled between checks of the stopping rule.
+    seed: int
+        Seed of the key hash, the same seed samples the same keys.
+    threshold: float (optional)
+        Mismatch rate of interest, sampling stops when lower bound of any rate is above it or upper bounds of all rates are below it.
+    confidence: float
+        Confidence level of the intervals.
+    margin: float
+        Sampling stops when half-width of every interval is at most margin.
+    options:
+        Other parameters of CompareTwoDatasets, e.g. fingerprint or duplicate_keys, applied to every batch.
+
+    Either (legacy_key, cloud_key) or join_columns parameters required.
+    """
+
+    def __init__(self, legacy_df: pd.DataFrame, cloud_df: pd.DataFrame, legacy_key: Optional[Union[str, list]] = None, cloud_key: Optional[Union[str, list]] = None, join_columns: Optional[Union[list, str]] = None, max_sample_rows: int = 1000000, batch_rows: int = 10000, seed: int = 0, threshold: Optional[float] = None, confidence: float = 0.95, margin: float = 0.001, **options):
+        super().__init__(legacy_df, cloud_df, legacy_key, cloud_key, join_columns, **options)
+        if batch_rows < 1 or max_sample_rows < 1:
+            raise ValueError("batch_rows and max_sample_rows must be positive")
+        if not 0 < confidence < 1:
+            raise ValueError("confidence must be between 0 and 1")
+        if margin <= 0:
+            raise ValueError("margin must be positive")
+        self.max_sample_rows = max_sample_rows
+        self.batch_rows = batch_rows
+        self.seed = seed
+        self.threshold = threshold
+        self.confidence = confidence
+        self.margin = margin
+
+    def key_hashes(self, keys: Union[pd.Series, pd.DataFrame]) -> np.ndarray:
+        """Hashes of the keys (rows of composite key columns) salted with the seed, equal keys get equal hashes in both dataframes"""
+        salt = np.uint64((self.seed * 0x9E3779B97F4A7C15 + 1) % (1 << 64))
+        return PandasEngine.mix_hashes(pd.util.hash_pandas_object(keys, index=False, categorize=False).to_numpy() ^ salt)
+
+    def sample_batches(self, dataframe: pd.DataFrame, keys: List[str], width: Optional[int], batches: int) -> List[np.ndarray]:
+        """Positions of rows of every batch in their original order, batch is a range of width of key hashes"""
+        if width is None:
+            return [np.arange(len(dataframe))]
+        numbers = self.key_hashes(dataframe[keys] if self.composite_key else dataframe[keys[0]]) // np.uint64(width)
+        selected = np.flatnonzero(numbers < np.uint64(batches))
+        selected = selected[np.argsort(numbers[selected], kind="stable")]
+        return np.split(selected, np.cumsum(np.bincount(numbers[selected].astype(np.int64), minlength=batches))[:-1])
+
+    def value_mismatches(self):
+        """Checking mismatches in values of sampled batches of keys until the stopping rule is met"""
+        self.matched_id_datatypes = self.matched_key_datatypes()
+        if not self.matched_id_datatypes:
+            logger.warning("Id columns are not the same datatypes!")
+            return
+
+        population = max(len(self.legacy_df), len(self.cloud_df), 1)
+        with self.phase("sample_keys"):
+            # width of a batch in the 2 ** 64 hash space, None when one batch takes whole dataframes
+            width = None if self.batch_rows >= population else (1 << 64) * self.batch_rows // population
+            batches = 1 if width is None else min(-(-self.max_sample_rows // self.batch_rows), -(-(1 << 64) // width))
+            legacy_batches = self.sample_batches(self.legacy_df, self.legacy_keys, width, batches)
+            cloud_batches = self.sample_batches(self.cloud_df, self.cloud_keys, width, batches)
+            self.record_counts(batches=batches)
+
+        self.sampled_rows = {"legacy": 0, "cloud": 0, "common": 0, "legacy_unique": 0, "cloud_unique": 0, "mismatched": 0}
+        self.sampled_mismatches = pd.Series(0, index=self.compared_columns(), dtype=np.int64)
+        partials, offset = [], 0
+        with self.phase("compare_batches"):
+            for number in range(batches):
+                self.sampled_fraction = 1.0 if width is None else min(1.0, (number + 1) * width / (1 << 64))
+                legacy_rows, cloud_rows = legacy_batches[number], cloud_batches[number]
+                if len(legacy_rows) or len(cloud_rows) or not partials:
+                    with self.phase("compare_batch"):
+                        compare = CompareTwoDatasets(self.legacy_df.iloc[legacy_rows], self.cloud_df.iloc[cloud_rows], **self.partition_options())
+                        compare.schema_difference()
+                        compare.value_mismatches()
+                        partials.append(compare._partial_results(offset))
+                        offset += compare.merged_rows
+                        self.add_sampled_counts(compare)
+                        self.record_counts(legacy_rows=len(legacy_rows), cloud_rows=len(cloud_rows))
+                self.estimates = self.estimate()
+                self.stop_reason = self.stopping_rule(number == batches - 1)
+                if self.stop_reason is not None:
+                    break
+            self.sampled_batches = number + 1
+        logger.info(f"Sampled {self.sampled_rows['legacy']} legacy and {self.sampled_rows['cloud']} cloud rows in {self.sampled_batches} batches, stopped: {self.stop_reason}")
+        with self.phase("combine"):
+            self._combine_partial_results(partials)
+
+    def add_sampled_counts(self, compare: CompareTwoDatasets):
+        """Adds counts of compared rows and mismatches of one batch"""
+        self.sampled_rows["legacy"] += len(compare.legacy_df)
+        self.sampled_rows["cloud"] += len(compare.cloud_df)
+        self.sampled_rows["common"] += len(compare.merged_dataframe_common)
+        self.sampled_rows["legacy_unique"] += len(compare.legacy_unique)
+        self.sampled_rows["cloud_unique"] += len(compare.cloud_unique)
+        if compare.mismatches_exists:
+            self.sampled_rows["mismatched"] += len(compare.mismatched_dataframe)
+            self.sampled_mismatches = self.sampled_mismatches.add(compare.mismatch_counts, fill_value=0).astype(np.int64)
+
+    def estimate(self) -> pd.DataFrame:
+        """
+        Estimated mismatch rate of every column and of rows with any mismatch among common rows, with Wilson score interval.
+
+        z is scaled by finite population correction sqrt(1 - sampled fraction), so the interval closes when all keys are compared.
+        """
+        mismatched = pd.concat([self.sampled_mismatches, pd.Series({"any column": self.sampled_rows["mismatched"]}, dtype=np.int64)])
+        compared = self.sampled_rows["common"]
+        z = NormalDist().inv_cdf((1 + self.confidence) / 2) * np.sqrt(max(0.0, 1 - self.sampled_fraction))
+        estimates = pd.DataFrame({"mismatched": mismatched, "compared": compared})
+        if compared == 0:
+            estimates["rate"], estimates["lower"], estimates["upper"] = np.nan, 0.0, 1.0
+            return estimates
+        rate = mismatched / compared
+        center = (rate + z * z / (2 * compared)) / (1 + z * z / compared)
+        half_width = z * np.sqrt(rate * (1 - rate) / compared + z * z / (4 * compared * compared)) / (1 + z * z / compared)
+        estimates["rate"] = rate
+        estimates["lower"] = (center - half_width).clip(lower=0).where(mismatched > 0, 0.0)
+        estimates["upper"] = (center + half_width).clip(upper=1)
+        return estimates
+
+    def stopping_rule(self, last_batch: bool) -> Optional[str]:
+        """Returns reason for stopping the sampling, None to sample the next batch"""
+        if self.sampled_fraction >= 1:
+            return "all keys compared"
+        if self.sampled_rows["common"] > 0:
+            if self.threshold is not None and (self.estimates["lower"] > self.threshold).any():
+                return "threshold exceeded"
+            if self.threshold is not None and (self.estimates["upper"] < self.threshold).all():
+                return "below threshold"
+            if ((self.estimates["upper"] - self.estimates["lower"]) / 2 <= self.margin).all():
+                return "margin reached"
+        if last_batch:
+            return "max_sample_rows reached"
+        return None
+
+    def summary(self) -> dict:
+        """Summary of CompareTwoDatasets with counts of the sample, estimated mismatch rates and reason for stopping"""
+        summary = super().summary()
+        if self.matched_id_datatypes:
+            summary["value_mismatches"]["sample"] = {
+                "rows": {name: int(count) for name, count in self.sampled_rows.items()},
+                "fraction": float(self.sampled_fraction),
+                "batches": self.sampled_batches,
+                "stop_reason": self.stop_reason,
+                "confidence": self.confidence,
+                "estimates": {
+                    str(column): {name: None if pd.isna(value) else float(value) for name, value in row.items()}
+                    for column, row in self.estimates.iterrows()
+                },
+            }
+        return summary
+
+    def get_value_mismatches_summary(self):
+        if not self.matched_id_datatypes:
+            return super().get_value_mismatches_summary()
+        nl = '\n'
+        base = f"Sampled {self.sampled_rows['legacy']} legacy and {self.sampled_rows['cloud']} cloud rows ({self.sampled_fraction:.2%} of keys) in {self.sampled_batches} batches, stopped: {self.stop_reason}" + nl
+        base = base + f"Estimated mismatch rates ({self.confidence:.0%} confidence):" + nl + str(self.estimates) + nl
+        if self.threshold is not None:
+            above = list(self.estimates.index[self.estimates["lower"] > self.threshold])
+            undecided = list(self.estimates.index[(self.estimates["lower"] <= self.threshold) & (self.estimates["upper"] >= self.threshold)])
+            if above:
+                base = base + f"Mismatch rate above {self.threshold} for: {', '.join(above)}" + nl
+            elif undecided:
+                base = base + f"Mismatch rate may be above {self.threshold} for: {', '.join(undecided)}" + nl
+            else:
+                base = base + f"All mismatch rates below {self.threshold}" + nl
+        base = base + f"Estimated unique rows: Legacy {self.sampled_rows['legacy_unique'] / self.sampled_fraction:.0f}, Cloud {self.sampled_rows['cloud_unique'] / self.sampled_fraction:.0f}" + nl
+        return base + "Differences in the sample:" + nl + super().get_value_mismatches_summary()
@@ -0,0 +1,457 @@
+import logging
+import numpy as np
+import pandas as pd
+
+from functools import reduce
+from typing import Dict, Iterator, List, Union
+
+from ColumnComparator import ColumnComparator
+from ComparisonEngine import ComparisonEngine
+
+try:
+    from pyspark import StorageLevel
+    from pyspark.sql import Window
+    from pyspark.sql import functions as F
+    from pyspark.sql import types as T
+except ImportError as e:
+    pyspark_error = e
+else:
+    pyspark_error = None
+
+logger = logging.getLogger(__name__)
+
+# metadata of merged columns telling the side they come from ("legacy", "cloud", "key") or the compared column of a mismatch flag
+SIDE = "comparison_side"
+COLUMN = "comparison_column"
+# metadata of boolean columns of the side with missing rows, which pandas merge turns into object columns
+OBJECT = "comparison_object"
+
+
+def column(name: str):
+    """Spark column of the name, quoted so names with dots or spaces are not parsed"""
+    return F.col("`" + name.replace("`", "``") + "`")
+
+
+class SparkEngine(ComparisonEngine):
+    """
+    Comparison engine running on PySpark DataFrames, works on a cluster as well as in local[*] mode.
+
+    All operations stay distributed, the driver collects only counts, duplicated keys and report samples
+    (write_differences streams rows partition by partition). Results follow the pandas engine: rows of the merged
+    frame get _position column with their position in pandas outer merge (key order, nulls last), which is used
+    as index of collected samples, null keys match each other, and mismatches follow rules of ColumnComparator
+    (NaN is null, strings are converted by Spark casts, naive timestamps are in the session time zone).
+    Random samples of frames bigger than the sample size are drawn by hash of the position and differ
+    from samples of the pandas engine.
+
+    Parameters:
+    storage_level: pyspark.StorageLevel (optional)
+        Storage level of the persisted merged frame, MEMORY_AND_DISK by default.
+    """
+
+    name = "spark"
+    local = False
+
+    def __init__(self, storage_level=None):
+        if pyspark_error is not None:
+            logger.error(f"pyspark is required for comparing Spark DataFrames: {pyspark_error}")
+            raise pyspark_error
+        self.storage_level = StorageLevel.MEMORY_AND_DISK if storage_level is None else storage_level
+
+    @staticmethod
+    def is_spark_dataframe(dataframe) -> bool:
+        """Checks if dataframe is a Spark DataFrame (classic or Spark Connect), without importing pyspark"""
+        return any(cls.__name__ == "DataFrame" and cls.__module__.startswith("pyspark.sql") for cls in type(dataframe).__mro__)
+
+    def is_dataframe(self, dataframe) -> bool:
+        return self.is_spark_dataframe(dataframe)
+
+    @staticmethod
+    def pandas_dtype(data_type) -> np.dtype:
+        """Returns pandas datatype of values of the Spark type, object for types without NumPy equivalent"""
+        types = (
+            (T.LongType, "int64"),
+            (T.IntegerType, "int32"),
+            (T.ShortType, "int16"),
+            (T.ByteType, "int8"),
+            (T.DoubleType, "float64"),
+            (T.FloatType, "float32"),
+            (T.BooleanType, "bool"),
+            (T.TimestampType, "datetime64[ns]"),
+            (getattr(T, "TimestampNTZType", T.TimestampType), "datetime64[ns]"),
+        )
+        for spark_type, dtype in types:
+            if isinstance(data_type, spark_type):
+                return np.dtype(dtype)
+        return np.dtype(object)
+
+    def dtypes(self, dataframe) -> pd.Series:
+        return pd.Series({field.name: self.pandas_dtype(field.dataType) for field in dataframe.schema.fields}, dtype=object)
+
+    def count(self, dataframe) -> int:
+        return dataframe.count()
+
+    def key_counts(self, dataframe, key: str):
+        return dataframe.groupBy(column(key).alias("_key")).agg(F.count(F.lit(1)).alias("_rows"))
+
+    def duplicate_keys(self, counts) -> pd.Series:
+        rows = counts.filter(F.col("_rows") > 1).collect()
+        return pd.Series([row["_rows"] for row in rows], index=[row["_key"] for row in rows], dtype=np.int64)
+
+    def merged_key_rows(self, legacy_counts, cloud_counts, duplicate_keys: str = "keep"):
+        legacy = legacy_counts.select(F.col("_key").alias("_legacy_key"), F.col("_rows").alias("_legacy_rows"))
+        cloud = cloud_counts.select(F.col("_key").alias("_cloud_key"), F.col("_rows").alias("_cloud_rows"))
+        counts = legacy.join(cloud, F.col("_legacy_key").eqNullSafe(F.col("_cloud_key")), "full_outer")
+        legacy_rows = F.coalesce(F.col("_legacy_rows"), F.lit(0))
+        cloud_rows = F.coalesce(F.col("_cloud_rows"), F.lit(0))
+        if duplicate_keys == "deduplicate":
+            rows = F.lit(1)
+        elif duplicate_keys == "occurrence":
+            rows = F.greatest(legacy_rows, cloud_rows)
+        else:
+            rows = F.greatest(legacy_rows, F.lit(1)) * F.greatest(cloud_rows, F.lit(1))
+        return counts.select(rows.cast("long").alias("_rows"))
+
+    def total_rows(self, rows) -> int:
+        return int(rows.agg(F.sum("_rows")).first()[0] or 0)
+
+    @staticmethod
+    def with_row_numbers(dataframe):
+        """Adds _row column increasing with the order of rows, kept until positions of merged rows are assigned"""
+        if "_row" in dataframe.columns:
+            return dataframe
+        return dataframe.withColumn("_row", F.monotonically_increasing_id())
+
+    def select_columns(self, dataframe, columns: List[str]):
+        return dataframe.select(*[column(name) for name in columns])
+
+    def empty(self, dataframe):
+        return dataframe.limit(0)
+
+    def encode_keys(self, legacy_df, cloud_df, legacy_keys: List[str], cloud_keys: List[str]):
+        """
+        Composite key becomes _key struct with fields named by legacy key columns, as Spark joins, groups and sorts
+        structs natively and numbering distinct keys would need a global sort.
+        """
+        legacy = F.struct(*[column(legacy_key).alias(legacy_key) for legacy_key in legacy_keys])
+        cloud = F.struct(*[column(cloud_key).alias(legacy_key) for legacy_key, cloud_key in zip(legacy_keys, cloud_keys)])
+        return legacy_df.withColumn("_key", legacy), cloud_df.withColumn("_key", cloud)
+
+    def decode_keys(self, merged, keys: List[str], dtypes: pd.Series):
+        """Shared key columns are taken from fields of the merged _key struct, which keep their types"""
+        outputs = []
+        for name in merged.columns:
+            if name.endswith("_legacy") and name[:-len("_legacy")] in keys:
+                key = name[:-len("_legacy")]
+                outputs.append(F.col("_key").getField(key).alias(key, metadata={SIDE: "key"}))
+            elif name != "_key" and not (name.endswith("_cloud") and name[:-len("_cloud")] in keys):
+                outputs.append(column(name))
+        return merged.select(*outputs)
+
+    def column_profiles(self, dataframe, key: str, columns: List[str]) -> pd.DataFrame:
+        """
+        All statistics are aggregated in one Spark job, distinct values of columns are counted with HyperLogLog++.
+
+        Checksums sum xxhash64 of (key, value) as decimals, so the sum cannot overflow. As in pandas engine NaN is null
+        and min and max are skipped for columns without NumPy datatype (e.g. strings).
+        """
+        types = {field.name: field.dataType for field in dataframe.schema.fields}
+        keys = column(key)
+        statistics = ("nulls", "min", "max", "sum", "mean", "distinct", "checksum")
+        expressions = [F.count(F.lit(1)).alias("rows")]
+        for number, name in enumerate([key] + columns):
+            values = column(name)
+            missing = values.isNull() | F.isnan(values) if isinstance(types[name], (T.DoubleType, T.FloatType)) else values.isNull()
+            present = F.when(~missing, values)
+            numbers = present.cast("int") if isinstance(types[name], T.BooleanType) else present
+            numeric = isinstance(types[name], (T.NumericType, T.BooleanType))
+            ordered = self.pandas_dtype(types[name]) != object
+            if number == 0:
+                distinct = F.countDistinct(present) + F.max(missing.cast("int"))
+                checksum = F.sum(F.xxhash64(keys).cast("decimal(38,0)"))
+            else:
+                distinct = F.approx_count_distinct(present)
+                checksum = F.sum(F.xxhash64(keys, values).cast("decimal(38,0)"))
+            expressions.extend([
+                F.sum(missing.cast("long")).alias(f"nulls{number}"),
+                (F.min(present) if ordered else F.lit(None)).alias(f"min{number}"),
+                (F.max(present) if ordered else F.lit(None)).alias(f"max{number}"),
+                (F.sum(numbers) if numeric else F.lit(None)).alias(f"sum{number}"),
+                (F.avg(numbers) if numeric else F.lit(None)).alias(f"mean{number}"),
+                distinct.alias(f"distinct{number}"),
+                checksum.alias(f"checksum{number}"),
+            ])
+        row = dataframe.agg(*expressions).first()
+        profiles = {}
+        for number, name in enumerate([key] + columns):
+            profile = {"dtype": types[name].simpleString(), "rows": row["rows"]}
+            profile.update({statistic: row[f"{statistic}{number}"] for statistic in statistics})
+            profile["nulls"] = int(profile["nulls"] or 0)
+            profile["distinct"] = int(profile["distinct"] or 0)
+            profile["checksum"] = int(profile["checksum"] or 0) % (1 << 64)
+            profiles[name] = profile
+        return pd.DataFrame.from_dict(profiles, orient="index", dtype=object)
+
+    def handle_duplicate_keys(self, dataframe, key: str, duplicate_keys: str):
+        dataframe = self.with_row_numbers(dataframe)
+        occurrence = (F.row_number().over(Window.partitionBy(column(key)).orderBy("_row")) - 1).cast("long")
+        if duplicate_keys == "deduplicate":
+            return dataframe.withColumn("_occurrence", occurrence).filter(F.col("_occurrence") == 0).drop("_occurrence")
+        return dataframe.withColumn("_occurrence", occurrence)
+
+    def outer_join(self, legacy_df, cloud_df, join_columns: Union[list, str], left_on: Union[list, str], right_on: Union[list, str]):
+        """
+        Full outer join on null safe equality of the keys, with columns named as in pandas outer merge.
+
+        Rows are numbered in the order of pandas merge (key, then order of rows in legacy and cloud dataframes)
+        and the merged frame is persisted, as it is read by all following steps.
+        """
+        left_on = left_on if isinstance(left_on, list) else [left_on]
+        right_on = right_on if isinstance(right_on, list) else [right_on]
+        legacy_df, cloud_df = self.with_row_numbers(legacy_df), self.with_row_numbers(cloud_df)
+        legacy_names = [name for name in legacy_df.columns if name != "_row"]
+        cloud_names = [name for name in cloud_df.columns if name != "_row"]
+        for names, keys in ((legacy_names, left_on), (cloud_names, right_on)):
+            missing = [key for key in keys if key not in names]
+            if missing:
+                logger.error(f"Column {join_columns} not found in one or both dataframes: {missing}")
+                raise KeyError(missing)
+
+        legacy_aliases = {name: f"_l{number}" for number, name in enumerate(legacy_df.columns)}
+        cloud_aliases = {name: f"_c{number}" for number, name in enumerate(cloud_df.columns)}
+        legacy = legacy_df.select([column(name).alias(alias) for name, alias in legacy_aliases.items()])
+        cloud = cloud_df.select([column(name).alias(alias) for name, alias in cloud_aliases.items()])
+        pairs = [(F.col(legacy_aliases[legacy_key]), F.col(cloud_aliases[cloud_key])) for legacy_key, cloud_key in zip(left_on, right_on)]
+        joined = legacy.join(cloud, reduce(lambda left, right: left & right, [legacy_key.eqNullSafe(cloud_key) for legacy_key, cloud_key in pairs]), "full_outer")
+
+        shared = {legacy_key for legacy_key, cloud_key in zip(left_on, right_on) if legacy_key == cloud_key}
+        outputs = []
+        for name in legacy_names:
+            if name in shared:
+                outputs.append(F.coalesce(F.col(legacy_aliases[name]), F.col(cloud_aliases[name])).alias(name, metadata={SIDE: "key"}))
+            else:
+                outputs.append(F.col(legacy_aliases[name]).alias(name + "_legacy" if name in cloud_names else name, metadata={SIDE: "legacy"}))
+        for name in cloud_names:
+            if name not in shared:
+                outputs.append(F.col(cloud_aliases[name]).alias(name + "_cloud" if name in legacy_names else name, metadata={SIDE: "cloud"}))
+        in_legacy, in_cloud = F.col(legacy_aliases["_row"]).isNotNull(), F.col(cloud_aliases["_row"]).isNotNull()
+        outputs.append(F.when(in_legacy & in_cloud, "both").when(in_legacy, "left_only").otherwise("right_only").alias("_merge"))
+
+        # rows are ordered by every key column with nulls last, as by codes of pandas engine, fields of _key struct are
+        # ordered one by one, since Spark orders structs with null fields first
+        order = []
+        for legacy_key, (legacy_value, cloud_value) in zip(left_on, pairs):
+            key = F.coalesce(legacy_value, cloud_value)
+            key_type = legacy_df.schema[legacy_key].dataType
+            if isinstance(key_type, T.StructType):
+                order.extend(key.getField(field.name) for field in key_type.fields)
+            else:
+                order.append(key)
+        order += [F.col(legacy_aliases["_row"]), F.col(cloud_aliases["_row"])]
+        ordered = joined.select(*outputs, *[value.alias(f"_order{number}") for number, value in enumerate(order)])
+        ordered = ordered.orderBy(*[F.col(f"_order{number}").asc_nulls_last() for number in range(len(order))])
+        merged = self.with_positions(ordered).drop(*[f"_order{number}" for number in range(len(order))])
+        return self.missing_value_types(merged)
+
+    def with_positions(self, ordered):
+        """
+        Adds _position column numbering rows of the sorted frame from 0, without moving rows between partitions.
+
+        Rows are numbered within partitions and shifted by sizes of preceding partitions, only the sizes are collected.
+        """
+        ordered = ordered.withColumn("_id", F.monotonically_increasing_id()).persist(self.storage_level)
+        partition = F.shiftright(F.col("_id"), 33)
+        sizes = sorted((row["_partition"], row["count"]) for row in ordered.groupBy(partition.alias("_partition")).count().collect())
+        offsets, offset = [], 0
+        for number, size in sizes:
+            offsets.append((number, offset))
+            offset += size
+        offsets = ordered.sparkSession.createDataFrame(offsets, "_partition long, _offset long")
+        positioned = ordered.withColumn("_partition", partition).join(F.broadcast(offsets), "_partition")
+        return positioned.withColumn("_position", F.col("_offset") + F.col("_id") - F.col("_partition") * (1 << 33)).drop("_id", "_partition", "_offset")
+
+    def missing_value_types(self, merged):
+        """
+        Casts integer columns of the side with missing rows to double, as pandas merge does when it introduces NaN values,
+        boolean columns are marked to be collected as object columns.
+        """
+        sides = {row["_merge"] for row in merged.select("_merge").distinct().collect()}
+        missing = {"legacy": "right_only" in sides, "cloud": "left_only" in sides}
+        integers = (T.LongType, T.IntegerType, T.ShortType, T.ByteType)
+        columns = []
+        for field in merged.schema.fields:
+            if missing.get(field.metadata.get(SIDE)) and isinstance(field.dataType, integers):
+                columns.append(column(field.name).cast("double").alias(field.name, metadata=field.metadata))
+            elif missing.get(field.metadata.get(SIDE)) and isinstance(field.dataType, T.BooleanType):
+                columns.append(column(field.name).alias(field.name, metadata={**field.metadata, OBJECT: True}))
+            else:
+                columns.append(column(field.name))
+        return merged.select(*columns)
+
+    def drop_columns(self, dataframe, columns: List[str]):
+        return dataframe.drop(*columns)
+
+    def split(self, merged):
+        return (
+            merged.filter(F.col("_merge") == "left_only"),
+            merged.filter(F.col("_merge") == "right_only"),
+            merged.filter(F.col("_merge") == "both")
+        )
+
+    @staticmethod
+    def kind(data_type) -> str:
+        """Kind of values of the Spark type, as ColumnComparator.kind of pandas datatypes"""
+        if isinstance(data_type, T.BooleanType):
+            return "bool"
+        if isinstance(data_type, T.NumericType):
+            return "numeric"
+        if isinstance(data_type, (T.TimestampType, getattr(T, "TimestampNTZType", T.TimestampType), T.DateType)):
+            return "datetime"
+        if isinstance(data_type, T.StringType):
+            return "string"
+        return "other"
+
+    @staticmethod
+    def normalized(value, kind: str, common_kind: str, comparator: ColumnComparator):
+        """Value converted to the common kind of the pair, with flag of strings which cannot be converted (None when nothing is parsed)"""
+        if common_kind == "string":
+            value = F.trim(value) if comparator.trim else value
+            return (F.lower(value) if comparator.ignore_case else value), None
+        if kind != "string":
+            if common_kind == "numeric":
+                return value.cast("double"), None
+            if common_kind == "datetime":
+                return value.cast("timestamp"), None
+            return value, None
+        if common_kind == "bool":
+            text = F.lower(F.trim(value))
+            parsed = F.when(text.isin(*comparator.true_values), F.lit(True)).when(text.isin(*comparator.false_values), F.lit(False))
+        elif common_kind == "numeric":
+            parsed = F.trim(value).cast("double")
+        else:
+            parsed = F.trim(value).cast("timestamp")
+        return parsed, value.isNotNull() & parsed.isNull()
+
+    def mismatch(self, name: str, legacy_type, cloud_type, comparator: ColumnComparator):
+        """Mismatch flag of the compared column under rules of the comparator, following kernels of ColumnComparator"""
+        comparator = comparator.for_column(name)
+        legacy, cloud = column(name + "_legacy"), column(name + "_cloud")
+        legacy_nulls, cloud_nulls = legacy.isNull(), cloud.isNull()
+        floating = (T.DoubleType, T.FloatType)
+        if isinstance(legacy_type, floating):
+            legacy_nulls = legacy_nulls | F.isnan(legacy)
+        if isinstance(cloud_type, floating):
+            cloud_nulls = cloud_nulls | F.isnan(cloud)
+        legacy_kind, cloud_kind = self.kind(legacy_type), self.kind(cloud_type)
+        common_kind = comparator.common_kind(legacy_kind, cloud_kind)
+        invalid = []
+        if common_kind == "other" and legacy_type != cloud_type:
+            values = F.lit(True)
+        else:
+            if legacy_type != cloud_type or common_kind == "string":
+                legacy, legacy_invalid = self.normalized(legacy, legacy_kind, common_kind, comparator)
+                cloud, cloud_invalid = self.normalized(cloud, cloud_kind, common_kind, comparator)
+                invalid = [flag for flag in (legacy_invalid, cloud_invalid) if flag is not None]
+            if common_kind == "numeric" and (comparator.rtol > 0 or comparator.atol > 0):
+                legacy, cloud = legacy.cast("double"), cloud.cast("double")
+                values = F.abs(legacy - cloud) > F.lit(comparator.atol) + F.lit(comparator.rtol) * F.abs(cloud)
+            else:
+                values = legacy != cloud
+        mismatch = F.when(legacy_nulls | cloud_nulls, (legacy_nulls != cloud_nulls) if comparator.null_equal else F.lit(True)).otherwise(values)
+        # unparsed values are null after conversion, True | null is True
+        return reduce(lambda left, right: left | right, invalid, mismatch)
+
+    def column_mismatches(self, common, columns: List[str], comparator: ColumnComparator, legacy_dtypes: pd.Series, cloud_dtypes: pd.Series):
+        """Returns common rows with <column>_mismatch columns and mismatch_sum, evaluated lazily, Spark types of the merged frame are not upcast"""
+        if not columns:
+            return common
+        types = {field.name: field.dataType for field in common.schema.fields}
+        flags = [
+            self.mismatch(name, types[name + "_legacy"], types[name + "_cloud"], comparator).cast("long").alias(name + "_mismatch", metadata={COLUMN: name})
+            for name in columns
+        ]
+        state = common.select("*", *flags)
+        return state.withColumn("mismatch_sum", reduce(lambda left, right: left + right, [column(name + "_mismatch") for name in columns]))
+
+    def mismatch_counts(self, state) -> pd.Series:
+        # mismatch_sum of a single compared column is its flag column and inherits its metadata
+        flags = [field for field in state.schema.fields if COLUMN in field.metadata and field.name == field.metadata[COLUMN] + "_mismatch"]
+        if not flags:
+            return pd.Series(dtype=np.int64)
+        counts = state.agg(*[F.sum(column(field.name)) for field in flags]).first()
+        return pd.Series([int(count or 0) for count in counts], index=[field.metadata[COLUMN] for field in flags], dtype=np.int64)
+
+    def mismatched_rows(self, common, state):
+        return state.filter(F.col("mismatch_sum") > 0)
+
+    def duplicated(self, common):
+        """Returns positions of common rows equal to a common row with lower position"""
+        window = Window.partitionBy(*[column(name) for name in common.columns if name != "_position"]).orderBy("_position")
+        return common.select("_position", F.row_number().over(window).alias("_occurrence")).filter(F.col("_occurrence") > 1).select("_position")
+
+    def duplicated_count(self, duplicated) -> int:
+        return duplicated.count()
+
+    def duplicated_rows(self, common, state, duplicated):
+        return state.join(duplicated, "_position", "left_semi").withColumn("duplicate", F.lit(True))
+
+    def has_duplicated_rows(self, dataframe) -> bool:
+        columns = [column(name) for name in dataframe.columns]
+        return dataframe.groupBy(*columns).agg(F.count(F.lit(1)).alias("_rows")).filter(F.col("_rows") > 1).limit(1).count() > 0
+
+    def to_pandas(self, rows: list, fields: list) -> pd.DataFrame:
+        """
+        Builds pandas dataframe of collected rows indexed by their position, with values and datatypes of pandas outer merge.
+
+        Columns of the side missing in unique rows get NaN values, boolean columns of that side are object columns
+        as in pandas merge, other integer and boolean columns keep their datatype only without missing values.
+        """
+        dataframe = pd.DataFrame.from_records([tuple(row) for row in rows], columns=[field.name for field in fields])
+        for field in fields:
+            dtype = self.pandas_dtype(field.dataType)
+            if field.metadata.get(OBJECT):
+                dataframe[field.name] = dataframe[field.name].astype(object)
+            elif dtype != object and not (dtype.kind in "iub" and dataframe[field.name].isna().any()):
+                dataframe[field.name] = dataframe[field.name].astype(dtype)
+            side = field.metadata.get(SIDE)
+            if side in ("legacy", "cloud") and "_merge" in dataframe and dataframe[field.name].dtype == object:
+                absent = (dataframe["_merge"] == ("right_only" if side == "legacy" else "left_only")).to_numpy()
+                if absent.any():
+                    dataframe.loc[absent, field.name] = np.nan
+        if "_merge" in dataframe:
+            dataframe["_merge"] = pd.Categorical(dataframe["_merge"], categories=["left_only", "right_only", "both"])
+        dataframe.index = pd.Index(dataframe.pop("_position").to_numpy(dtype=np.int64))
+        return dataframe
+
+    def collect(self, dataframe) -> pd.DataFrame:
+        return self.to_pandas(dataframe.orderBy("_position").collect(), dataframe.schema.fields)
+
+    def sample(self, dataframe, size: int, seed: int) -> pd.DataFrame:
+        """Rows with the smallest hashes of their positions are kept, so the same seed gives the same sample"""
+        if dataframe.count() > size:
+            dataframe = dataframe.orderBy(F.xxhash64(F.col("_position"), F.lit(seed))).limit(size)
+        return self.collect(dataframe)
+
+    def sample_mismatches(self, mismatched, columns: List[str], size: int, seed: int) -> Dict[str, pd.DataFrame]:
+        """Hashes of positions do not depend on the column, so samples of different columns share rows where possible"""
+        counts = self.mismatch_counts(mismatched)
+        samples = {}
+        for name in columns:
+            if counts.get(name, 0) > 0:
+                rows = mismatched.filter(column(name + "_mismatch") > 0)
+                if counts[name] > size:
+                    rows = rows.orderBy(F.xxhash64(F.col("_position"), F.lit(seed))).limit(size)
+                samples[name] = self.collect(rows)
+        return samples
+
+    def batches(self, dataframe, batch_rows: int) -> Iterator[pd.DataFrame]:
+        """Rows are streamed to the driver partition by partition"""
+        fields = dataframe.schema.fields
+        rows, batches = [], 0
+        for row in dataframe.orderBy("_position").toLocalIterator():
+            rows.append(row)
+            if len(rows) == batch_rows:
+                yield self.to_pandas(rows, fields)
+                rows, batches = [], batches + 1
+        if rows or batches == 0:
+            yield self.to_pandas(rows, fields)
@@ -0,0 +1,113 @@
+import argparse
+import difflib
+import json
+import logging
+import sys
+import numpy as np
+import pandas as pd
+
+from typing import Dict, List, Optional
+
+import main as examples
+from CompareTwoDatasets import CompareTwoDatasets
+from SparkEngine import pyspark_error
+
+logger = logging.getLogger(__name__)
+
+# scenarios of main.py: legacy dataframe, cloud dataframe and key parameters
+scenarios = {
+    "identical": (examples.df1_identical, examples.df2_identical, {"legacy_key": "id", "cloud_key": "id"}),
+    "identical_join_columns": (examples.df1_identical, examples.df2_identical, {"join_columns": "id"}),
+    "schema_diff": (examples.df1_schema_diff, examples.df2_schema_diff, {"legacy_key": "employee_id", "cloud_key": "id"}),
+    "dtype_diff": (examples.df1_dtype_diff, examples.df2_dtype_diff, {"legacy_key": "id", "cloud_key": "id"}),
+    "row_count": (examples.df2_row_count, examples.df1_row_count, {"legacy_key": "product_id", "cloud_key": "product_id"}),
+    "value_diff": (examples.df1_value_diff, examples.df2_value_diff, {"legacy_key": "order_id", "cloud_key": "order_id"}),
+    "nulls": (examples.df1_nulls, examples.df2_nulls, {"legacy_key": "user_id", "cloud_key": "user_id"}),
+    "duplicates": (examples.df1_duplicates, examples.df2_duplicates, {"legacy_key": "transaction_id", "cloud_key": "transaction_id"}),
+    "extra_cols": (examples.df1_extra_cols, examples.df2_extra_cols, {"legacy_key": "student_id", "cloud_key": "student_id"}),
+    "order": (examples.df1_order, examples.df2_order, {"legacy_key": "region", "cloud_key": "region"}),
+    "complex": (examples.df1_complex, examples.df2_complex, {"legacy_key": "account_id", "cloud_key": "account_num"}),
+}
+
+# keys with nulls, which are matched to nulls and ordered last (by every column of composite keys)
+scenarios["null_keys"] = (
+    pd.DataFrame({"id": [3.0, np.nan, 1.0, 2.0, 4.0], "amount": [30.0, 10.0, 11.0, 20.0, 40.0]}),
+    pd.DataFrame({"id": [2.0, 1.0, np.nan, 5.0, 4.0], "amount": [20.0, 11.0, 15.0, 50.0, 41.0]}),
+    {"legacy_key": "id", "cloud_key": "id"},
+)
+scenarios["composite_null_keys"] = (
+    pd.DataFrame({"region": ["east", "east", None, "west", None, "north"], "code": [1.0, np.nan, 2.0, 1.0, np.nan, 3.0], "amount": [10.0, 20.0, 30.0, 40.0, 50.0, 60.0]}),
+    pd.DataFrame({"area": ["west", None, "east", None, "east", "south"], "code": [1.0, np.nan, np.nan, 2.0, 1.0, 4.0], "amount": [40.0, 55.0, 20.0, 30.0, 11.0, 70.0]}),
+    {"legacy_key": ["region", "code"], "cloud_key": ["area", "code"]},
+)
+
+
+def differences(expected, actual, path: str) -> List[str]:
+    """Returns paths of values of nested dictionaries and lists that differ, with both values"""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        found = []
+        for key in list(expected) + [key for key in actual if key not in expected]:
+            if key not in actual or key not in expected:
+                found.append(f"{path}.{key}: pandas {expected.get(key, '<missing>')!r}, spark {actual.get(key, '<missing>')!r}")
+            else:
+                found.extend(differences(expected[key], actual[key], f"{path}.{key}"))
+        return found
+    if expected != actual or type(expected) is not type(actual):
+        return [f"{path}: pandas {expected!r}, spark {actual!r}"]
+    return []
+
+
+def check_scenario(spark, name: str, options: Optional[dict] = None) -> List[str]:
+    """
+    Compares the scenario with pandas and Spark engines, returns differences of their summaries and reports.
+
+    Reports are printed with all rows and columns of the samples, so differences in columns hidden by pandas display are found too.
+    """
+    legacy_df, cloud_df, keys = scenarios[name]
+    expected = CompareTwoDatasets(legacy_df, cloud_df, **keys, **(options or {}))
+    expected.compare()
+    actual = CompareTwoDatasets(spark.createDataFrame(legacy_df), spark.createDataFrame(cloud_df), **keys, **(options or {}))
+    actual.compare()
+    found = differences(expected.summary(), actual.summary(), "summary")
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", None):
+        expected_report, actual_report = expected.report(), actual.report()
+    if expected_report != actual_report:
+        found.append("report:\n" + "\n".join(difflib.unified_diff(expected_report.splitlines(), actual_report.splitlines(), "pandas", "spark", lineterm="")))
+    return found
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Checks that Spark engine gives the same summary and report as pandas engine on the main.py scenarios and keys with nulls")
+    parser.add_argument("--master", default="local[*]", help="Spark master, local[*] by default")
+    parser.add_argument("--scenarios", help="comma separated scenarios, all by default")
+    parser.add_argument("--options", help="JSON object of other parameters of CompareTwoDatasets, e.g. {\"duplicate_keys\": \"occurrence\"}")
+    parser.add_argument("--verbose", action="store_true")
+    options = parser.parse_args(arguments)
+    logging.basicConfig(level=logging.INFO if options.verbose else logging.WARNING, format='%(asctime)s-%(levelname)s-%(message)s')
+
+    names = options.scenarios.split(",") if options.scenarios else list(scenarios)
+    for name in names:
+        if name not in scenarios:
+            raise ValueError(f"Unknown scenario {name}, use one of {', '.join(scenarios)}")
+    if pyspark_error is not None:
+        logger.error(f"pyspark is required for the parity check: {pyspark_error}")
+        raise pyspark_error
+    from pyspark.sql import SparkSession
+
+    spark = SparkSession.builder.master(options.master).appName("SparkParity").config("spark.ui.enabled", "false").getOrCreate()
+    results: Dict[str, List[str]] = {}
+    try:
+        for name in names:
+            results[name] = check_scenario(spark, name, json.loads(options.options) if options.options else None)
+            print(f"{name}: {'same' if not results[name] else 'different'}")
+            for difference in results[name]:
+                print("  " + difference.replace("\n", "\n  "))
+    finally:
+        spark.stop()
+    failed = [name for name, found in results.items() if found]
+    print(f"{len(names) - len(failed)} of {len(names)} scenarios give the same summary and report")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
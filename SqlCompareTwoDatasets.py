@@ -0,0 +1,326 @@
+import hashlib
+import logging
+import queue
+import sqlite3
+import threading
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple, Union
+
+from CompareTwoDatasets import CompareTwoDatasets
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_bucket(value, buckets: int) -> int:
+    """Stable bucket of the key, registered as compare_bucket function on SQLite connections"""
+    return int.from_bytes(hashlib.blake2b(repr(value).encode(), digest_size=8).digest(), "little") % buckets
+
+
+def sqlite_hash(seed: int, *values) -> int:
+    """Stable 31-bit hash of the row, registered as compare_hash function on SQLite connections"""
+    return int.from_bytes(hashlib.blake2b(repr(values).encode(), digest_size=4, salt=str(seed).encode()).digest(), "little") >> 1
+
+
+class ConnectionPool:
+    """
+    Pool of DB-API connections shared by queries of one table.
+
+    Parameters:
+    connect: callable
+        Function opening new DB-API connection, or SQLAlchemy engine (its raw connections are pooled by the engine)
+    size: int
+        Maximum number of connections used at once.
+    """
+
+    def __init__(self, connect: Callable, size: int = 4):
+        self.connect = connect.raw_connection if hasattr(connect, "raw_connection") else connect
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def open(self):
+        connection = self.connect()
+        driver_connection = getattr(connection, "driver_connection", connection)
+        if isinstance(driver_connection, sqlite3.Connection):
+            driver_connection.create_function("compare_bucket", 2, sqlite_bucket, deterministic=True)
+            driver_connection.create_function("compare_hash", -1, sqlite_hash, deterministic=True)
+        return connection
+
+    @contextmanager
+    def connection(self):
+        with self.slots:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                connection = self.open()
+            try:
+                yield connection
+            finally:
+                self.idle.put(connection)
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+
+class SqlTable:
+    """
+    Table in a database used as a source of CompareTwoDatasets with comparisons pushed down to the database.
+
+    Parameters:
+    connect: callable
+        Function opening new DB-API connection (e.g. lambda: sqlite3.connect(path, check_same_thread=False)) or SQLAlchemy engine
+    table: str
+        Name of the table
+    bucket_expression: str
+        SQL expression assigning the key (first column of composite key) to a bucket, with {key} and {buckets} placeholders.
+    hash_expression: str
+        SQL expression computing non-negative 31-bit hash of the row, with {seed} and {columns} placeholders.
+    type_expression: str (optional)
+        SQL expression returning name of the storage type of a value, with {column} placeholder (SQLite typeof by default).
+        Columns mixing integer and real values are read as floats, mixing other types as objects. None for databases with strict column types.
+    schema_rows: int
+        Number of rows read to infer datatypes of the columns, together with aggregates of the whole table.
+    pool_size: int
+        Maximum number of connections used at once.
+
+    Default expressions use functions registered on SQLite connections, other databases need their own hash functions.
+    Buckets and hashes have to be computed the same way for both compared tables.
+    """
+
+    def __init__(self, connect: Callable, table: str, bucket_expression: str = "compare_bucket({key}, {buckets})", hash_expression: str = "compare_hash({seed}, {columns})", type_expression: Optional[str] = "typeof({column})", schema_rows: int = 1000, pool_size: int = 4):
+        self.pool = ConnectionPool(connect, pool_size)
+        self.table = table
+        self.bucket_expression = bucket_expression
+        self.hash_expression = hash_expression
+        self.type_expression = type_expression
+        self.schema_rows = schema_rows
+
+    @staticmethod
+    def quote(name: str) -> str:
+        return '"' + name.replace('"', '""') + '"'
+
+    def query(self, sql: str, rows: Optional[int] = None) -> pd.DataFrame:
+        """Runs the query on a pooled connection and returns result as dataframe"""
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(sql)
+                records = cursor.fetchall() if rows is None else cursor.fetchmany(rows)
+                columns = [description[0] for description in cursor.description]
+            finally:
+                cursor.close()
+        return pd.DataFrame.from_records(records, columns=columns)
+
+    def describe(self) -> Tuple[pd.DataFrame, int, pd.DataFrame]:
+        """
+        Returns empty dataframe with datatypes of the whole table, row count and aggregates of the columns.
+
+        Datatypes are inferred from the first schema_rows rows together with minimum and maximum of every column
+        and a null value of columns with nulls anywhere in the table, so they are the same as of the whole table read into a dataframe
+        (e.g. integer column with nulls is float). Columns with values of more storage types are cast by the types.
+        """
+        sample = self.query(f"SELECT * FROM {self.quote(self.table)} LIMIT {int(self.schema_rows)}")
+        rows, aggregates = self.aggregates(list(sample.columns))
+        extremes = pd.DataFrame({
+            column: [row["min"], row["max"], None if row["count"] < rows else row["min"]] for column, row in aggregates.iterrows()
+        }, columns=sample.columns, dtype=object)
+        schema = pd.concat([sample.astype(object), extremes], ignore_index=True).infer_objects().iloc[:0]
+        for column, row in aggregates.iterrows():
+            if row["min_type"] != row["max_type"]:
+                schema[column] = schema[column].astype("float64" if {row["min_type"], row["max_type"]} <= {"integer", "real"} else object)
+        return schema, rows, aggregates
+
+    def aggregates(self, columns: List[str]) -> Tuple[int, pd.DataFrame]:
+        """Returns row count and count of non-null values, minimum, maximum and first and last storage type name of every column"""
+        expressions = ["COUNT(*)"]
+        for column in columns:
+            expressions += [f"COUNT({self.quote(column)})", f"MIN({self.quote(column)})", f"MAX({self.quote(column)})"]
+            if self.type_expression is not None:
+                storage = f"CASE WHEN {self.quote(column)} IS NOT NULL THEN {self.type_expression.format(column=self.quote(column))} END"
+                expressions += [f"MIN({storage})", f"MAX({storage})"]
+        values = self.query(f"SELECT {', '.join(expressions)} FROM {self.quote(self.table)}").iloc[0].to_numpy()
+        names = ["count", "min", "max"] + (["min_type", "max_type"] if self.type_expression is not None else [])
+        aggregates = pd.DataFrame(values[1:].reshape(len(columns), len(names)), index=columns, columns=names)
+        if self.type_expression is None:
+            aggregates["min_type"] = aggregates["max_type"] = None
+        return int(values[0]), aggregates
+
+    def key_counts(self, key: Union[str, List[str]]) -> pd.Series:
+        """Returns number of rows of every key, indexed by values of the key columns (MultiIndex) for composite key"""
+        keys = [key] if isinstance(key, str) else key
+        names = ", ".join(self.quote(column) for column in keys)
+        counts = self.query(f"SELECT {names}, COUNT(*) FROM {self.quote(self.table)} GROUP BY {names}")
+        if len(keys) > 1:
+            return pd.Series(counts.iloc[:, -1].to_numpy(), index=pd.MultiIndex.from_frame(counts.iloc[:, :-1]))
+        return pd.Series(counts.iloc[:, 1].to_numpy(), index=counts.iloc[:, 0].to_numpy())
+
+    def bucket(self, key: Union[str, List[str]], buckets: int) -> str:
+        return self.bucket_expression.format(key=self.quote(key if isinstance(key, str) else key[0]), buckets=buckets)
+
+    def bucket_checksums(self, key: Union[str, List[str]], columns: List[str], buckets: int) -> pd.DataFrame:
+        """
+        Returns checksums of every bucket of keys.
+
+        Checksum consists of row count, count of distinct keys, two sums of independent row hashes
+        and count of rows with null values in compared columns. Distinct composite keys are counted by their hashes,
+        collisions can only lower the count, so duplicated keys are never missed.
+        """
+        keys = [key] if isinstance(key, str) else key
+        hashed = ", ".join(self.quote(column) for column in keys + columns)
+        nulls = " OR ".join(f"{self.quote(column)} IS NULL" for column in columns) or "0 = 1"
+        if len(keys) > 1:
+            distinct = self.hash_expression.format(seed=0, columns=", ".join(self.quote(column) for column in keys))
+        else:
+            distinct = self.quote(key if isinstance(key, str) else key[0])
+        return self.query(
+            f"SELECT {self.bucket(key, buckets)} AS bucket, COUNT(*) AS row_count, COUNT(DISTINCT {distinct}) AS key_count, "
+            f"SUM({self.hash_expression.format(seed=1, columns=hashed)}) AS checksum_1, "
+            f"SUM({self.hash_expression.format(seed=2, columns=hashed)}) AS checksum_2, "
+            f"SUM(CASE WHEN {nulls} THEN 1 ELSE 0 END) AS null_rows "
+            f"FROM {self.quote(self.table)} GROUP BY 1"
+        ).set_index("bucket")
+
+    def fetch_buckets(self, key: Union[str, List[str]], buckets: int, selected: List[int], schema: pd.DataFrame, batch: int = 500) -> pd.DataFrame:
+        """Reads rows of selected buckets and casts them to datatypes of the schema"""
+        frames = [schema]
+        for start in range(0, len(selected), batch):
+            numbers = ", ".join(str(int(number)) for number in selected[start:start + batch])
+            frames.append(self.query(f"SELECT * FROM {self.quote(self.table)} WHERE {self.bucket(key, buckets)} IN ({numbers})"))
+        rows = pd.concat([frame for frame in frames if not frame.empty] or [schema], ignore_index=True)
+        for column, dtype in schema.dtypes.items():
+            try:
+                rows[column] = rows[column].astype(dtype)
+            except (TypeError, ValueError):
+                logger.warning(f"Column {column} of {self.table} cannot be cast to {dtype}")
+        return rows
+
+
+class SqlCompareTwoDatasets(CompareTwoDatasets):
+    """
+    Version of CompareTwoDatasets comparing tables in databases without reading whole tables.
+
+    Row counts, per-column aggregates and checksums of buckets of keys are computed by the databases,
+    queries for both tables run concurrently. Only rows of buckets with different checksums, duplicated keys
+    or null values are read and compared by value_mismatches, as well as keys with their row counts to
+    keep the positions of rows the same as in the merged tables.
+
+    Parameters:
+    legacy_table: SqlTable
+        Table from legacy system
+    cloud_table: SqlTable
+        Table from cloud system
+    legacy_key: str or list (optional)
+        Column or list of columns of composite key for joining tables on.
+    cloud_key: str or list (optional)
+        Column or list of columns of composite key for joining tables on, in the same order as legacy_key.
+    join_columns: list or str (optional)
+        Column for joining tables on, or list of legacy key and cloud key (each a column or list of columns).
+    buckets: int
+        Number of buckets of keys.
+    options:
+        Other parameters of CompareTwoDatasets, e.g. fingerprint or duplicate_keys.
+
+    Either (legacy_key, cloud_key) or join_columns parameters required.
+    Attributes legacy_df and cloud_df hold empty dataframes with schemas of the tables, legacy_aggregates and
+    cloud_aggregates hold aggregates of the columns the schemas are inferred from.
+    """
+
+    def __init__(self, legacy_table: SqlTable, cloud_table: SqlTable, legacy_key: Optional[Union[str, list]] = None, cloud_key: Optional[Union[str, list]] = None, join_columns: Optional[Union[list, str]] = None, buckets: int = 1024, **options):
+        super().__init__(None, None, legacy_key, cloud_key, join_columns, **options)
+        self.legacy_table = legacy_table
+        self.cloud_table = cloud_table
+        self.buckets = buckets
+
+    def both(self, function: Callable, legacy_arguments: tuple = (), cloud_arguments: tuple = ()):
+        """Runs function on legacy and cloud tables concurrently"""
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            legacy = executor.submit(function, self.legacy_table, *legacy_arguments)
+            cloud = executor.submit(function, self.cloud_table, *cloud_arguments)
+            return legacy.result(), cloud.result()
+
+    def compare(self):
+        """
+        Compares two tables.
+
+        Runs operations like:
+        -comparing schemas
+        -comparing row counts
+        -looking for value mismatches
+
+        between two tables.
+        """
+        with self.phase("compare"):
+            logger.info("Validating tables...")
+            with self.phase("validate"):
+                self.check_table(self.legacy_table)
+                self.check_table(self.cloud_table)
+                legacy, cloud = self.both(SqlTable.describe)
+                self.legacy_df, self.row_count_legacy, self.legacy_aggregates = legacy
+                self.cloud_df, self.row_count_cloud, self.cloud_aggregates = cloud
+
+            logger.info("Checking schemas...")
+            with self.phase("schema_difference"):
+                self.schema_difference()
+                self.record_counts(legacy_columns=len(self.legacy_df.columns), cloud_columns=len(self.cloud_df.columns))
+            logger.info("Checking row counts...")
+            with self.phase("row_count_difference"):
+                self.row_count_difference()
+                self.record_counts(legacy_rows=self.row_count_legacy, cloud_rows=self.row_count_cloud)
+            logger.info("Checking value mismatches...")
+            with self.phase("value_mismatches"):
+                self.value_mismatches()
+
+    def check_table(self, table: SqlTable):
+        """Checking datatype of a table"""
+        if not isinstance(table, SqlTable):
+            raise TypeError(f"{table} is not a valid SqlTable.")
+
+    def row_count_difference(self):
+        """Checking row counts computed by the databases"""
+        self.row_count_difference_legacy = self.row_count_legacy - self.row_count_cloud
+        self.row_count_difference_cloud = self.row_count_cloud - self.row_count_legacy
+
+    def value_mismatches(self):
+        """Checking mismatches in values of buckets with different checksums"""
+        self.matched_id_datatypes = self.matched_key_datatypes()
+        if not self.matched_id_datatypes:
+            logger.warning("Id columns are not the same datatypes!")
+            return
+
+        legacy_key, cloud_key = self.legacy_keys, self.cloud_keys
+        columns = self.compared_columns()
+        with self.phase("checksums"):
+            (legacy_counts, legacy_checksums), (cloud_counts, cloud_checksums) = self.both(
+                lambda table, key: (table.key_counts(key), table.bucket_checksums(key, columns, self.buckets)),
+                (legacy_key,),
+                (cloud_key,)
+            )
+            self.record_counts(buckets=self.buckets)
+        with self.phase("profile_keys"):
+            offsets = self.profile_keys(legacy_counts, cloud_counts)
+            self.record_counts(rows=self.estimated_merged_rows)
+        checksums = legacy_checksums.join(cloud_checksums, how="outer", lsuffix="_legacy", rsuffix="_cloud")
+        differs = checksums.isna().any(axis=1)
+        for name in ("row_count", "checksum_1", "checksum_2"):
+            differs = differs | (checksums[name + "_legacy"] != checksums[name + "_cloud"])
+        for side in ("_legacy", "_cloud"):
+            differs = differs | (checksums["row_count" + side] != checksums["key_count" + side]) | (checksums["null_rows" + side] > 0)
+        self.differing_buckets = sorted(checksums.index[differs.to_numpy()])
+        logger.info(f"Reading {len(self.differing_buckets)} of {len(checksums)} buckets with different checksums...")
+
+        with self.phase("fetch"):
+            legacy_rows, cloud_rows = self.both(
+                lambda table, key, schema: table.fetch_buckets(key, self.buckets, self.differing_buckets, schema),
+                (legacy_key, self.legacy_df),
+                (cloud_key, self.cloud_df)
+            )
+            self.record_counts(legacy_rows=len(legacy_rows), cloud_rows=len(cloud_rows), buckets=len(self.differing_buckets))
+        with self.phase("compare_rows"):
+            compare = CompareTwoDatasets(legacy_rows, cloud_rows, profiler=self.profiler, **self.partition_options())
+            compare.schema_difference()
+            compare.value_mismatches()
+        with self.phase("combine"):
+            self._combine_partial_results([compare._partial_results(offsets)])
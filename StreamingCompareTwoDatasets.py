@@ -0,0 +1,218 @@
+import logging
+import math
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+from pandas.core.dtypes.cast import find_common_type
+from typing import Iterable, Iterator, List, Optional, Union
+
+from ArrowFile import ArrowFile
+from CompareTwoDatasets import CompareTwoDatasets
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingCompareTwoDatasets(CompareTwoDatasets):
+    """
+    Out-of-core version of CompareTwoDatasets for datasets bigger than available memory.
+
+    Both sources are read chunk by chunk and range-partitioned on the join key (first column of composite key) into temporary files,
+    so that rows with the same key always land in the same partition. Partitions are then compared
+    one by one in memory and their results are combined into the attributes of CompareTwoDatasets,
+    which gives the same report() as comparing the whole dataframes at once.
+
+    Parameters:
+    legacy_source: str or iterable of pd.DataFrame
+        Path to CSV, Parquet or Arrow IPC (.arrow, .feather, .ipc) file, or iterable of dataframe chunks (e.g. pd.read_csv(path, chunksize=...)) from legacy system
+    cloud_source: str or iterable of pd.DataFrame
+        Path to CSV, Parquet or Arrow IPC file, or iterable of dataframe chunks from cloud system
+    legacy_key: str or list (optional)
+        Column or list of columns of composite key for joining dataframes on.
+    cloud_key: str or list (optional)
+        Column or list of columns of composite key for joining dataframes on, in the same order as legacy_key.
+    join_columns: list or str (optional)
+        Column for joining dataframes on, or list of legacy key and cloud key (each a column or list of columns).
+    chunksize: int
+        Number of rows read at once from CSV, Parquet or Arrow IPC file.
+    partition_rows: int
+        Approximate number of rows from both sources loaded into memory at once.
+    spill_dir: str (optional)
+        Directory for temporary partition files, system temporary directory by default.
+    options:
+        Other parameters of CompareTwoDatasets, e.g. fingerprint or duplicate_keys.
+
+    Either (legacy_key, cloud_key) or join_columns parameters required.
+    Attributes legacy_df and cloud_df hold only empty dataframes with schemas promoted over all chunks,
+    duplicates holds only duplicated rows and merged dataframes are not kept. Limit max_merged_rows applies to every partition.
+    """
+
+    key_sample_size = 10000
+    ipc_extensions = (".arrow", ".feather", ".ipc")
+
+    def __init__(self, legacy_source: Union[str, Iterable[pd.DataFrame]], cloud_source: Union[str, Iterable[pd.DataFrame]], legacy_key: Optional[Union[str, list]] = None, cloud_key: Optional[Union[str, list]] = None, join_columns: Optional[Union[list, str]] = None, chunksize: int = 100000, partition_rows: int = 1000000, spill_dir: Optional[str] = None, **options):
+        super().__init__(None, None, legacy_key, cloud_key, join_columns, **options)
+        self.legacy_source = legacy_source
+        self.cloud_source = cloud_source
+        self.chunksize = chunksize
+        self.partition_rows = partition_rows
+        self.spill_dir = spill_dir
+
+    def compare(self):
+        """
+        Compares two datasets partition by partition.
+
+        Runs operations like:
+        -splitting sources into key range partitions
+        -comparing schemas
+        -comparing row counts
+        -looking for value mismatches
+
+        between two datasets.
+        """
+        # composite keys are range-partitioned on their first column, which keeps all rows of a key in one partition
+        legacy_key, cloud_key = self.legacy_keys[0], self.cloud_keys[0]
+        with self.phase("compare"), tempfile.TemporaryDirectory(dir=self.spill_dir) as directory:
+            self.directory = directory
+            logger.info("Spilling sources...")
+            with self.phase("spill"):
+                self.legacy_df, self.row_count_legacy, legacy_runs, legacy_sample = self.spill_runs(self.legacy_source, legacy_key, "legacy")
+                self.cloud_df, self.row_count_cloud, cloud_runs, cloud_sample = self.spill_runs(self.cloud_source, cloud_key, "cloud")
+                self.record_counts(legacy_rows=self.row_count_legacy, cloud_rows=self.row_count_cloud)
+
+            logger.info("Checking schemas...")
+            with self.phase("schema_difference"):
+                self.schema_difference()
+                self.record_counts(legacy_columns=len(self.legacy_df.columns), cloud_columns=len(self.cloud_df.columns))
+            logger.info("Checking row counts...")
+            with self.phase("row_count_difference"):
+                self.row_count_difference()
+            logger.info("Checking value mismatches...")
+            self.partition_files = {}
+            self.matched_id_datatypes = self.matched_key_datatypes()
+            if self.matched_id_datatypes:
+                logger.info("Partitioning sources...")
+                with self.phase("partition"):
+                    self.boundaries = self.partition_boundaries(pd.concat([legacy_sample, cloud_sample]))
+                    self.partition_runs(legacy_runs, legacy_key, "legacy")
+                    self.partition_runs(cloud_runs, cloud_key, "cloud")
+                    self.record_counts(partitions=len(self.boundaries) + 1)
+                with self.phase("value_mismatches"):
+                    self.value_mismatches()
+            else:
+                logger.warning("Id columns are not the same datatypes!")
+
+    def row_count_difference(self):
+        """Checking row count difference between two datasets, row counts are gathered while spilling sources"""
+        self.row_count_difference_legacy = self.row_count_legacy - self.row_count_cloud
+        self.row_count_difference_cloud = self.row_count_cloud - self.row_count_legacy
+
+    def value_mismatches(self):
+        """Checking mismatches in values partition by partition, partitions are processed in order of their key ranges"""
+        partials = []
+        offset = 0
+        for partition in range(len(self.boundaries) + 1):
+            legacy_partition = self.load_partition("legacy", partition, self.legacy_df)
+            cloud_partition = self.load_partition("cloud", partition, self.cloud_df)
+            if legacy_partition.empty and cloud_partition.empty:
+                continue
+            logger.info(f"Comparing partition {partition + 1} of {len(self.boundaries) + 1}...")
+            with self.phase("compare_partition"):
+                compare = CompareTwoDatasets(legacy_partition, cloud_partition, **self.partition_options())
+                compare.schema_difference()
+                compare.value_mismatches()
+                partial = compare._partial_results(offset)
+                self.record_counts(legacy_rows=len(legacy_partition), cloud_rows=len(cloud_partition))
+            offset = offset + partial["merged_rows"]
+            partials.append(partial)
+        with self.phase("combine"):
+            self._combine_partial_results(partials)
+
+    def read_chunks(self, source: Union[str, Iterable[pd.DataFrame]]) -> Iterator[pd.DataFrame]:
+        """Reads source chunk by chunk"""
+        if isinstance(source, pd.DataFrame):
+            yield source
+        elif isinstance(source, str) and source.endswith((".parquet", ".pq")):
+            try:
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                logger.error(f"pyarrow is required for reading Parquet files: {e}")
+                raise
+            for batch in pq.ParquetFile(source).iter_batches(batch_size=self.chunksize):
+                yield batch.to_pandas()
+        elif isinstance(source, str) and source.endswith(self.ipc_extensions):
+            # record batches of Arrow IPC file (or stream) are read one by one and split into chunks of chunksize rows
+            reader = ArrowFile(source).open()
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches)) if hasattr(reader, "get_batch") else reader
+            for batch in batches:
+                for start in range(0, batch.num_rows, self.chunksize):
+                    yield batch.slice(start, self.chunksize).to_pandas()
+        elif isinstance(source, str):
+            yield from pd.read_csv(source, chunksize=self.chunksize)
+        else:
+            yield from source
+
+    def spill_runs(self, source: Union[str, Iterable[pd.DataFrame]], key: str, name: str):
+        """
+        Writes chunks of the source into temporary files.
+
+        Returns empty dataframe with schema of the source, row count, paths of written files
+        and uniform sample of the keys (keys with the smallest random weights).
+        Datatypes of the schema are promoted over all chunks, e.g. integer column with null values only
+        in later chunks becomes float, as when the whole source is read at once.
+        """
+        rng = np.random.default_rng(0)
+        schema = None
+        dtypes = {}
+        row_count = 0
+        runs = []
+        sample = None
+        for number, chunk in enumerate(self.read_chunks(source)):
+            if schema is None:
+                schema = chunk.iloc[:0]
+                dtypes = chunk.dtypes.to_dict()
+            for column, dtype in chunk.dtypes.items():
+                if dtypes[column] != dtype:
+                    dtypes[column] = find_common_type([dtypes[column], dtype])
+            path = os.path.join(self.directory, f"{name}_run_{number}.pkl")
+            chunk.to_pickle(path)
+            runs.append(path)
+            row_count = row_count + len(chunk)
+            weights = pd.Series(rng.random(len(chunk)), index=chunk[key].to_numpy())
+            sample = weights.nsmallest(self.key_sample_size) if sample is None else pd.concat([sample, weights]).nsmallest(self.key_sample_size)
+        if schema is None:
+            raise ValueError(f"{source} does not contain any data.")
+        return schema.astype(dtypes), row_count, runs, sample.index.to_series()
+
+    def partition_boundaries(self, sample: pd.Series) -> np.ndarray:
+        """Computes key ranges of partitions from the sample of keys, so that partitions hold about partition_rows rows"""
+        partitions = max(1, math.ceil((self.row_count_legacy + self.row_count_cloud) / self.partition_rows))
+        keys = np.sort(sample.dropna().to_numpy())
+        if partitions == 1 or len(keys) == 0:
+            return keys[:0]
+        quantiles = keys[np.linspace(0, len(keys) - 1, partitions + 1)[1:-1].astype(int)]
+        return pd.unique(quantiles)
+
+    def partition_runs(self, runs: List[str], key: str, name: str):
+        """Splits written chunks into partitions by key ranges, keeping the original order of rows within partition"""
+        for number, run in enumerate(runs):
+            chunk = pd.read_pickle(run)
+            # null keys sort last in the merge, so they go to the last partition
+            keys = chunk[key]
+            nulls = keys.isna().to_numpy()
+            partitions = np.full(len(chunk), len(self.boundaries))
+            partitions[~nulls] = np.searchsorted(self.boundaries, keys.to_numpy()[~nulls], side="right")
+            for partition, rows in chunk.groupby(partitions, sort=False):
+                path = os.path.join(self.directory, f"{name}_partition_{partition}_{number}.pkl")
+                rows.to_pickle(path)
+                self.partition_files.setdefault((name, partition), []).append(path)
+            os.remove(run)
+
+    def load_partition(self, name: str, partition: int, schema: pd.DataFrame) -> pd.DataFrame:
+        """Loads all chunks of the partition from temporary files, with datatypes of the schema promoted over all chunks"""
+        paths = self.partition_files.get((name, partition), [])
+        if not paths:
+            return schema
+        partition = pd.concat([pd.read_pickle(path) for path in paths])
+        return partition.astype({column: dtype for column, dtype in schema.dtypes.items() if partition[column].dtype != dtype})
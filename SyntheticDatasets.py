@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+from typing import Optional, Sequence, Tuple
+
+
+class SyntheticDatasets:
+    """
+    Generator of the main.py scenarios at configurable scale, used for benchmarking.
+
+    Every scenario returns a pair of dataframes with the same kind of difference as the five-row example in main.py
+    and parameters for joining them. Data is random but reproducible for the same seed.
+
+    Parameters:
+    rows: int
+        Number of rows in the legacy dataframe.
+    columns: int
+        Number of columns besides the key.
+    mismatch_rate: float
+        Fraction of rows with changed values, missing rows or null values, depending on the scenario.
+    duplicate_rate: float
+        Fraction of rows repeated in the cloud dataframe in duplicates and complex scenarios.
+    dtypes: list
+        Datatypes of the columns repeated over columns, any of "int", "float", "string", "datetime", "bool".
+    seed: int
+        Seed of the random generator.
+    """
+
+    scenarios = ("identical", "schema_diff", "dtype_diff", "row_count", "value_diff", "nulls", "duplicates", "extra_columns", "order", "complex", "composite_key")
+    supported_dtypes = ("int", "float", "string", "datetime", "bool")
+
+    def __init__(self, rows: int = 100000, columns: int = 8, mismatch_rate: float = 0.01, duplicate_rate: float = 0.001, dtypes: Sequence[str] = supported_dtypes, seed: int = 0):
+        if not dtypes or any(dtype not in self.supported_dtypes for dtype in dtypes):
+            raise ValueError(f"dtypes must be a non-empty list of {self.supported_dtypes}")
+        self.rows = rows
+        self.columns = columns
+        self.mismatch_rate = mismatch_rate
+        self.duplicate_rate = duplicate_rate
+        self.dtypes = list(dtypes)
+        self.seed = seed
+
+    def rng(self, scenario: str) -> np.random.Generator:
+        """Random generator of the scenario, independent from other scenarios"""
+        return np.random.default_rng([self.seed, self.scenarios.index(scenario)])
+
+    def column_dtypes(self) -> dict:
+        return {f"col_{number}": self.dtypes[number % len(self.dtypes)] for number in range(self.columns)}
+
+    def base(self, rng: np.random.Generator) -> pd.DataFrame:
+        """Legacy dataframe with unique int64 key column id and columns of the dtype mix"""
+        data = {"id": np.arange(1, self.rows + 1, dtype=np.int64)}
+        for column, dtype in self.column_dtypes().items():
+            data[column] = self.random_values(rng, dtype, self.rows)
+        return pd.DataFrame(data)
+
+    @staticmethod
+    def random_values(rng: np.random.Generator, dtype: str, size: int):
+        if dtype == "int":
+            return rng.integers(0, 1000000, size)
+        if dtype == "float":
+            return rng.random(size).round(4) * 10000
+        if dtype == "string":
+            return pd.Series(rng.integers(0, 100000, size)).map("value_{}".format).to_numpy(dtype=object)
+        if dtype == "datetime":
+            return pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 1500, size), unit="D")
+        return rng.random(size) < 0.5
+
+    @staticmethod
+    def changed_values(values: pd.Series) -> pd.Series:
+        """Returns different value of the same datatype for every value"""
+        if pd.api.types.is_bool_dtype(values):
+            return ~values
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return values + pd.Timedelta(days=1)
+        if pd.api.types.is_numeric_dtype(values):
+            return values + 1
+        return values.astype(str) + "_changed"
+
+    def sample_positions(self, rng: np.random.Generator, rate: float, size: Optional[int] = None) -> np.ndarray:
+        """Sorted random positions of at least one row"""
+        size = self.rows if size is None else size
+        count = min(size, max(1, int(round(size * rate))))
+        return np.sort(rng.choice(size, count, replace=False))
+
+    def change_values(self, rng: np.random.Generator, dataframe: pd.DataFrame, columns: Sequence[str]) -> pd.DataFrame:
+        """Changes value in one random column of mismatch_rate of rows"""
+        if not columns:
+            return dataframe
+        positions = self.sample_positions(rng, self.mismatch_rate, len(dataframe))
+        targets = rng.integers(0, len(columns), len(positions))
+        for number, column in enumerate(columns):
+            rows = dataframe.index[positions[targets == number]]
+            dataframe.loc[rows, column] = self.changed_values(dataframe.loc[rows, column])
+        return dataframe
+
+    def scenario(self, name: str) -> Tuple[pd.DataFrame, pd.DataFrame, dict]:
+        """Returns legacy dataframe, cloud dataframe and join parameters (legacy_key and cloud_key) of the scenario"""
+        if name not in self.scenarios:
+            raise ValueError(f"Unknown scenario {name}, use one of {self.scenarios}")
+        rng = self.rng(name)
+        legacy_df = self.base(rng)
+        cloud_df = legacy_df.copy()
+        columns = list(self.column_dtypes())
+        keys = {"legacy_key": "id", "cloud_key": "id"}
+
+        if name == "schema_diff":
+            cloud_df.columns = ["key"] + [column + "_renamed" for column in columns]
+            keys["cloud_key"] = "key"
+        elif name == "dtype_diff":
+            for column, dtype in self.column_dtypes().items():
+                if dtype == "float":
+                    cloud_df[column] = cloud_df[column].round().astype(np.int64)
+                elif dtype == "bool":
+                    cloud_df[column] = np.where(cloud_df[column], "Y", "N")
+                else:
+                    cloud_df[column] = cloud_df[column].astype(str)
+        elif name == "row_count":
+            cloud_df = cloud_df.drop(index=cloud_df.index[self.sample_positions(rng, self.mismatch_rate)]).reset_index(drop=True)
+        elif name == "value_diff":
+            cloud_df = self.change_values(rng, cloud_df, columns)
+        elif name == "nulls":
+            positions = self.sample_positions(rng, self.mismatch_rate)
+            for column in columns:
+                nulls = np.zeros(self.rows, dtype=bool)
+                nulls[positions[rng.random(len(positions)) < 0.5]] = True
+                legacy_df[column] = legacy_df[column].mask(nulls)
+        elif name == "duplicates":
+            cloud_df = pd.concat([cloud_df, cloud_df.iloc[self.sample_positions(rng, self.duplicate_rate)]], ignore_index=True)
+        elif name == "extra_columns":
+            cloud_df["attendance"] = rng.integers(0, 100, self.rows)
+            cloud_df["final_score"] = rng.random(self.rows).round(1) * 100
+        elif name == "order":
+            cloud_df = cloud_df.iloc[rng.permutation(self.rows)].reset_index(drop=True)
+        elif name == "composite_key":
+            # (account, date, currency) key of string, datetime and string columns instead of id, rows shuffled in cloud
+            ids = legacy_df.pop("id").to_numpy()
+            legacy_df.insert(0, "account", pd.Series(ids // 8).map("ACC{:08d}".format).to_numpy(dtype=object))
+            legacy_df.insert(1, "date", pd.Timestamp("2024-01-01") + pd.to_timedelta(ids % 8 // 4, unit="D"))
+            legacy_df.insert(2, "currency", np.array(["USD", "EUR", "GBP", "CHF"], dtype=object)[ids % 4])
+            cloud_df = legacy_df.drop(index=legacy_df.index[self.sample_positions(rng, self.mismatch_rate)])
+            cloud_df = self.change_values(rng, cloud_df.iloc[rng.permutation(len(cloud_df))].reset_index(drop=True), columns)
+            keys = {"legacy_key": ["account", "date", "currency"], "cloud_key": ["account", "date", "currency"]}
+        elif name == "complex":
+            cloud_df = cloud_df.drop(index=cloud_df.index[self.sample_positions(rng, self.mismatch_rate)])
+            new_rows = cloud_df.iloc[self.sample_positions(rng, self.mismatch_rate, len(cloud_df))].copy()
+            new_rows["id"] = np.arange(self.rows + 1, self.rows + 1 + len(new_rows))
+            duplicated_rows = cloud_df.iloc[self.sample_positions(rng, self.duplicate_rate, len(cloud_df))]
+            cloud_df = pd.concat([cloud_df, new_rows, duplicated_rows], ignore_index=True)
+            cloud_df = self.change_values(rng, cloud_df, columns)
+            for column, dtype in self.column_dtypes().items():
+                if dtype == "datetime":
+                    cloud_df[column] = cloud_df[column].astype(str)
+            renamed = {"id": "account_num"}
+            if columns:
+                renamed[columns[-1]] = columns[-1] + "_renamed"
+            cloud_df = cloud_df.rename(columns=renamed)
+            cloud_df["credit_limit"] = rng.integers(0, 5000, len(cloud_df))
+            keys["cloud_key"] = "account_num"
+        return legacy_df, cloud_df, keys
@@ -1,6 +1,6 @@
 from CompareTwoDatasets import CompareTwoDatasets
+import logging
 import pandas as pd
-import numpy as np
 
 
 # Test Case 1: Identical DataFrames (Perfect Match)
@@ -151,18 +151,21 @@ df2_complex = pd.DataFrame({
     'credit_limit': [5000, 0, 1000, 0, 2500]  # Extra column
 })
 
-# compare = CompareTwoDatasets(df1_identical, df2_identical, legacy_key="id", cloud_key="id") # checked
-# compare = CompareTwoDatasets(df1_identical, df2_identical, join_columns="id") # checked
-# compare = CompareTwoDatasets(df1_schema_diff, df2_schema_diff, legacy_key="employee_id", cloud_key="id") # checked
-# compare = CompareTwoDatasets(df1_dtype_diff, df2_dtype_diff, legacy_key="id", cloud_key="id") # checked
-# compare = CompareTwoDatasets(df2_row_count, df1_row_count, legacy_key="product_id", cloud_key="product_id") # checked
-# compare = CompareTwoDatasets(df1_value_diff, df2_value_diff, legacy_key="order_id", cloud_key="order_id")  # checked
-# compare = CompareTwoDatasets(df1_nulls, df2_nulls, legacy_key="user_id", cloud_key="user_id") # add checking for None and NaN
-compare = CompareTwoDatasets(df1_duplicates, df2_duplicates, legacy_key="transaction_id", cloud_key="transaction_id") # checked
-# compare = CompareTwoDatasets(df1_extra_cols, df2_extra_cols, legacy_key="student_id", cloud_key="student_id") # checked
-# compare = CompareTwoDatasets(df1_order, df2_order, legacy_key="region", cloud_key="region") # checked
-# compare = CompareTwoDatasets(df1_complex, df2_complex, legacy_key="account_id", cloud_key="account_num") # checked
-compare.compare()
-
-print(compare.report())
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s-%(levelname)s-%(message)s')
+
+    # compare = CompareTwoDatasets(df1_identical, df2_identical, legacy_key="id", cloud_key="id") # checked
+    # compare = CompareTwoDatasets(df1_identical, df2_identical, join_columns="id") # checked
+    # compare = CompareTwoDatasets(df1_schema_diff, df2_schema_diff, legacy_key="employee_id", cloud_key="id") # checked
+    # compare = CompareTwoDatasets(df1_dtype_diff, df2_dtype_diff, legacy_key="id", cloud_key="id") # checked
+    # compare = CompareTwoDatasets(df2_row_count, df1_row_count, legacy_key="product_id", cloud_key="product_id") # checked
+    # compare = CompareTwoDatasets(df1_value_diff, df2_value_diff, legacy_key="order_id", cloud_key="order_id")  # checked
+    # compare = CompareTwoDatasets(df1_nulls, df2_nulls, legacy_key="user_id", cloud_key="user_id") # add checking for None and NaN
+    compare = CompareTwoDatasets(df1_duplicates, df2_duplicates, legacy_key="transaction_id", cloud_key="transaction_id") # checked
+    # compare = CompareTwoDatasets(df1_extra_cols, df2_extra_cols, legacy_key="student_id", cloud_key="student_id") # checked
+    # compare = CompareTwoDatasets(df1_order, df2_order, legacy_key="region", cloud_key="region") # checked
+    # compare = CompareTwoDatasets(df1_complex, df2_complex, legacy_key="account_id", cloud_key="account_num") # checked
+    compare.compare()
+
+    print(compare.report())
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modules of the tool live in the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
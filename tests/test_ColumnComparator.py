@@ -0,0 +1,24 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from ColumnComparator import ColumnComparator
+
+
+def test_kernels_are_cached_per_comparator():
+    legacy, cloud = pd.Series([1.0, 2.0, np.nan]), pd.Series([1.05, 2.5, np.nan])
+    loose, strict = ColumnComparator(atol=0.1), ColumnComparator()
+    assert loose.mismatches("amount", legacy, cloud, legacy.dtype, cloud.dtype).tolist() == [False, True, False]
+    assert strict.mismatches("amount", legacy, cloud, legacy.dtype, cloud.dtype).tolist() == [True, True, False]
+    assert len(loose.kernels) == 1 and len(strict.kernels) == 1
+    assert loose.kernels is not strict.kernels
+
+
+def test_used_comparator_is_pickled_without_kernels():
+    comparator = ColumnComparator(trim=True)
+    legacy, cloud = pd.Series(["a ", "b"]), pd.Series(["a", "c"])
+    comparator.mismatches("name", legacy, cloud, legacy.dtype, cloud.dtype)
+    copy = pickle.loads(pickle.dumps(comparator))
+    assert copy.kernels == {}
+    assert copy.mismatches("name", legacy, cloud, legacy.dtype, cloud.dtype).tolist() == [False, True]
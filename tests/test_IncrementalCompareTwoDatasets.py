@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from IncrementalCompareTwoDatasets import IncrementalCompareTwoDatasets
+
+
+def parquet_pair(directory):
+    rows = 2000
+    legacy = pd.DataFrame({"id": np.arange(rows), "amount": np.arange(rows) * 1.5, "name": [f"n{number % 7}" for number in range(rows)]})
+    cloud = legacy.rename(columns={"id": "number"})
+    cloud.loc[::50, "amount"] += 1
+    cloud = cloud.iloc[:-5]
+    legacy_path, cloud_path = str(directory / "legacy.parquet"), str(directory / "cloud.parquet")
+    # several row groups, so columns read by from_files are chunked arrays
+    legacy.to_parquet(legacy_path, row_group_size=300)
+    cloud.to_parquet(cloud_path, row_group_size=300)
+    return legacy_path, cloud_path
+
+
+def test_unchanged_parquet_files_reuse_all_blocks(tmp_path):
+    legacy_path, cloud_path = parquet_pair(tmp_path)
+    store = str(tmp_path / "digests.sqlite")
+
+    first = IncrementalCompareTwoDatasets.from_files(legacy_path, cloud_path, legacy_key="id", cloud_key="number", store=store, blocks=16)
+    first.compare()
+    assert len(first.changed_blocks) == 16
+
+    second = IncrementalCompareTwoDatasets.from_files(legacy_path, cloud_path, legacy_key="id", cloud_key="number", store=store, blocks=16)
+    second.compare()
+    assert second.changed_blocks == []
+    assert second.report() == first.report()
+    assert second.summary() == first.summary()
+    assert second.summary()["value_mismatches"]["mismatched_values"] == 40
@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from ReconciliationRunner import ReconciliationRunner, ResultStore
+
+
+def write_arrow(dataframe, path, batch_rows):
+    table = pa.Table.from_pandas(dataframe, preserve_index=False)
+    with pa.ipc.new_file(path, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=batch_rows):
+            writer.write_batch(batch)
+
+
+def test_streaming_pair_reads_arrow_files(tmp_path):
+    rows = 3000
+    legacy = pd.DataFrame({"id": np.arange(rows), "amount": np.arange(rows) * 1.5, "name": [f"n{number % 7}" for number in range(rows)]})
+    cloud = legacy.rename(columns={"id": "number"})
+    cloud.loc[::100, "amount"] += 1
+    cloud = cloud.iloc[:-10]
+    write_arrow(legacy, str(tmp_path / "legacy.arrow"), 700)
+    write_arrow(cloud, str(tmp_path / "cloud.arrow"), 700)
+    legacy.to_parquet(str(tmp_path / "legacy.parquet"), row_group_size=700)
+    cloud.to_parquet(str(tmp_path / "cloud.parquet"), row_group_size=700)
+    manifest = {
+        "defaults": {"legacy_key": "id", "cloud_key": "number"},
+        "pairs": [
+            {"name": "arrow", "legacy": "legacy.arrow", "cloud": "cloud.arrow", "mode": "streaming", "options": {"chunksize": 500, "partition_rows": 2000}},
+            {"name": "parquet", "legacy": "legacy.parquet", "cloud": "cloud.parquet", "mode": "streaming", "options": {"chunksize": 500, "partition_rows": 2000}},
+        ],
+    }
+    manifest_path = tmp_path / "manifest.json"
+    manifest_path.write_text(json.dumps(manifest))
+    store_path = str(tmp_path / "results.sqlite")
+
+    results = ReconciliationRunner(str(manifest_path), store=store_path, workers=1, executor="thread").run().set_index("name")
+    assert list(results["status"]) == ["done", "done"], results["error"].tolist()
+    assert results.loc["arrow", "legacy_rows"] == rows
+    assert results.loc["arrow", "cloud_rows"] == rows - 10
+    assert results.loc["arrow", "mismatched_values"] == 30
+
+    store = ResultStore(store_path)
+    try:
+        assert store.summary("arrow") == store.summary("parquet")
+        assert store.report("arrow") == store.report("parquet")
+    finally:
+        store.close()
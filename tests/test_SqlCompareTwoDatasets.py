@@ -0,0 +1,55 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from CompareTwoDatasets import CompareTwoDatasets
+from SqlCompareTwoDatasets import SqlCompareTwoDatasets, SqlTable
+
+
+def tables(directory):
+    rows = 600
+    legacy = pd.DataFrame({
+        "id": np.arange(rows),
+        "region": [["east", "west", "north"][number % 3] for number in range(rows)],
+        "amount": np.arange(rows) * 1.5,
+        "count": np.arange(rows),
+        "name": [f"n{number % 7}" for number in range(rows)],
+    })
+    cloud = legacy.copy()
+    cloud.loc[::40, "amount"] += 1
+    cloud["count"] = cloud["count"].astype(object)
+    # nulls and a value of another storage type after the rows read for datatypes
+    cloud.loc[450, "count"] = None
+    cloud.loc[500, "name"] = 7
+    cloud = cloud.drop(index=[5, 300])
+    legacy = legacy.drop(index=[100])
+    # null keys, one matched, one on each side only
+    legacy.loc[[10, 20, 30], "id"] = np.nan
+    legacy.loc[[10, 20], "region"] = None
+    cloud.loc[[10, 30, 550], "id"] = np.nan
+    cloud.loc[[10, 550], "region"] = None
+    path = str(directory / "tables.sqlite")
+    connection = sqlite3.connect(path)
+    legacy.to_sql("legacy", connection, index=False)
+    cloud.to_sql("cloud", connection, index=False)
+    connection.close()
+    return path
+
+
+@pytest.mark.parametrize("keys", [{"join_columns": "id"}, {"legacy_key": ["region", "id"], "cloud_key": ["region", "id"]}])
+def test_sql_report_equals_in_memory_report(tmp_path, keys):
+    path = tables(tmp_path)
+    connect = lambda: sqlite3.connect(path, check_same_thread=False)
+    compared = SqlCompareTwoDatasets(SqlTable(connect, "legacy", schema_rows=50), SqlTable(connect, "cloud", schema_rows=50), buckets=8, **keys)
+    compared.compare()
+
+    connection = connect()
+    try:
+        expected = CompareTwoDatasets(pd.read_sql("SELECT * FROM legacy", connection), pd.read_sql("SELECT * FROM cloud", connection), **keys)
+    finally:
+        connection.close()
+    expected.compare()
+    assert compared.summary() == expected.summary()
+    assert compared.report() == expected.report()